@@ -0,0 +1,95 @@
+"""
+Oscillate Media Player - Benchmark Fixtures
+This module writes synthetic MP3 files for the benchmarks: an ID3v2.4 tag,
+a LAME-style Info frame and a run of silent MPEG-1 Layer III frames. Nothing
+is encoded, so generating tens of thousands of files takes seconds.
+"""
+
+from typing import List
+import os
+import random
+import struct
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, mono, no CRC
+FRAME_HEADER = bytes((0xFF, 0xFB, 0x90, 0xC0))
+FRAME_SIZE = 417
+SAMPLES_PER_FRAME = 1152
+SAMPLE_RATE = 44100
+# Header plus mono side information
+_SIDE_INFO_END = 4 + 17
+
+FILES_PER_ALBUM = 12
+
+_WORDS = (
+    'love', 'night', 'song', 'blue', 'river', 'fire', 'heart', 'dance', 'city',
+    'light', 'dream', 'rain', 'summer', 'golden', 'road', 'ocean', 'echo',
+    'silver', 'wild', 'home', 'café', 'noël', 'señorita', 'über', 'naïve',
+)
+_ARTISTS = tuple(
+    f"{first} {last}" for first in ('The', 'DJ', 'Lady', 'Sir', 'Beyoncé', 'Mötley')
+    for last in ('Waves', 'Static', 'Echoes', 'Crüe', 'Lights', 'Oscillators', 'Pilots')
+)
+
+
+def _syncsafe(value: int) -> bytes:
+    return bytes(((value >> 21) & 0x7F, (value >> 14) & 0x7F, (value >> 7) & 0x7F, value & 0x7F))
+
+
+def _text_frame(frame_id: str, text: str) -> bytes:
+    # Encoding 3 is UTF-8
+    body = b'\x03' + text.encode('utf-8')
+    return frame_id.encode('ascii') + _syncsafe(len(body)) + b'\x00\x00' + body
+
+
+def id3v2_tag(title: str, artist: str, album: str, track: int) -> bytes:
+    frames = b''.join((
+        _text_frame('TIT2', title),
+        _text_frame('TPE1', artist),
+        _text_frame('TALB', album),
+        _text_frame('TRCK', str(track)),
+    ))
+    return b'ID3\x04\x00\x00' + _syncsafe(len(frames)) + frames
+
+
+def info_frame(frames: int) -> bytes:
+    """A silent first frame carrying an Info header with frame and byte counts."""
+    frame = bytearray(FRAME_SIZE)
+    frame[:4] = FRAME_HEADER
+    header = b'Info' + struct.pack('>III', 0x3, frames, (frames + 1) * FRAME_SIZE)
+    frame[_SIDE_INFO_END:_SIDE_INFO_END + len(header)] = header
+    return bytes(frame)
+
+
+def mp3_bytes(title: str, artist: str, album: str, track: int, frames: int) -> bytes:
+    silent = FRAME_HEADER + bytes(FRAME_SIZE - 4)
+    return id3v2_tag(title, artist, album, track) + info_frame(frames) + silent * frames
+
+
+def duration_of(frames: int) -> float:
+    return frames * SAMPLES_PER_FRAME / SAMPLE_RATE
+
+
+def generate_library(root: str, count: int, frames: int = 8, seed: int = 0) -> List[str]:
+    """Return ``count`` fixture paths under root, writing any that are missing.
+
+    File names and tags depend only on the index and seed, so the first 1000
+    files of a 100k library are the same as a 1k library and earlier runs can
+    be reused.
+    """
+    paths = []
+    for index in range(count):
+        album_index, track = divmod(index, FILES_PER_ALBUM)
+        directory = os.path.join(root, f"{album_index // 100:04d}", f"album-{album_index:05d}")
+        path = os.path.join(directory, f"{track + 1:02d}.mp3")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+
+        rng = random.Random(seed * 1_000_003 + index)
+        title = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(1, 4))).title()
+        artist = _ARTISTS[album_index % len(_ARTISTS)]
+        album = f"{random.Random(seed + album_index).choice(_WORDS).title()} {album_index}"
+        os.makedirs(directory, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(mp3_bytes(title, artist, album, track + 1, frames))
+    return paths
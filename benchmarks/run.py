@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Oscillate Media Player - Benchmarks
+This script measures import and startup time (of the window and of the
+headless mode), adding songs, reading MP3 tags against mutagen,
+per-keystroke search latency, skip-to-PLAYING latency and memory per
+track, and prints the results as JSON. It needs PyGObject and GStreamer
+but no display or sound card: audio goes to fakesink, and startup is
+skipped when there is no display.
+
+    python3 benchmarks/run.py --sizes 1000 10000 100000 --output results.json
+"""
+
+from typing import Any, Dict, List, Optional
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+SOURCE_DIR = os.path.join(REPO_DIR, 'src')
+SCHEMA_DIR = os.path.join(REPO_DIR, 'data', 'glib-2.0', 'schemas')
+
+sys.path.insert(0, SOURCE_DIR)
+
+import fixtures  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+IMPORT_MODULES = ['oscillate.trackstore', 'oscillate.metadata_cache', 'oscillate.player',
+                  'oscillate.headless', 'oscillate.application']
+SEARCH_QUERIES = ['love', 'golden river', 'beyonce', 'cafe noel', 'zzz']
+SKIP_ROUNDS = 20
+
+_STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import sys
+from gi.repository import GLib
+import oscillate.application
+app = oscillate.application.OscillateApplication()
+
+def on_activate(app):
+    window = app.props.active_window
+    clock = window.get_frame_clock()
+    def on_after_paint(clock):
+        print(time.perf_counter() - started)
+        app.quit()
+    clock.connect('after-paint', on_after_paint)
+
+app.connect_after('activate', on_activate)
+sys.exit(app.run([]))
+"""
+
+_HEADLESS_SCRIPT = """
+import time
+started = time.perf_counter()
+import json
+import os
+import sys
+from oscillate.headless import HeadlessPlayer
+from oscillate.player import PlayerObserver
+
+class FirstTrack(PlayerObserver):
+    def on_stream_started(self):
+        with open('/proc/self/statm') as f:
+            resident = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        print(json.dumps({
+            'seconds': time.perf_counter() - started,
+            'rss_bytes': resident,
+            'gtk_loaded': 'gi.repository.Gtk' in sys.modules,
+        }))
+        headless.player.stop()
+        headless.loop.quit()
+
+headless = HeadlessPlayer(sys.argv[1:], audio_sink='fakesink sync=true')
+headless.player.add_observer(FirstTrack())
+sys.exit(headless.run())
+"""
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summary statistics of a list of seconds, in milliseconds."""
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'median_ms': statistics.median(ordered) * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def child_environment(cache_dir: str) -> Dict[str, str]:
+    """Environment for child processes: repo sources, no user state touched."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (SOURCE_DIR, env.get('PYTHONPATH'))))
+    env['GSETTINGS_SCHEMA_DIR'] = SCHEMA_DIR
+    env['GSETTINGS_BACKEND'] = 'memory'
+    env['XDG_CACHE_HOME'] = cache_dir
+    return env
+
+
+def run_child(args: List[str], env: Dict[str, str], timeout: float = 120) -> Dict[str, Any]:
+    """Run a child Python and return the float it prints, or the error."""
+    try:
+        completed = subprocess.run([sys.executable] + args, env=env, capture_output=True,
+                                   text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'error': f"timed out after {timeout} s"}
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f"exit status {completed.returncode}"}
+    return {'seconds': float(completed.stdout.strip().splitlines()[-1])}
+
+
+def bench_import(env: Dict[str, str], repeats: int = 5) -> Dict[str, Any]:
+    """Cold import time of each module, in a fresh interpreter each time."""
+    results = {}
+    for module in IMPORT_MODULES:
+        script = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        runs = [run_child(['-c', script], env) for _ in range(repeats)]
+        failed = [run for run in runs if 'error' in run]
+        if failed:
+            results[module] = failed[0]
+        else:
+            results[module] = percentiles([run['seconds'] for run in runs])
+    return results
+
+
+def bench_startup(env: Dict[str, str], repeats: int = 5) -> Dict[str, Any]:
+    """Process start to the first painted frame of the main window."""
+    if not (os.environ.get('WAYLAND_DISPLAY') or os.environ.get('DISPLAY')):
+        return {'skipped': 'no display'}
+    runs = [run_child(['-c', _STARTUP_SCRIPT], env) for _ in range(repeats)]
+    failed = [run for run in runs if 'error' in run]
+    if failed:
+        return failed[0]
+    return percentiles([run['seconds'] for run in runs])
+
+
+def load_songs(paths: List[str], cache):
+    """What OscillateWindow.add_song_from_file does for each file.
+
+    Tags come through the metadata cache and go into the track store and
+    the search index; the list model only sees one append per batch.
+    """
+    from oscillate.search import SearchIndex
+    from oscillate.trackstore import TrackStore
+
+    store = TrackStore()
+    index = SearchIndex()
+    for path in paths:
+        metadata = cache.read(path)
+        track_id = store.add(metadata)
+        index.add(track_id, metadata.title, metadata.artist)
+    cache.flush()
+    return store, index
+
+
+def bench_add(paths: List[str], sizes: List[int], work_dir: str) -> Dict[str, Any]:
+    """Adding files with a cold metadata cache, then again with a warm one."""
+    from oscillate.metadata_cache import MetadataCache
+
+    results = {}
+    for size in sizes:
+        cache_path = os.path.join(work_dir, f"add-{size}.sqlite3")
+        cache = MetadataCache(cache_path)
+        entry = {}
+        for phase in ('cold', 'warm'):
+            gc.collect()
+            started = time.perf_counter()
+            load_songs(paths[:size], cache)
+            elapsed = time.perf_counter() - started
+            entry[phase] = {'seconds': elapsed, 'per_file_us': elapsed / size * 1e6}
+        cache.close()
+        results[str(size)] = entry
+    return results
+
+
+def bench_tags(paths: List[str], repeats: int = 3) -> Dict[str, Any]:
+    """Reading MP3 tags and duration with the tagreader and with mutagen.
+
+    Both read the same files from a warm page cache, so this is the parsing
+    cost alone; on a cold, slow disk the gap widens because the tagreader
+    touches fewer pages.
+    """
+    from oscillate.metadata import HAVE_MUTAGEN
+    from oscillate.tagreader import read_mp3_tags
+
+    def read_with_mutagen(path):
+        from mutagen.mp3 import MP3
+        from mutagen.easyid3 import EasyID3
+        return MP3(path, ID3=EasyID3)
+
+    readers = {'tagreader': read_mp3_tags}
+    if HAVE_MUTAGEN:
+        readers['mutagen'] = read_with_mutagen
+
+    result: Dict[str, Any] = {'files': len(paths)}
+    for name, reader in readers.items():
+        reader(paths[0])  # imports
+        runs = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for path in paths:
+                reader(path)
+            runs.append(time.perf_counter() - started)
+        best = min(runs)
+        result[name] = {'seconds': best, 'per_file_us': best / len(paths) * 1e6}
+    if 'mutagen' in result:
+        result['speedup'] = result['mutagen']['seconds'] / result['tagreader']['seconds']
+    return result
+
+
+def bench_search(paths: List[str], work_dir: str) -> Dict[str, Any]:
+    """Latency of typing, then erasing, each query one character at a time.
+
+    Every keystroke runs the index search plus one membership test per
+    track, which is what the filter model does with the result.
+    """
+    from oscillate.metadata_cache import MetadataCache
+
+    cache = MetadataCache(os.path.join(work_dir, 'search.sqlite3'))
+    store, index = load_songs(paths, cache)
+    cache.close()
+    track_ids = list(store)
+
+    samples = []
+    for query in SEARCH_QUERIES:
+        keystrokes = [query[:i] for i in range(1, len(query) + 1)]
+        keystrokes += keystrokes[-2::-1] + ['']
+        for text in keystrokes:
+            started = time.perf_counter()
+            matches = index.search(text)
+            if matches is not None:
+                sum(1 for track_id in track_ids if track_id in matches)
+            samples.append(time.perf_counter() - started)
+    result = percentiles(samples)
+    result['tracks'] = len(track_ids)
+    return result
+
+
+def _wait_for_playing(playbin, Gst, timeout: float = 10) -> bool:
+    bus = playbin.get_bus()
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        message = bus.timed_pop_filtered(
+            100 * Gst.MSECOND, Gst.MessageType.STATE_CHANGED | Gst.MessageType.ERROR
+        )
+        if message is None:
+            continue
+        if message.type == Gst.MessageType.ERROR:
+            return False
+        if message.src == playbin and message.parse_state_changed()[1] == Gst.State.PLAYING:
+            return True
+    return False
+
+
+def _play_and_wait(player, path: str, context, timeout: float = 10) -> Optional[float]:
+    """Skip to path and run the main loop until the player reports PLAYING."""
+    recorded = len(player.skip_to_playing)
+    player.play(path)
+    deadline = time.perf_counter() + timeout
+    while len(player.skip_to_playing) == recorded and time.perf_counter() < deadline:
+        context.iteration(False) or time.sleep(0.0002)
+    if len(player.skip_to_playing) == recorded:
+        return None
+    return player.skip_to_playing[-1]
+
+
+def bench_skip(paths: List[str]) -> Dict[str, Any]:
+    """Time from a skip request until the new track is PLAYING.
+
+    Measured with the real Player, for a track it has to open (cold) and
+    for one it pre-rolled in PAUSED, which is how the window and the
+    headless mode skip to the next track. Audio goes to a clock-synced
+    fakesink. An audiotestsrc pipeline gives GStreamer's floor.
+    """
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst, GLib
+    from oscillate.player import Player
+    Gst.init(None)
+
+    floor = []
+    for _ in range(SKIP_ROUNDS):
+        pipeline = Gst.parse_launch('audiotestsrc num-buffers=100 ! fakesink sync=true')
+        started = time.perf_counter()
+        pipeline.set_state(Gst.State.PLAYING)
+        if _wait_for_playing(pipeline, Gst):
+            floor.append(time.perf_counter() - started)
+        pipeline.set_state(Gst.State.NULL)
+
+    tracks = paths[:SKIP_ROUNDS + 1]
+    context = GLib.MainContext.default()
+    player = Player(audio_sink='fakesink sync=true')
+
+    cold = []
+    for path in tracks:
+        latency = _play_and_wait(player, path, context)
+        if latency is not None:
+            cold.append(latency)
+
+    prerolled = []
+    for path, next_path in zip(tracks, tracks[1:]):
+        player.preroll([next_path])
+        player.prerolled[next_path].get_state(10 * Gst.SECOND)
+        latency = _play_and_wait(player, next_path, context)
+        if latency is not None:
+            prerolled.append(latency)
+    player.stop()
+    player.shutdown()
+
+    return {
+        name: percentiles(samples) if samples else {'error': 'no track reached PLAYING'}
+        for name, samples in (('floor', floor), ('cold', cold), ('prerolled', prerolled))
+    }
+
+
+def bench_headless(paths: List[str], env: Dict[str, str], repeats: int = 5) -> Dict[str, Any]:
+    """Process start to the first track playing in headless mode, and its memory."""
+    if not os.path.exists('/proc/self/statm'):
+        return {'skipped': 'needs /proc'}
+    runs = []
+    for _ in range(repeats):
+        try:
+            completed = subprocess.run([sys.executable, '-c', _HEADLESS_SCRIPT, paths[0]], env=env,
+                                       capture_output=True, text=True, timeout=120)
+        except subprocess.TimeoutExpired:
+            return {'error': 'timed out after 120 s'}
+        if completed.returncode != 0 or not completed.stdout.strip():
+            lines = completed.stderr.strip().splitlines()
+            return {'error': lines[-1] if lines else f"exit status {completed.returncode}"}
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    result = percentiles([run['seconds'] for run in runs])
+    result['rss_bytes'] = statistics.median(run['rss_bytes'] for run in runs)
+    result['gtk_loaded'] = any(run['gtk_loaded'] for run in runs)
+    return result
+
+
+def resident_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def memory_child(size: int, fixture_dir: str, cache_path: str) -> None:
+    """Entry point of the child process that measures memory per track."""
+    from oscillate.metadata_cache import MetadataCache
+
+    paths = fixtures.generate_library(fixture_dir, size)
+    cache = MetadataCache(cache_path)
+    gc.collect()
+
+    before = resident_bytes()
+    store, index = load_songs(paths, cache)
+    gc.collect()
+    after = resident_bytes()
+    cache.close()
+
+    print(json.dumps({
+        'rss_bytes_per_track': (after - before) / size,
+        'store_bytes_per_track': store.bytes_per_track(),
+    }))
+
+
+def bench_memory(sizes: List[int], fixture_dir: str, work_dir: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """Resident memory per track, each size in its own process.
+
+    The first run only fills the metadata cache, so the measured run does
+    not count the garbage left behind by tag parsing.
+    """
+    if not os.path.exists('/proc/self/statm'):
+        return {'skipped': 'needs /proc'}
+    results = {}
+    for size in sizes:
+        cache_path = os.path.join(work_dir, f"memory-{size}.sqlite3")
+        command = [sys.executable, __file__, '--memory-child', str(size),
+                   '--fixtures', fixture_dir, '--cache', cache_path]
+        subprocess.run(command, env=env, capture_output=True)
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            lines = completed.stderr.strip().splitlines()
+            results[str(size)] = {'error': lines[-1] if lines else 'failed'}
+        else:
+            results[str(size)] = json.loads(completed.stdout.strip().splitlines()[-1])
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                                        capture_output=True, text=True).stdout.strip()
+    except OSError:
+        pass
+    try:
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst
+        Gst.init(None)
+        info['gstreamer'] = Gst.version_string()
+    except (ImportError, ValueError):
+        pass
+    from oscillate.metadata import HAVE_MUTAGEN
+    info['mutagen'] = HAVE_MUTAGEN
+    return info
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the Oscillate benchmarks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="playlist sizes to add and measure (default: %(default)s)")
+    parser.add_argument('--only', nargs='+',
+                        choices=['import', 'startup', 'headless', 'add', 'tags', 'search', 'skip', 'memory'],
+                        help="run only these benchmarks")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'oscillate-benchmark-fixtures'),
+                        help="where synthetic MP3s are generated and reused (default: %(default)s)")
+    parser.add_argument('--output', help="write JSON here instead of standard output")
+    parser.add_argument('--memory-child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--cache', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.memory_child:
+        memory_child(args.memory_child, args.fixtures, args.cache)
+        return 0
+
+    selected = set(args.only or ['import', 'startup', 'headless', 'add', 'tags', 'search', 'skip', 'memory'])
+    sizes = sorted(args.sizes)
+    work_dir = tempfile.mkdtemp(prefix='oscillate-benchmark-')
+    env = child_environment(work_dir)
+    os.environ.update({key: env[key] for key in ('GSETTINGS_SCHEMA_DIR', 'GSETTINGS_BACKEND', 'XDG_CACHE_HOME')})
+
+    try:
+        paths = fixtures.generate_library(args.fixtures, sizes[-1])
+        results: Dict[str, Any] = {'version': 1, 'timestamp': time.time(), 'environment': environment()}
+        if 'import' in selected:
+            results['import'] = bench_import(env)
+        if 'startup' in selected:
+            results['startup'] = bench_startup(env)
+        if 'headless' in selected:
+            results['headless'] = bench_headless(paths, env)
+        if 'add' in selected:
+            results['add'] = bench_add(paths, sizes, work_dir)
+        if 'tags' in selected:
+            results['tags'] = bench_tags(paths[:sizes[0]])
+        if 'search' in selected:
+            results['search'] = bench_search(paths, work_dir)
+        if 'skip' in selected:
+            results['skip'] = bench_skip(paths)
+        if 'memory' in selected:
+            results['memory'] = bench_memory(sizes, args.fixtures, work_dir, env)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,12 @@
-import os
-import gi
+import time
+
+# Taken before anything else is loaded, for --profile-startup
+STARTED = time.perf_counter()
 
-gi.require_version('Gtk', '4.0')
-gi.require_version('Adw', '1')
+import os
 
-from gi.repository import Gtk, Gio, GLib
+# Only Gio here: the headless mode must not load GTK
+from gi.repository import Gio
 
 # Load resources at startup
 try:
@@ -0,0 +1,243 @@
+"""
+Oscillate Media Player - Album Art
+This module finds album art for a track (embedded pictures first, then image
+files next to it), scales it once to the size it is shown at and keeps the
+result as a thumbnail on disk and as a texture in a small in-memory LRU.
+Nothing here decodes an image on the main thread.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import hashlib
+import logging
+import os
+import threading
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import Gdk, GdkPixbuf, GLib
+
+from . import tracing
+from .metadata import HAVE_MUTAGEN
+from .metadata_cache import MetadataCache
+
+logger = logging.getLogger(__name__)
+
+FOLDER_IMAGE_NAMES = ('cover', 'folder', 'front', 'album', 'albumart')
+FOLDER_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# An ID3 APIC picture type of 3 is the front cover
+_FRONT_COVER = 3
+
+# Recorded in the metadata cache for files known to have no art at all
+NO_ART = ''
+
+ArtCallback = Callable[[str, Optional[Gdk.Texture]], None]
+
+
+def default_thumbnail_dir() -> str:
+    return os.path.join(GLib.get_user_cache_dir(), 'oscillate', 'thumbnails')
+
+
+def read_embedded_art(file_path: str) -> Optional[bytes]:
+    """Return the embedded front cover (or first picture) of a file."""
+    if not HAVE_MUTAGEN:
+        return None
+    import mutagen
+    from mutagen.id3 import ID3NoHeaderError
+    try:
+        audio = mutagen.File(file_path)
+    except (mutagen.MutagenError, ID3NoHeaderError, OSError):
+        return None
+    if audio is None:
+        return None
+
+    pictures = []
+    tags = audio.tags
+    if tags is not None and hasattr(tags, 'getall'):
+        pictures = [(frame.type, frame.data) for frame in tags.getall('APIC')]
+    elif hasattr(audio, 'pictures'):
+        pictures = [(picture.type, picture.data) for picture in audio.pictures]
+    elif tags is not None and 'covr' in tags:
+        pictures = [(_FRONT_COVER, bytes(cover)) for cover in tags['covr']]
+
+    if not pictures:
+        return None
+    pictures.sort(key=lambda picture: picture[0] != _FRONT_COVER)
+    return pictures[0][1]
+
+
+class AlbumArtLoader:
+    """Loads album art on worker threads.
+
+    Art is identified by the SHA-1 of the original image bytes, so every
+    track of an album that shares one picture shares one thumbnail file and
+    one texture. Thumbnails are scaled while decoding, which lets the JPEG
+    decoder skip most of the work for large covers.
+    """
+
+    MEMORY_CACHE_SIZE = 64
+
+    def __init__(self, metadata_cache: Optional[MetadataCache] = None,
+                 thumbnail_dir: Optional[str] = None):
+        self.metadata_cache = metadata_cache
+        self.thumbnail_dir = thumbnail_dir or default_thumbnail_dir()
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='oscillate-art')
+        self._lock = threading.Lock()
+        self._textures: 'OrderedDict[str, Gdk.Texture]' = OrderedDict()
+        self._hashes: Dict[str, str] = {}
+        self._folder_images: Dict[str, Optional[str]] = {}
+
+    def request(self, file_path: str, size: int, callback: ArtCallback) -> None:
+        """Call ``callback(file_path, texture)`` on the main loop.
+
+        ``texture`` is None when the track has no art. When the art is
+        already in memory the callback runs right away.
+        """
+        key = self._texture_key(self._hashes.get(file_path), size)
+        texture = self._cached_texture(key) if key else None
+        if texture is not None:
+            callback(file_path, texture)
+            return
+        self._executor.submit(self._load, file_path, size, callback)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _texture_key(art_hash: Optional[str], size: int) -> Optional[str]:
+        return f"{art_hash}-{size}" if art_hash else None
+
+    def _cached_texture(self, key: str) -> Optional[Gdk.Texture]:
+        with self._lock:
+            texture = self._textures.get(key)
+            if texture is not None:
+                self._textures.move_to_end(key)
+            return texture
+
+    def _remember(self, key: str, texture: Gdk.Texture) -> None:
+        with self._lock:
+            self._textures[key] = texture
+            self._textures.move_to_end(key)
+            while len(self._textures) > self.MEMORY_CACHE_SIZE:
+                self._textures.popitem(last=False)
+
+    def _load(self, file_path: str, size: int, callback: ArtCallback) -> None:
+        """Worker side of request()."""
+        texture = None
+        try:
+            texture = self._load_texture(file_path, size)
+        except Exception as e:
+            logger.warning(f"Could not load album art for {file_path}: {e}")
+        tracing.idle_add(self._deliver, callback, file_path, texture)
+
+    @staticmethod
+    def _deliver(callback: ArtCallback, file_path: str, texture: Optional[Gdk.Texture]) -> bool:
+        callback(file_path, texture)
+        return False
+
+    def _load_texture(self, file_path: str, size: int) -> Optional[Gdk.Texture]:
+        st = os.stat(file_path)
+
+        # A thumbnail made in an earlier session needs neither the tags nor
+        # the original image
+        art_hash = self.metadata_cache.art_hash(file_path, st) if self.metadata_cache else None
+        if art_hash == NO_ART:
+            return None
+        if art_hash:
+            texture = self._texture_from_thumbnail(art_hash, size)
+            if texture is not None:
+                self._hashes[file_path] = art_hash
+                return texture
+
+        data = read_embedded_art(file_path) or self._read_folder_image(os.path.dirname(file_path))
+        if data is None:
+            if self.metadata_cache:
+                self.metadata_cache.set_art_hash(file_path, st, NO_ART)
+            return None
+
+        art_hash = hashlib.sha1(data).hexdigest()
+        self._hashes[file_path] = art_hash
+        if self.metadata_cache:
+            self.metadata_cache.set_art_hash(file_path, st, art_hash)
+
+        texture = self._texture_from_thumbnail(art_hash, size)
+        if texture is None:
+            texture = self._make_thumbnail(art_hash, data, size)
+        return texture
+
+    def _thumbnail_path(self, art_hash: str, size: int) -> str:
+        return os.path.join(self.thumbnail_dir, f"{art_hash}-{size}.png")
+
+    def _texture_from_thumbnail(self, art_hash: str, size: int) -> Optional[Gdk.Texture]:
+        key = self._texture_key(art_hash, size)
+        texture = self._cached_texture(key)
+        if texture is not None:
+            return texture
+
+        path = self._thumbnail_path(art_hash, size)
+        if not os.path.exists(path):
+            return None
+        try:
+            texture = Gdk.Texture.new_from_filename(path)
+        except GLib.Error:
+            return None
+        self._remember(key, texture)
+        return texture
+
+    def _make_thumbnail(self, art_hash: str, data: bytes, size: int) -> Gdk.Texture:
+        """Decode straight to the display size and save the result."""
+        loader = GdkPixbuf.PixbufLoader()
+        loader.connect('size-prepared', self._on_size_prepared, size)
+        loader.write(data)
+        loader.close()
+        pixbuf = loader.get_pixbuf()
+
+        path = self._thumbnail_path(art_hash, size)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            pixbuf.savev(temp_path, 'png', [], [])
+            os.replace(temp_path, path)
+        except (GLib.Error, OSError) as e:
+            logger.warning(f"Could not save thumbnail {path}: {e}")
+
+        texture = Gdk.Texture.new_for_pixbuf(pixbuf)
+        self._remember(self._texture_key(art_hash, size), texture)
+        return texture
+
+    @staticmethod
+    def _on_size_prepared(loader: GdkPixbuf.PixbufLoader, width: int, height: int, size: int) -> None:
+        # Cover the requested square, like the picture widget does
+        scale = size / min(width, height)
+        if scale < 1:
+            loader.set_size(max(1, round(width * scale)), max(1, round(height * scale)))
+
+    def _read_folder_image(self, directory: str) -> Optional[bytes]:
+        """Return the contents of a cover image next to the track, if any."""
+        if directory not in self._folder_images:
+            self._folder_images[directory] = self._find_folder_image(directory)
+        path = self._folder_images[directory]
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _find_folder_image(directory: str) -> Optional[str]:
+        try:
+            with os.scandir(directory) as it:
+                candidates = {entry.name.lower(): entry.path for entry in it if entry.is_file()}
+        except OSError:
+            return None
+        for name in FOLDER_IMAGE_NAMES:
+            for extension in FOLDER_IMAGE_EXTENSIONS:
+                path = candidates.get(name + extension)
+                if path:
+                    return path
+        return None
@@ -0,0 +1,183 @@
+"""
+Oscillate Media Player - Application
+This module contains the GTK application class, which owns the main window and
+the application-wide actions, and the --profile-startup report.
+"""
+
+from typing import Optional
+import logging
+import sys
+import time
+import gi
+
+gi.require_version('Gtk', '4.0')
+gi.require_version('Adw', '1')
+
+from gi.repository import Gtk, Gio, GLib, Adw
+from . import STARTED, tracing
+from .window import OscillateWindow
+from .preferences import OscillatePreferences
+
+_IMPORTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """Wall-clock time of each startup phase, since the package was imported."""
+
+    # How long to wait for the compositor to report the first frame as shown
+    PRESENTATION_TIMEOUT = 1.0
+
+    def __init__(self, started: float):
+        self.started = started
+        self.previous = started
+        self.lines = []
+        self.reported = False
+
+    def mark(self, phase: str, stamp: Optional[float] = None) -> None:
+        stamp = time.perf_counter() if stamp is None else stamp
+        self.lines.append(f"{(stamp - self.started) * 1000:8.1f} ms "
+                          f"(+{(stamp - self.previous) * 1000:6.1f})  {phase}")
+        self.previous = stamp
+        if self.reported:
+            print(self.lines.pop(), file=sys.stderr)
+
+    def report(self) -> None:
+        print("Startup profile:", *self.lines, sep="\n", file=sys.stderr)
+        self.lines = []
+        self.reported = True
+
+    def watch_first_frame(self, window: Gtk.Window) -> None:
+        """Mark when the window's first frame is painted, then presented."""
+        clock = window.get_frame_clock()
+        handler = 0
+
+        def on_after_paint(clock):
+            clock.disconnect(handler)
+            self.mark("first frame painted")
+            counter = clock.get_frame_counter()
+            deadline = time.perf_counter() + self.PRESENTATION_TIMEOUT
+            GLib.timeout_add(16, self.check_presented, clock, counter, deadline)
+
+        handler = clock.connect('after-paint', on_after_paint)
+
+    def check_presented(self, clock, counter: int, deadline: float) -> bool:
+        timings = clock.get_timings(counter)
+        if timings is not None and timings.get_complete():
+            presented = timings.get_presentation_time()
+            if presented:
+                # Presentation times are on GLib's monotonic clock
+                offset = time.perf_counter() - GLib.get_monotonic_time() / 1e6
+                self.mark("first frame presented", presented / 1e6 + offset)
+            self.report()
+            return False
+        if time.perf_counter() > deadline:
+            self.report()
+            return False
+        return True
+
+
+class OscillateApplication(Adw.Application):
+    """The main application singleton class."""
+
+    def __init__(self):
+        super().__init__(application_id='com.example.Oscillate',
+                        flags=Gio.ApplicationFlags.DEFAULT_FLAGS)
+
+        self.startup_profile = None
+        self.add_main_option('profile-startup', 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Report how long each startup phase takes", None)
+        # Handled by main() before GTK is loaded; listed here for --help
+        self.add_main_option('headless', 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Play files or a playlist without a window (see --headless --help)", None)
+
+        self.create_action('quit', lambda *_: self.quit(), ['<primary>q'])
+        self.create_action('about', self.on_about_action)
+        self.create_action('preferences', self.on_preferences_action)
+        self.create_action('delete-song', self.on_delete_song_action)
+
+        # Tracing: OSCILLATE_TRACE switches it on from the start, app.tracing
+        # toggles it at runtime and app.trace-window shows the histograms
+        self.trace_export_path = tracing.configure_from_environment()
+        tracing_action = Gio.SimpleAction.new_stateful(
+            'tracing', None, GLib.Variant.new_boolean(tracing.tracer.enabled)
+        )
+        tracing_action.connect('change-state', self.on_tracing_state_changed)
+        self.add_action(tracing_action)
+        self.set_accels_for_action('app.tracing', ['<primary><shift>r'])
+        self.create_action('trace-window', self.on_trace_window_action, ['<primary><shift>t'])
+
+    def on_delete_song_action(self, action, param):
+        """Handle delete-song action at application level."""
+        win = self.props.active_window
+        if win:
+            win.delete_selected_song()
+
+    def do_handle_local_options(self, options):
+        if options.contains('profile-startup'):
+            self.startup_profile = StartupProfile(STARTED)
+            self.startup_profile.mark("modules imported", _IMPORTED)
+        return -1
+
+    def do_activate(self):
+        """Called when the application is activated."""
+        profile = self.startup_profile
+        win = self.props.active_window
+        if not win:
+            if profile:
+                profile.mark("application started")
+            win = OscillateWindow(application=self)
+            if profile:
+                profile.mark("window built")
+        win.present()
+        if profile and not profile.reported:
+            profile.mark("window shown")
+            profile.watch_first_frame(win)
+
+    def do_shutdown(self):
+        if self.trace_export_path:
+            try:
+                count = tracing.tracer.export(self.trace_export_path)
+                logger.info(f"Wrote {count} spans to {self.trace_export_path}")
+            except OSError as e:
+                logger.error(f"Could not write trace: {e}")
+        Adw.Application.do_shutdown(self)
+
+    def on_tracing_state_changed(self, action, value):
+        action.set_state(value)
+        tracing.tracer.set_enabled(value.get_boolean())
+
+    def on_trace_window_action(self, widget, _):
+        """Callback for the app.trace-window action."""
+        from .tracewindow import OscillateTraceWindow
+        OscillateTraceWindow(parent=self.props.active_window).present()
+
+    def on_about_action(self, widget, _):
+        """Callback for the app.about action."""
+        about = Adw.AboutWindow(
+            transient_for=self.props.active_window,
+            application_name='Oscillate',
+            application_icon='com.example.Oscillate',
+            developer_name='Tay Rake',
+            version='1.5-INDEV',
+            developers=['Tay Rake'],
+            copyright='© 2024 - 2025 Tay Rake'
+        )
+        about.present()
+
+    def on_preferences_action(self, widget, _):
+        """Callback for the app.preferences action."""
+        if not self.props.active_window:
+            return
+
+        prefs = OscillatePreferences(parent=self.props.active_window)
+        prefs.present()
+
+    def create_action(self, name, callback, shortcuts=None):
+        """Add an application action."""
+        action = Gio.SimpleAction.new(name, None)
+        action.connect("activate", callback)
+        self.add_action(action)
+        if shortcuts:
+            self.set_accels_for_action(f"app.{name}", shortcuts)
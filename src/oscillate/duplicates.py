@@ -0,0 +1,225 @@
+"""
+Oscillate Media Player - Duplicate Detection
+This module finds tracks whose audio is already in the playlist, even when
+the copies sit in different folders or carry different tags.
+
+Files are compared in three tiers, each only for the files the one before
+could not tell apart:
+
+1. the size of the audio, with ID3v2, ID3v1, APEv2 and FLAC metadata blocks
+   left out, found by reading a few bytes at each end;
+2. a hash of the first and last PARTIAL_BYTES of that audio;
+3. a hash of all of it, read through mmap.
+
+Hashing runs on a small thread pool (hashlib releases the GIL on large
+buffers) and every result is kept in the metadata cache, so a later import
+only does work for the new files.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+import hashlib
+import logging
+import mmap
+import os
+import struct
+
+from . import tracing
+from .metadata_cache import MetadataCache
+from .trackstore import TrackStore
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_BYTES = 16 * 1024
+# Paths handed to one worker task
+CHUNK_SIZE = 64
+
+_APE_FOOTER = struct.Struct('<8sIIII8x')
+
+# (duplicate track id, track id it duplicates) pairs, and whether the
+# duplicates were just imported rather than restored
+FoundCallback = Callable[[List[Tuple[int, int]], bool], None]
+
+
+def audio_range(f, size: int) -> Tuple[int, int]:
+    """Start and end offsets of the audio in an open file, tags excluded."""
+    start, end = 0, size
+    head = f.read(10)
+    if head[:3] == b'ID3' and len(head) == 10:
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + tag_size + (10 if head[3] == 4 and head[5] & 0x10 else 0)
+    elif head[:4] == b'fLaC':
+        # Metadata blocks, the last one flagged in the top bit of its header
+        start = 4
+        while True:
+            f.seek(start)
+            block = f.read(4)
+            if len(block) < 4:
+                return 0, size
+            start += 4 + int.from_bytes(block[1:4], 'big')
+            if block[0] & 0x80:
+                break
+
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+    if end - start >= _APE_FOOTER.size:
+        f.seek(end - _APE_FOOTER.size)
+        magic, _version, tag_size, _items, flags = _APE_FOOTER.unpack(f.read(_APE_FOOTER.size))
+        if magic == b'APETAGEX':
+            # The size counts the footer but not the optional header
+            end -= tag_size + (32 if flags & 0x80000000 else 0)
+
+    if not 0 <= start < end <= size:
+        return 0, size
+    return start, end
+
+
+def _hash_file(file_path: str, partial: bool) -> Tuple[int, Optional[str]]:
+    """(audio size, hex digest) of a file's audio, or just its ends when partial."""
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        start, end = audio_range(f, size)
+        if end == start:
+            return 0, None
+        digest = hashlib.blake2b(digest_size=16)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if partial and end - start > 2 * PARTIAL_BYTES:
+                digest.update(data[start:start + PARTIAL_BYTES])
+                digest.update(data[end - PARTIAL_BYTES:end])
+            else:
+                digest.update(memoryview(data)[start:end])
+        return end - start, digest.hexdigest()
+
+
+class DuplicateDetector:
+    """Keeps an index of the playlist by audio size and reports duplicates.
+
+    The index lives on the main thread. Workers only read files and the
+    metadata cache, and hand their results back through the main loop.
+    """
+
+    def __init__(self, store: TrackStore, cache: MetadataCache, on_found: FoundCallback,
+                 max_workers: Optional[int] = None):
+        self.store = store
+        self.cache = cache
+        self.on_found = on_found
+        self.closed = False
+        # Audio size -> track id, or a list of ids for sizes shared by several
+        self._by_size: Dict[int, Union[int, List[int]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1),
+                                            thread_name_prefix='oscillate-hash')
+
+    def add(self, track_ids: Sequence[int], imported: bool = True) -> None:
+        """Check tracks that just joined the playlist, in the background."""
+        paths = [(track_id, self.store.file_path(track_id)) for track_id in track_ids]
+        for start in range(0, len(paths), CHUNK_SIZE):
+            future = self._executor.submit(self._audio_sizes, paths[start:start + CHUNK_SIZE])
+            future.add_done_callback(lambda future: self._deliver(future, self._index, imported))
+
+    def forget(self) -> None:
+        """Drop the index, as when the playlist is cleared."""
+        self._by_size = {}
+
+    def shutdown(self) -> None:
+        self.closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _deliver(self, future, callback, *args) -> None:
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Duplicate detection failed: {error}")
+            return
+        tracing.idle_add(callback, future.result(), *args)
+
+    # Workers
+
+    def _hashes(self, file_path: str, tier: str) -> Tuple[Optional[int], Optional[str]]:
+        """(audio size, digest) of a tier, from the cache when it is known there."""
+        try:
+            st = os.stat(file_path)
+            audio_size, partial_hash, audio_hash = self.cache.audio_hashes(file_path, st)
+            if tier == 'size' and audio_size is not None:
+                return audio_size, None
+            if tier == 'partial' and partial_hash is not None:
+                return audio_size, partial_hash
+            if tier == 'full' and audio_hash is not None:
+                return audio_size, audio_hash
+
+            if tier == 'size':
+                with open(file_path, 'rb') as f:
+                    start, end = audio_range(f, st.st_size)
+                audio_size = end - start
+                self.cache.set_audio_hashes(file_path, st, audio_size=audio_size)
+                return audio_size, None
+            audio_size, digest = _hash_file(file_path, partial=tier == 'partial')
+            if tier == 'partial':
+                self.cache.set_audio_hashes(file_path, st, audio_size, partial_hash=digest)
+            else:
+                self.cache.set_audio_hashes(file_path, st, audio_size, audio_hash=digest)
+            return audio_size, digest
+        except (OSError, ValueError) as e:
+            logger.debug(f"Cannot hash {file_path}: {e}")
+            return None, None
+
+    def _audio_sizes(self, paths: List[Tuple[int, str]]) -> List[Tuple[int, Optional[int]]]:
+        return [(track_id, self._hashes(path, 'size')[0]) for track_id, path in paths]
+
+    def _confirm(self, candidates: List[Tuple[int, str, List[Tuple[int, str]]]]) -> List[Tuple[int, int]]:
+        """Pairs of tracks whose partial, then full, hashes match."""
+        found = []
+        for track_id, path, others in candidates:
+            for other_id, other_path in others:
+                if other_path == path:
+                    # The same file added twice needs no hashing at all
+                    found.append((track_id, other_id))
+                    break
+                if self._hashes(path, 'partial')[1] != self._hashes(other_path, 'partial')[1]:
+                    continue
+                digest = self._hashes(path, 'full')[1]
+                if digest is not None and digest == self._hashes(other_path, 'full')[1]:
+                    found.append((track_id, other_id))
+                    break
+        return found
+
+    # Main thread
+
+    def _index(self, sizes: List[Tuple[int, Optional[int]]], imported: bool) -> bool:
+        if self.closed:
+            return False
+        candidates = []
+        for track_id, audio_size in sizes:
+            if audio_size is None or not self.store.contains(track_id):
+                continue
+            others = self._remember(audio_size, track_id)
+            if others:
+                candidates.append((track_id, self.store.file_path(track_id),
+                                   [(other, self.store.file_path(other)) for other in others]))
+        for start in range(0, len(candidates), CHUNK_SIZE):
+            future = self._executor.submit(self._confirm, candidates[start:start + CHUNK_SIZE])
+            future.add_done_callback(lambda future: self._deliver(future, self._report, imported))
+        return False
+
+    def _remember(self, audio_size: int, track_id: int) -> List[int]:
+        """Add a track to the index and return the tracks already there with its size."""
+        entry = self._by_size.get(audio_size)
+        if entry is None:
+            self._by_size[audio_size] = track_id
+            return []
+        # Tracks removed from the playlist are dropped here, when next seen
+        others = [other for other in (entry if isinstance(entry, list) else [entry])
+                  if other != track_id and self.store.contains(other)]
+        self._by_size[audio_size] = others + [track_id] if others else track_id
+        return others
+
+    def _report(self, pairs: List[Tuple[int, int]], imported: bool) -> bool:
+        if self.closed:
+            return False
+        pairs = [(track_id, other) for track_id, other in pairs
+                 if self.store.contains(track_id) and self.store.contains(other)]
+        if pairs:
+            self.on_found(pairs, imported)
+        return False
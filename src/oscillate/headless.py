@@ -0,0 +1,244 @@
+"""
+Oscillate Media Player - Headless Mode
+This module plays a queue of files, folders or playlist files (or else the
+saved session) with the same Player as the window, on a plain GLib main loop.
+GTK and libadwaita are never loaded, which suits kiosks and servers.
+
+    oscillate --headless [--shuffle] [--repeat] [--audio-sink DESC] [--no-mpris] [PATH ...]
+"""
+
+from typing import List, Optional, Tuple
+import argparse
+import logging
+import os
+import random
+import signal
+import sys
+
+from gi.repository import GLib
+
+from .library import is_audio_file, iter_audio_files
+from .mpris import MprisHost, MprisService, track_object_path
+from .player import Player, PlayerObserver
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8')
+
+
+def read_playlist(path: str) -> List[str]:
+    """Paths listed in an M3U playlist; relative entries are resolved against it."""
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, encoding='utf-8', errors='surrogateescape') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('file://'):
+                line = GLib.filename_from_uri(line)[0]
+            entries.append(os.path.normpath(os.path.join(base, line)))
+    return entries
+
+
+def expand_paths(arguments: List[str]) -> List[str]:
+    """Turn files, folders and playlists into a flat list of audio files."""
+    paths = []
+    for argument in arguments:
+        if os.path.isdir(argument):
+            paths.extend(iter_audio_files(argument))
+        elif argument.lower().endswith(PLAYLIST_EXTENSIONS):
+            try:
+                paths.extend(read_playlist(argument))
+            except OSError as e:
+                logger.warning(f"Cannot read playlist {argument}: {e}")
+        elif is_audio_file(argument):
+            paths.append(os.path.abspath(argument))
+        else:
+            logger.warning(f"Skipping {argument}: not an audio file, folder or playlist")
+    return paths
+
+
+def load_saved_session(remember_position: bool) -> Tuple[List[str], int, int]:
+    """The queue, current index and offset (ns) saved by the window."""
+    from .session import SessionStore
+    store = SessionStore()
+    try:
+        session, state = store.load()
+    finally:
+        store.close()
+    if session is None:
+        return [], 0, 0
+
+    paths = [os.path.join(directory, name) for directory, name in zip(session.dirs, session.names)]
+    if state is not None and 0 <= state.position < len(paths) and paths[state.position] == state.file_path:
+        return paths, state.position, state.offset_ns if remember_position else 0
+    return paths, 0, 0
+
+
+class HeadlessPlayer(PlayerObserver, MprisHost):
+    """Plays a queue from start to end and then quits the main loop.
+
+    Unless mpris is False it can also be controlled over MPRIS.
+    """
+
+    can_quit = True
+
+    def __init__(self, paths: List[str], repeat: bool = False, audio_sink: Optional[str] = None,
+                 mpris: bool = True):
+        self.queue = paths
+        self.repeat = repeat
+        self.index = -1
+        self.loop = GLib.MainLoop()
+        self.exit_status = 0
+        self.failures = 0
+
+        self.player = Player(audio_sink=audio_sink)
+        self.player.next_track = self.peek_next_track
+        self.player.add_observer(self)
+        self.cache = None
+        if self.player.settings.get_string('replaygain-mode') != 'off':
+            from .metadata_cache import MetadataCache
+            self.cache = MetadataCache()
+            self.player.gain_lookup = self.cache.loudness
+        self.mpris = MprisService(self.player, self) if mpris else None
+
+    def run(self, start_index: int = 0, start_position: int = 0) -> int:
+        if not self.queue:
+            logger.error("Nothing to play")
+            return 1
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signum, self.on_quit_signal)
+
+        self.play_at(start_index, start_position)
+        self.loop.run()
+
+        if self.mpris is not None:
+            self.mpris.shutdown()
+        self.player.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+        return self.exit_status
+
+    def next_index(self) -> Optional[int]:
+        index = self.index + 1
+        if index < len(self.queue):
+            return index
+        return 0 if self.repeat else None
+
+    def peek_next_track(self) -> Optional[Tuple[int, str, int]]:
+        """Called from a GStreamer streaming thread; only reads state.
+
+        Tags are not read here, so the pipeline supplies the duration.
+        """
+        index = self.next_index()
+        return None if index is None else (index, self.queue[index], 0)
+
+    def play_at(self, index: int, start_position: int = 0) -> None:
+        self.index = index
+        self.player.play(self.queue[index], start_position)
+        self.preroll_next()
+
+    def preroll_next(self) -> None:
+        index = self.next_index()
+        self.player.preroll([] if index is None else [self.queue[index]])
+
+    def play_next(self) -> None:
+        index = self.next_index()
+        if index is None:
+            self.loop.quit()
+        else:
+            self.play_at(index)
+
+    def on_quit_signal(self) -> bool:
+        self.player.stop()
+        self.loop.quit()
+        return GLib.SOURCE_REMOVE
+
+    def mpris_metadata(self) -> dict:
+        if self.index < 0:
+            return {}
+        path = self.queue[self.index]
+        return {
+            'mpris:trackid': track_object_path(self.index),
+            'xesam:title': os.path.splitext(os.path.basename(path))[0],
+            'xesam:url': GLib.filename_to_uri(path),
+        }
+
+    def mpris_play(self) -> None:
+        self.player.play()
+
+    def mpris_next(self) -> None:
+        self.play_next()
+
+    def mpris_previous(self) -> None:
+        if self.index > 0:
+            self.play_at(self.index - 1)
+
+    def mpris_can_go_next(self) -> bool:
+        return self.next_index() is not None
+
+    def mpris_can_go_previous(self) -> bool:
+        return self.index > 0
+
+    def mpris_quit(self) -> None:
+        self.on_quit_signal()
+
+    def on_track_changed(self, file_path: str) -> None:
+        print(f"[{self.index + 1}/{len(self.queue)}] {file_path}", flush=True)
+
+    def on_stream_started(self) -> None:
+        # The track decoded, so the queue is not just a row of broken files
+        self.failures = 0
+
+    def on_gapless_track_started(self, track_id: int) -> None:
+        self.index = track_id
+        self.failures = 0
+        self.preroll_next()
+
+    def on_end_of_stream(self) -> None:
+        self.play_next()
+
+    def on_error(self, message: str) -> None:
+        # Skip what cannot be played rather than stopping the whole queue
+        self.exit_status = 2
+        self.failures += 1
+        if self.failures >= len(self.queue):
+            logger.error("None of the queued files can be played")
+            self.loop.quit()
+        else:
+            self.play_next()
+
+
+def parse_arguments(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='oscillate --headless',
+        description="Play audio without a window. With no paths, plays the saved session.",
+    )
+    parser.add_argument('paths', nargs='*', help="audio files, folders or .m3u playlists")
+    parser.add_argument('--shuffle', action='store_true', help="play the queue in random order")
+    parser.add_argument('--repeat', action='store_true', help="start over after the last track")
+    parser.add_argument('--audio-sink', metavar='DESC',
+                        help="GStreamer sink description, such as 'alsasink device=hw:1'")
+    parser.add_argument('--no-mpris', action='store_true', help="do not offer MPRIS control on the session bus")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of ``oscillate --headless``."""
+    args = parse_arguments(sys.argv[1:] if argv is None else argv)
+
+    start_index = start_position = 0
+    if args.paths:
+        paths = expand_paths(args.paths)
+    else:
+        from gi.repository import Gio
+        settings = Gio.Settings.new("com.example.Oscillate")
+        paths, start_index, start_position = load_saved_session(settings.get_boolean('remember-position'))
+    if args.shuffle:
+        random.shuffle(paths)
+        start_index = start_position = 0
+
+    headless = HeadlessPlayer(paths, repeat=args.repeat, audio_sink=args.audio_sink, mpris=not args.no_mpris)
+    return headless.run(start_index, start_position)
@@ -0,0 +1,261 @@
+"""
+Oscillate Media Player - Music Library Folders
+This module walks music folders without loading whole trees into memory and
+keeps watching them with Gio.FileMonitor (inotify on Linux), so additions,
+removals and renames are applied incrementally.
+"""
+
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+import logging
+import os
+import threading
+
+from gi.repository import Gio, GLib
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = frozenset({'.mp3', '.flac', '.ogg', '.oga', '.opus', '.m4a', '.wav'})
+WALK_CHUNK_SIZE = 256
+
+
+def is_audio_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS
+
+
+def iter_audio_files(root: str, directories: Optional[List[str]] = None,
+                     cancelled: Optional[threading.Event] = None) -> Iterator[str]:
+    """Yield audio files below root as they are found, in name order.
+
+    Every directory visited is appended to ``directories`` when given. Hidden
+    entries are skipped and symlinked directories are not followed, so a
+    link cycle cannot trap the walk.
+    """
+    stack = [root]
+    while stack:
+        if cancelled is not None and cancelled.is_set():
+            return
+
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Cannot read folder {directory}: {e}")
+            continue
+
+        if directories is not None:
+            directories.append(directory)
+
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and is_audio_file(entry.name):
+                    yield entry.path
+            except OSError:
+                continue
+
+        # Reversed so subfolders come off the stack in name order
+        stack.extend(reversed(subdirs))
+
+
+def walk_in_background(roots: List[str], on_files: Callable[[List[str]], None],
+                       on_directories: Optional[Callable[[List[str]], None]] = None,
+                       cancelled: Optional[threading.Event] = None) -> threading.Thread:
+    """Walk folders on a thread, streaming files out in chunks.
+
+    ``on_files`` is called on the walking thread, so it must be thread-safe
+    (MetadataScanner.queue is). ``on_directories`` gets every directory that
+    was visited, once the walk is over, on the main loop.
+    """
+    def walk():
+        directories = [] if on_directories else None
+        for root in roots:
+            chunk = []
+            for path in iter_audio_files(root, directories, cancelled):
+                chunk.append(path)
+                if len(chunk) >= WALK_CHUNK_SIZE:
+                    on_files(chunk)
+                    chunk = []
+            if chunk:
+                on_files(chunk)
+
+        if on_directories and not (cancelled and cancelled.is_set()):
+            tracing.idle_add(deliver_directories, directories)
+
+    def deliver_directories(directories):
+        on_directories(directories)
+        return False
+
+    thread = threading.Thread(target=walk, name='oscillate-folder-walk', daemon=True)
+    thread.start()
+    return thread
+
+
+class DirectoryChanges(NamedTuple):
+    """What check_directories() found changed since the folders were last watched."""
+
+    watched: List[str]
+    added: List[str]
+    removed: List[str]
+    unwalked: List[str]
+
+
+def check_directories(roots: List[str], saved: Dict[str, int], known: Iterable[str]) -> DirectoryChanges:
+    """Compare the directories watched last time, with their mtimes, to the disk.
+
+    Every directory is stat'ed rather than walked. Only those whose mtime
+    changed are listed, to find audio files added or removed there while
+    nothing was watching and subfolders that are new; those and roots with
+    nothing saved are returned for a full walk. Blocks, so call it off the
+    main thread.
+    """
+    prefixes = tuple(root.rstrip(os.sep) + os.sep for root in roots)
+    known_names: Dict[str, set] = {}
+    for path in known:
+        directory, name = os.path.split(path)
+        known_names.setdefault(directory, set()).add(name)
+
+    watched, added, removed = [], [], []
+    unwalked = [root for root in roots if root not in saved]
+    for directory, mtime_ns in saved.items():
+        if directory not in roots and not directory.startswith(prefixes):
+            continue
+        try:
+            st = os.stat(directory)
+        except OSError:
+            removed.append(directory)
+            continue
+        watched.append(directory)
+        if st.st_mtime_ns == mtime_ns:
+            continue
+
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.warning(f"Cannot read folder {directory}: {e}")
+            continue
+        names = known_names.get(directory, set())
+        present = set()
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in saved:
+                        unwalked.append(entry.path)
+                elif entry.is_file() and is_audio_file(entry.name):
+                    present.add(entry.name)
+                    if entry.name not in names:
+                        added.append(entry.path)
+            except OSError:
+                continue
+        removed.extend(os.path.join(directory, name) for name in names - present)
+    return DirectoryChanges(watched, added, removed, unwalked)
+
+
+class LibraryWatcher:
+    """Watches folder trees and reports changed audio files.
+
+    inotify is not recursive, so every directory gets its own monitor. The
+    callbacks run on the main loop:
+
+    * ``on_added(paths)`` for new or moved-in files, and files renamed to
+      an audio name
+    * ``on_removed(path)`` for a deleted file or folder, and an audio file
+      renamed to something else
+    * ``on_renamed(old_path, new_path)`` for a folder, or an audio file
+      renamed in place to another audio name
+    """
+
+    def __init__(self, on_added: Callable[[List[str]], None],
+                 on_removed: Callable[[str], None],
+                 on_renamed: Callable[[str, str], None]):
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.on_renamed = on_renamed
+        self._monitors: Dict[str, Gio.FileMonitor] = {}
+
+    def watch(self, directories: List[str]) -> None:
+        """Start monitoring directories (main thread only)."""
+        for directory in directories:
+            if directory in self._monitors:
+                continue
+            try:
+                monitor = Gio.File.new_for_path(directory).monitor_directory(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None
+                )
+            except GLib.Error as e:
+                logger.warning(f"Cannot watch {directory}: {e.message}")
+                continue
+            monitor.connect('changed', self._on_changed)
+            self._monitors[directory] = monitor
+
+    def unwatch(self, root: str) -> None:
+        """Stop monitoring a directory and everything below it."""
+        prefix = root.rstrip(os.sep) + os.sep
+        for directory in list(self._monitors):
+            if directory == root or directory.startswith(prefix):
+                self._monitors.pop(directory).cancel()
+
+    def directories(self) -> List[str]:
+        """Every directory being monitored."""
+        return list(self._monitors)
+
+    def unwatch_all(self) -> None:
+        for monitor in self._monitors.values():
+            monitor.cancel()
+        self._monitors.clear()
+
+    def _watch_new_tree(self, root: str) -> None:
+        """A directory appeared: report its files and watch its subtree."""
+        walk_in_background([root], lambda paths: tracing.idle_add(self._report_added, paths),
+                           on_directories=self.watch)
+
+    def _report_added(self, paths: List[str]) -> bool:
+        self.on_added(paths)
+        return False
+
+    def _on_changed(self, monitor: Gio.FileMonitor, file: Gio.File,
+                    other_file: Optional[Gio.File], event_type: Gio.FileMonitorEvent) -> None:
+        path = file.get_path()
+        if path is None or os.path.basename(path).startswith('.'):
+            return
+
+        Event = Gio.FileMonitorEvent
+        if event_type in (Event.CHANGES_DONE_HINT, Event.MOVED_IN):
+            # New files are only reported once written, i.e. on CHANGES_DONE_HINT
+            if os.path.isdir(path):
+                if event_type == Event.MOVED_IN:
+                    self._watch_new_tree(path)
+            elif is_audio_file(path):
+                self.on_added([path])
+        elif event_type == Event.CREATED:
+            if os.path.isdir(path):
+                self._watch_new_tree(path)
+        elif event_type in (Event.DELETED, Event.MOVED_OUT):
+            self.unwatch(path)
+            self.on_removed(path)
+        elif event_type == Event.RENAMED and other_file is not None:
+            new_path = other_file.get_path()
+            if os.path.isdir(new_path):
+                self.unwatch(path)
+                self._watch_directories_only(new_path)
+                self.on_renamed(path, new_path)
+            elif is_audio_file(path) and is_audio_file(new_path):
+                self.on_renamed(path, new_path)
+            elif is_audio_file(new_path):
+                # Written under a temporary name such as x.mp3.part, then renamed
+                self.on_added([new_path])
+            elif is_audio_file(path):
+                self.on_removed(path)
+
+    def _watch_directories_only(self, root: str) -> None:
+        """Re-arm monitors below a renamed folder; its files are already known."""
+        walk_in_background([root], lambda paths: None, on_directories=self.watch)
@@ -0,0 +1,222 @@
+"""
+Oscillate Media Player - Loudness Analysis
+This module measures ReplayGain track and album gain with GStreamer's
+rganalysis element, one album per job, on a pool of worker processes, and
+writes the results into the metadata cache.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import groupby
+from typing import Callable, Iterable, List, Optional, Tuple
+import logging
+import os
+import threading
+
+from . import tracing
+from .metadata_cache import MetadataCache
+
+logger = logging.getLogger(__name__)
+
+# (path, track gain, track peak, album gain, album peak)
+LoudnessResult = Tuple[str, Optional[float], Optional[float], Optional[float], Optional[float]]
+
+# Decoded audio runs through these, linked in order after decodebin
+_ANALYSIS_ELEMENTS = ('audioconvert', 'audioresample', 'rganalysis', 'fakesink')
+
+# Seconds to wait for one file before giving up on it
+FILE_TIMEOUT = 300
+
+_gst_ready = False
+
+
+def _link_decoded(decoder, pad, sink_pad) -> None:
+    """Link a decodebin pad to the converter.
+
+    decodebin drops its pads on the way back to READY and makes new ones for
+    the next file, so this runs for every file, not just the first.
+    """
+    caps = pad.get_current_caps() or pad.query_caps(None)
+    if not sink_pad.is_linked() and caps.get_structure(0).get_name().startswith('audio/'):
+        pad.link(sink_pad)
+
+
+def analyse_album(paths: List[str]) -> List[LoudnessResult]:
+    """Measure the files of one album in order. Runs in a worker process.
+
+    All files go through the same rganalysis element, which only resets
+    between albums, so the last file also reports the album gain. Files that
+    fail to decode get None for every value.
+    """
+    global _gst_ready
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    if not _gst_ready:
+        Gst.init(None)
+        _gst_ready = True
+
+    pipeline = Gst.Pipeline.new('loudness')
+    source = Gst.ElementFactory.make('filesrc', None)
+    decoder = Gst.ElementFactory.make('decodebin', None)
+    chain = [Gst.ElementFactory.make(name, None) for name in _ANALYSIS_ELEMENTS]
+    for element in [source, decoder] + chain:
+        pipeline.add(element)
+    source.link(decoder)
+    for upstream, downstream in zip(chain, chain[1:]):
+        upstream.link(downstream)
+    decoder.connect('pad-added', _link_decoded, chain[0].get_static_pad('sink'))
+    analysis, sink = chain[-2], chain[-1]
+    analysis.set_property('num-tracks', len(paths))
+    sink.set_property('sync', False)
+    bus = pipeline.get_bus()
+    wanted = Gst.MessageType.EOS | Gst.MessageType.ERROR | Gst.MessageType.TAG
+
+    results = []
+    album_gain = album_peak = None
+    try:
+        for path in paths:
+            # READY keeps rganalysis' album accumulator; NULL would reset it
+            pipeline.set_state(Gst.State.READY)
+            while bus.pop() is not None:
+                pass
+            source.set_property('location', path)
+            pipeline.set_state(Gst.State.PLAYING)
+
+            track_gain = track_peak = None
+            while True:
+                message = bus.timed_pop_filtered(FILE_TIMEOUT * Gst.SECOND, wanted)
+                if message is None or message.type == Gst.MessageType.ERROR:
+                    track_gain = track_peak = None
+                    break
+                if message.type == Gst.MessageType.EOS:
+                    break
+                tags = message.parse_tag()
+                found, value = tags.get_double(Gst.TAG_TRACK_GAIN)
+                if found:
+                    track_gain = value
+                found, value = tags.get_double(Gst.TAG_TRACK_PEAK)
+                if found:
+                    track_peak = value
+                found, value = tags.get_double(Gst.TAG_ALBUM_GAIN)
+                if found:
+                    album_gain = value
+                found, value = tags.get_double(Gst.TAG_ALBUM_PEAK)
+                if found:
+                    album_peak = value
+            results.append([path, track_gain, track_peak])
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+    return [(path, track_gain, track_peak,
+             album_gain if track_gain is not None else None,
+             album_peak if track_gain is not None else None)
+            for path, track_gain, track_peak in results]
+
+
+def group_albums(rows: List[Tuple[str, str]]) -> List[List[str]]:
+    """Group (path, album) rows by folder and album tag.
+
+    Files without an album tag are measured as albums of one track.
+    """
+    albums = []
+    keyed = sorted(rows, key=lambda row: (os.path.dirname(row[0]), row[1], row[0]))
+    for (directory, album), group in groupby(keyed, key=lambda row: (os.path.dirname(row[0]), row[1])):
+        paths = [path for path, _ in group]
+        if album:
+            albums.append(paths)
+        else:
+            albums.extend([path] for path in paths)
+    return albums
+
+
+class LoudnessAnalyzer:
+    """Analyses the playlist files in the metadata cache that have no gain yet.
+
+    A coordinator thread feeds albums to a process pool and stores each
+    album's results as soon as they arrive. Since only pending rows are
+    picked up, stopping halfway and starting again carries on where the
+    previous run left off. Callbacks run on the main loop:
+
+    * ``on_progress(done, total)`` after each album
+    * ``on_finished(done, cancelled)`` when the run ends
+    """
+
+    def __init__(self, cache: MetadataCache,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 on_finished: Optional[Callable[[int, bool], None]] = None,
+                 max_workers: Optional[int] = None):
+        self.cache = cache
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, paths: Iterable[str]) -> None:
+        """Analyse whatever is pending among paths, unless a run is already going."""
+        if self.is_running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(frozenset(paths),),
+                                        name='oscillate-loudness', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop after the albums that are being analysed right now."""
+        self._stopped.set()
+
+    def _run(self, paths: frozenset) -> None:
+        pending = self.cache.pending_loudness(paths)
+        stats = {path: st for path, _, st in pending}
+        albums = group_albums([(path, album) for path, album, _ in pending])
+        if not albums:
+            return
+
+        total = sum(len(paths) for paths in albums)
+        done = 0
+        logger.info(f"Analysing loudness of {total} files in {len(albums)} albums")
+
+        # Imported here to keep multiprocessing off the startup path
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        # Spawned workers do not inherit the GLib main loop or GTK state
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.max_workers, mp_context=context) as executor:
+            remaining = iter(albums)
+            running = set()
+            while not self._stopped.is_set():
+                while len(running) < self.max_workers * 2:
+                    paths = next(remaining, None)
+                    if paths is None:
+                        break
+                    running.add(executor.submit(analyse_album, paths))
+                if not running:
+                    break
+
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        logger.warning(f"Loudness analysis failed: {e}")
+                        continue
+                    self.cache.store_loudness(results, stats)
+                    done += len(results)
+                if self.on_progress:
+                    tracing.idle_add(self._deliver, self.on_progress, done, total)
+
+            for future in running:
+                future.cancel()
+
+        if self.on_finished:
+            tracing.idle_add(self._deliver, self.on_finished, done, self._stopped.is_set())
+
+    @staticmethod
+    def _deliver(callback: Callable, *args) -> bool:
+        callback(*args)
+        return False
@@ -0,0 +1,87 @@
+"""
+Oscillate Media Player - Song Metadata
+This module reads the tags of audio files into plain SongMetadata records.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+import importlib.util
+import logging
+
+from . import tracing
+from .tagreader import TagError, read_mp3_tags
+
+logger = logging.getLogger(__name__)
+
+# mutagen itself is imported on first use, off the startup path
+HAVE_MUTAGEN = importlib.util.find_spec('mutagen') is not None
+if not HAVE_MUTAGEN:
+    logger.warning("Mutagen not found. Limited metadata support available.")
+
+UNKNOWN_ARTIST = 'Unknown Artist'
+
+
+@dataclass
+class SongMetadata:
+    """Tags read from a single audio file."""
+
+    file_path: str
+    title: str
+    artist: str
+    album: str = ''
+    duration: float = 0.0
+    track_number: int = 0
+
+
+def parse_track_number(value: str) -> int:
+    """The track number of a tag like '3' or '3/12'; 0 if there is none."""
+    number = value.split('/', 1)[0].strip()
+    return int(number) if number.isdigit() else 0
+
+
+@tracing.traced(category='metadata')
+def read_metadata(file_path: str) -> SongMetadata:
+    """Read the tags of a file, falling back to the file name for the title.
+
+    MP3s go through the header-only tagreader first; mutagen only sees the
+    files it cannot handle, and other formats. Raises whatever mutagen
+    raises for unreadable files.
+    """
+    stem = Path(file_path).stem
+    if file_path.lower().endswith('.mp3'):
+        try:
+            tags = read_mp3_tags(file_path)
+        except TagError as e:
+            logger.debug(f"Reading {file_path} with mutagen: {e}")
+        else:
+            return SongMetadata(
+                file_path=file_path,
+                title=tags.title or stem,
+                artist=tags.artist or UNKNOWN_ARTIST,
+                album=tags.album,
+                duration=tags.duration,
+                track_number=parse_track_number(tags.track),
+            )
+
+    if not HAVE_MUTAGEN:
+        return SongMetadata(file_path, stem, UNKNOWN_ARTIST)
+
+    import mutagen
+    from mutagen.mp3 import MP3
+    from mutagen.easyid3 import EasyID3
+
+    if file_path.lower().endswith('.mp3'):
+        audio = MP3(file_path, ID3=EasyID3)
+    else:
+        audio = mutagen.File(file_path, easy=True)
+        if audio is None:
+            raise ValueError("Unsupported audio format")
+
+    return SongMetadata(
+        file_path=file_path,
+        title=(audio.get('title') or [stem])[0],
+        artist=(audio.get('artist') or [UNKNOWN_ARTIST])[0],
+        album=(audio.get('album') or [''])[0],
+        duration=audio.info.length,
+        track_number=parse_track_number((audio.get('tracknumber') or [''])[0]),
+    )
@@ -0,0 +1,355 @@
+"""
+Oscillate Media Player - Metadata Cache
+This module keeps the tags of every file Oscillate has read in a small SQLite
+database, so re-importing a library only has to stat each file.
+"""
+
+from typing import AbstractSet, Dict, List, Optional, Tuple
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from gi.repository import GLib
+
+from . import tracing
+from .metadata import SongMetadata, read_metadata
+
+logger = logging.getLogger(__name__)
+
+# Each entry upgrades the schema by one version; PRAGMA user_version records
+# how many have been applied.
+_MIGRATIONS = [
+    """
+    CREATE TABLE tracks (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        artist TEXT NOT NULL,
+        album TEXT NOT NULL,
+        duration REAL NOT NULL,
+        art_hash TEXT,
+        last_seen INTEGER NOT NULL
+    );
+    CREATE INDEX tracks_last_seen ON tracks (last_seen);
+    """,
+    # ReplayGain values in dB and linear peaks; loudness_state is one of the
+    # LOUDNESS_* constants below
+    """
+    ALTER TABLE tracks ADD COLUMN track_gain REAL;
+    ALTER TABLE tracks ADD COLUMN track_peak REAL;
+    ALTER TABLE tracks ADD COLUMN album_gain REAL;
+    ALTER TABLE tracks ADD COLUMN album_peak REAL;
+    ALTER TABLE tracks ADD COLUMN loudness_state INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX tracks_loudness_state ON tracks (loudness_state);
+    """,
+    # NULL until the tags are read again; lookup() treats that as a miss
+    """
+    ALTER TABLE tracks ADD COLUMN track_number INTEGER;
+    """,
+    # Duplicate detection: the size of the audio without tags, a hash of its
+    # first and last few KiB, and a hash of all of it (see duplicates.py)
+    """
+    ALTER TABLE tracks ADD COLUMN audio_size INTEGER;
+    ALTER TABLE tracks ADD COLUMN partial_hash TEXT;
+    ALTER TABLE tracks ADD COLUMN audio_hash TEXT;
+    """,
+]
+
+LOUDNESS_PENDING = 0
+LOUDNESS_DONE = 1
+LOUDNESS_FAILED = 2
+
+# Re-reading the tags of an unchanged file keeps its art hash, loudness and
+# audio hashes
+_SAME_FILE = "size = excluded.size AND mtime_ns = excluded.mtime_ns"
+_UPSERT = (
+    "INSERT INTO tracks "
+    "(path, size, mtime_ns, title, artist, album, duration, track_number, art_hash, last_seen) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (path) DO UPDATE SET "
+    "title = excluded.title, artist = excluded.artist, album = excluded.album, "
+    "duration = excluded.duration, track_number = excluded.track_number, "
+    "last_seen = excluded.last_seen, size = excluded.size, mtime_ns = excluded.mtime_ns, "
+    f"art_hash = CASE WHEN {_SAME_FILE} THEN coalesce(excluded.art_hash, art_hash) "
+    "ELSE excluded.art_hash END, "
+    f"loudness_state = CASE WHEN {_SAME_FILE} THEN loudness_state ELSE {LOUDNESS_PENDING} END, "
+    f"audio_size = CASE WHEN {_SAME_FILE} THEN audio_size END, "
+    f"partial_hash = CASE WHEN {_SAME_FILE} THEN partial_hash END, "
+    f"audio_hash = CASE WHEN {_SAME_FILE} THEN audio_hash END"
+)
+
+
+def default_cache_path() -> str:
+    """Location of the cache database under the user cache directory."""
+    return os.path.join(GLib.get_user_cache_dir(), 'oscillate', 'metadata.sqlite3')
+
+
+class MetadataCache:
+    """Tag cache keyed by path and invalidated by (size, mtime).
+
+    Lookups may come from any thread. Writes are buffered and committed in
+    batches, either once enough have piled up or when flush() is called.
+    """
+
+    MAX_AGE_DAYS = 180
+    FLUSH_THRESHOLD = 256
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_cache_path()
+        self._lock = threading.Lock()
+        self._pending: List[Tuple] = []
+        self._touched: List[Tuple[int, str]] = []
+        self._db = self._open()
+
+    def _open(self) -> Optional[sqlite3.Connection]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        for attempt in range(2):
+            try:
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                self._migrate(db)
+                return db
+            except sqlite3.DatabaseError as e:
+                logger.warning(f"Metadata cache unusable ({e}), recreating it")
+                if attempt == 0:
+                    try:
+                        os.remove(self.path)
+                    except OSError:
+                        break
+        logger.error("Metadata cache disabled")
+        return None
+
+    @staticmethod
+    def _migrate(db: sqlite3.Connection) -> None:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        for index in range(version, len(_MIGRATIONS)):
+            db.executescript(_MIGRATIONS[index])
+            db.execute(f"PRAGMA user_version = {index + 1}")
+        db.commit()
+
+    def lookup(self, file_path: str, st: os.stat_result) -> Optional[SongMetadata]:
+        """Return cached tags if the file has not changed since they were read."""
+        if self._db is None:
+            return None
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, title, artist, album, duration, track_number "
+                "FROM tracks WHERE path = ?", (file_path,)
+            ).fetchone()
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns or row[6] is None:
+                return None
+            self._touched.append((int(time.time()), file_path))
+
+        return SongMetadata(file_path, row[2], row[3], row[4], row[5], row[6])
+
+    def store(self, metadata: SongMetadata, st: os.stat_result,
+              art_hash: Optional[str] = None) -> None:
+        """Queue tags for writing."""
+        if self._db is None:
+            return
+
+        with self._lock:
+            self._pending.append((
+                metadata.file_path, st.st_size, st.st_mtime_ns,
+                metadata.title, metadata.artist, metadata.album,
+                metadata.duration, metadata.track_number, art_hash, int(time.time()),
+            ))
+            if len(self._pending) >= self.FLUSH_THRESHOLD:
+                self._flush_locked()
+
+    @tracing.traced(category='metadata')
+    def read(self, file_path: str) -> SongMetadata:
+        """Read tags through the cache, parsing the file only on a miss."""
+        st = os.stat(file_path)
+        metadata = self.lookup(file_path, st)
+        if metadata is None:
+            metadata = read_metadata(file_path)
+            self.store(metadata, st)
+        return metadata
+
+    def art_hash(self, file_path: str, st: os.stat_result) -> Optional[str]:
+        """Hash of the file's album art, '' if it has none, None if unknown."""
+        if self._db is None:
+            return None
+        with self._lock:
+            self._flush_locked()
+            row = self._db.execute(
+                "SELECT size, mtime_ns, art_hash FROM tracks WHERE path = ?", (file_path,)
+            ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None
+        return row[2]
+
+    def set_art_hash(self, file_path: str, st: os.stat_result, art_hash: str) -> None:
+        """Record the album art hash of a file whose tags are already cached."""
+        if self._db is None:
+            return
+        with self._lock:
+            self._flush_locked()
+            try:
+                with self._db:
+                    self._db.execute(
+                        "UPDATE tracks SET art_hash = ? "
+                        "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                        (art_hash, file_path, st.st_size, st.st_mtime_ns)
+                    )
+            except sqlite3.DatabaseError as e:
+                logger.error(f"Could not write metadata cache: {e}")
+
+    def audio_hashes(self, file_path: str, st: os.stat_result
+                     ) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+        """(audio size, partial hash, audio hash) of a file; None where unknown."""
+        if self._db is None:
+            return None, None, None
+        with self._lock:
+            self._flush_locked()
+            row = self._db.execute(
+                "SELECT size, mtime_ns, audio_size, partial_hash, audio_hash FROM tracks WHERE path = ?",
+                (file_path,)
+            ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return None, None, None
+        return row[2], row[3], row[4]
+
+    def set_audio_hashes(self, file_path: str, st: os.stat_result, audio_size: Optional[int] = None,
+                         partial_hash: Optional[str] = None, audio_hash: Optional[str] = None) -> None:
+        """Record what duplicates.py worked out for a file whose tags are cached."""
+        if self._db is None:
+            return
+        with self._lock:
+            self._flush_locked()
+            try:
+                with self._db:
+                    self._db.execute(
+                        "UPDATE tracks SET audio_size = coalesce(?, audio_size), "
+                        "partial_hash = coalesce(?, partial_hash), audio_hash = coalesce(?, audio_hash) "
+                        "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                        (audio_size, partial_hash, audio_hash, file_path, st.st_size, st.st_mtime_ns)
+                    )
+            except sqlite3.DatabaseError as e:
+                logger.error(f"Could not write metadata cache: {e}")
+
+    def pending_loudness(self, paths: AbstractSet[str]) -> List[Tuple[str, str, os.stat_result]]:
+        """(path, album, stat) of the files among paths whose loudness was never analysed.
+
+        Files changed since their tags were cached are left out until they
+        are read again; the stat goes back to store_loudness().
+        """
+        if self._db is None:
+            return []
+        with self._lock:
+            self._flush_locked()
+            rows = self._db.execute(
+                "SELECT path, album, size, mtime_ns FROM tracks WHERE loudness_state = ? ORDER BY path",
+                (LOUDNESS_PENDING,)
+            )
+            # Rows of files that left the playlist stay pending
+            rows = [row for row in rows if row[0] in paths]
+
+        pending = []
+        for path, album, size, mtime_ns in rows:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                pending.append((path, album, st))
+        return pending
+
+    def store_loudness(self, results: List[Tuple[str, Optional[float], Optional[float],
+                                                 Optional[float], Optional[float]]],
+                       stats: Dict[str, os.stat_result]) -> None:
+        """Record (path, track gain, track peak, album gain, album peak) rows.
+
+        stats holds what pending_loudness() returned for each file; a file
+        that changed since is not updated. A row without a track gain marks
+        the file as failed, so it is not analysed again until it changes.
+        """
+        if self._db is None:
+            return
+        rows = [
+            (track_gain, track_peak, album_gain, album_peak,
+             LOUDNESS_DONE if track_gain is not None else LOUDNESS_FAILED,
+             path, stats[path].st_size, stats[path].st_mtime_ns)
+            for path, track_gain, track_peak, album_gain, album_peak in results
+        ]
+        with self._lock:
+            self._flush_locked()
+            try:
+                with self._db:
+                    self._db.executemany(
+                        "UPDATE tracks SET track_gain = ?, track_peak = ?, album_gain = ?, "
+                        "album_peak = ?, loudness_state = ? "
+                        "WHERE path = ? AND size = ? AND mtime_ns = ?", rows
+                    )
+            except sqlite3.DatabaseError as e:
+                logger.error(f"Could not write metadata cache: {e}")
+
+    def loudness(self, file_path: str) -> Optional[Tuple[float, Optional[float]]]:
+        """(track gain, album gain) in dB for an analysed file, else None.
+
+        Gains measured on an earlier version of the file are not returned.
+        """
+        if self._db is None:
+            return None
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT track_gain, album_gain FROM tracks "
+                "WHERE path = ? AND size = ? AND mtime_ns = ? AND loudness_state = ?",
+                (file_path, st.st_size, st.st_mtime_ns, LOUDNESS_DONE)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def flush(self) -> None:
+        """Commit buffered writes."""
+        if self._db is None:
+            return
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending and not self._touched:
+            return
+        try:
+            with self._db:
+                self._db.executemany(_UPSERT, self._pending)
+                self._db.executemany(
+                    "UPDATE tracks SET last_seen = ? WHERE path = ?", self._touched
+                )
+        except sqlite3.DatabaseError as e:
+            logger.error(f"Could not write metadata cache: {e}")
+        self._pending = []
+        self._touched = []
+
+    def prune(self, max_age_days: Optional[int] = None) -> int:
+        """Drop entries that have not been looked at for a long time."""
+        if self._db is None:
+            return 0
+
+        max_age_days = max_age_days or self.MAX_AGE_DAYS
+        cutoff = int(time.time()) - max_age_days * 86400
+        with self._lock:
+            self._flush_locked()
+            with self._db:
+                cursor = self._db.execute("DELETE FROM tracks WHERE last_seen < ?", (cutoff,))
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} stale metadata cache entries")
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Flush and close the database."""
+        if self._db is None:
+            return
+        self.flush()
+        with self._lock:
+            self._db.close()
+            self._db = None
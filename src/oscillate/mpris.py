@@ -0,0 +1,382 @@
+"""
+Oscillate Media Player - MPRIS
+This module exposes a Player on the session bus as an MPRIS2 media player,
+so desktop shells, media keys and remotes can control it. It only needs Gio
+and works the same in the window and in the headless mode.
+
+Property changes are collected and sent as one PropertiesChanged signal per
+interface, at most every COALESCE_MS. The position is never pushed: clients
+read it with Get and are told about jumps through Seeked.
+
+To try it on a private bus:
+
+    dbus-run-session -- sh -c 'oscillate --headless song.mp3 &
+        sleep 1; gdbus introspect --session --dest org.mpris.MediaPlayer2.oscillate \\
+        --object-path /org/mpris/MediaPlayer2'
+"""
+
+from typing import Any, Dict, Optional, Set
+import logging
+import time
+
+from gi.repository import Gio, GLib
+
+from . import tracing
+from .player import PAUSED, PLAYING, STOPPED, Player, PlayerObserver
+
+logger = logging.getLogger(__name__)
+
+BUS_NAME = 'org.mpris.MediaPlayer2.oscillate'
+OBJECT_PATH = '/org/mpris/MediaPlayer2'
+ROOT_INTERFACE = 'org.mpris.MediaPlayer2'
+PLAYER_INTERFACE = 'org.mpris.MediaPlayer2.Player'
+NO_TRACK = '/org/mpris/MediaPlayer2/TrackList/NoTrack'
+TRACK_PATH = '/com/example/Oscillate/Track/'
+
+# Shortest gap between two PropertiesChanged signals
+COALESCE_MS = 100
+
+LOOP_STATUSES = ('None', 'Track', 'Playlist')
+
+_PLAYBACK_STATUS = {PLAYING: 'Playing', PAUSED: 'Paused', STOPPED: 'Stopped'}
+
+# Variant types of the metadata entries a host may provide
+_METADATA_TYPES = {
+    'mpris:trackid': 'o',
+    'mpris:length': 'x',
+    'mpris:artUrl': 's',
+    'xesam:title': 's',
+    'xesam:artist': 'as',
+    'xesam:album': 's',
+    'xesam:url': 's',
+}
+
+_INTROSPECTION = """
+<node>
+  <interface name="org.mpris.MediaPlayer2">
+    <method name="Raise"/>
+    <method name="Quit"/>
+    <property name="CanQuit" type="b" access="read"/>
+    <property name="CanRaise" type="b" access="read"/>
+    <property name="HasTrackList" type="b" access="read"/>
+    <property name="Identity" type="s" access="read"/>
+    <property name="DesktopEntry" type="s" access="read"/>
+    <property name="SupportedUriSchemes" type="as" access="read"/>
+    <property name="SupportedMimeTypes" type="as" access="read"/>
+  </interface>
+  <interface name="org.mpris.MediaPlayer2.Player">
+    <method name="Next"/>
+    <method name="Previous"/>
+    <method name="Pause"/>
+    <method name="PlayPause"/>
+    <method name="Stop"/>
+    <method name="Play"/>
+    <method name="Seek">
+      <arg direction="in" name="Offset" type="x"/>
+    </method>
+    <method name="SetPosition">
+      <arg direction="in" name="TrackId" type="o"/>
+      <arg direction="in" name="Position" type="x"/>
+    </method>
+    <method name="OpenUri">
+      <arg direction="in" name="Uri" type="s"/>
+    </method>
+    <signal name="Seeked">
+      <arg name="Position" type="x"/>
+    </signal>
+    <property name="PlaybackStatus" type="s" access="read"/>
+    <property name="Rate" type="d" access="readwrite"/>
+    <property name="Metadata" type="a{sv}" access="read"/>
+    <property name="Volume" type="d" access="readwrite"/>
+    <property name="Shuffle" type="b" access="readwrite"/>
+    <property name="LoopStatus" type="s" access="readwrite"/>
+    <property name="Position" type="x" access="read"/>
+    <property name="MinimumRate" type="d" access="read"/>
+    <property name="MaximumRate" type="d" access="read"/>
+    <property name="CanGoNext" type="b" access="read"/>
+    <property name="CanGoPrevious" type="b" access="read"/>
+    <property name="CanPlay" type="b" access="read"/>
+    <property name="CanPause" type="b" access="read"/>
+    <property name="CanSeek" type="b" access="read"/>
+    <property name="CanControl" type="b" access="read"/>
+  </interface>
+</node>
+"""
+
+
+def track_object_path(track_id: int) -> str:
+    return f"{TRACK_PATH}{track_id}"
+
+
+def introspection_xml(host: 'MprisHost') -> str:
+    """_INTROSPECTION without the optional properties the host does not offer.
+
+    GDBus then answers a Get or Set of them with UnknownProperty itself.
+    """
+    left_out = tuple(f'<property name="{name}"' for name, value in (
+        ('Shuffle', host.mpris_shuffle()),
+        ('LoopStatus', host.mpris_loop_status()),
+    ) if value is None)
+    return '\n'.join(line for line in _INTROSPECTION.splitlines()
+                     if not (left_out and line.strip().startswith(left_out)))
+
+
+class MprisHost:
+    """What the front end owning the queue provides to MprisService.
+
+    The defaults describe a player with no queue; override what applies.
+    """
+
+    can_raise = False
+    can_quit = False
+
+    def mpris_metadata(self) -> Dict[str, Any]:
+        """Metadata of the current track, keyed like _METADATA_TYPES."""
+        return {}
+
+    def mpris_play(self) -> None:
+        """Start or resume playback, picking a track if none is loaded."""
+
+    def mpris_next(self) -> None:
+        pass
+
+    def mpris_previous(self) -> None:
+        pass
+
+    def mpris_can_go_next(self) -> bool:
+        return False
+
+    def mpris_can_go_previous(self) -> bool:
+        return False
+
+    def mpris_shuffle(self) -> Optional[bool]:
+        """Whether the queue is shuffled, or None if it cannot be."""
+        return None
+
+    def mpris_set_shuffle(self, shuffle: bool) -> None:
+        pass
+
+    def mpris_loop_status(self) -> Optional[str]:
+        """'None', 'Track' or 'Playlist', or None if repeating is not offered."""
+        return None
+
+    def mpris_set_loop_status(self, status: str) -> None:
+        pass
+
+    def mpris_open_uri(self, uri: str) -> None:
+        pass
+
+    def mpris_raise(self) -> None:
+        pass
+
+    def mpris_quit(self) -> None:
+        pass
+
+
+class MprisService(PlayerObserver):
+    """Owns the MPRIS bus name and serves both MPRIS interfaces."""
+
+    def __init__(self, player: Player, host: MprisHost, bus_name: str = BUS_NAME):
+        self.player = player
+        self.host = host
+        self.connection: Optional[Gio.DBusConnection] = None
+        self.registrations = []
+        self.node_info = Gio.DBusNodeInfo.new_for_xml(introspection_xml(host))
+
+        self.playback_status = _PLAYBACK_STATUS[PLAYING if player.is_playing else STOPPED]
+        self._dirty: Dict[str, Set[str]] = {}
+        self._flush_id = 0
+        self._last_flush = 0.0
+
+        player.add_observer(self)
+        self.owner_id = Gio.bus_own_name(
+            Gio.BusType.SESSION, bus_name, Gio.BusNameOwnerFlags.NONE,
+            self.on_bus_acquired, None, self.on_name_lost,
+        )
+
+    def shutdown(self) -> None:
+        self.player.remove_observer(self)
+        if self._flush_id:
+            GLib.source_remove(self._flush_id)
+            self._flush_id = 0
+        if self.connection is not None:
+            for registration in self.registrations:
+                self.connection.unregister_object(registration)
+        self.registrations = []
+        Gio.bus_unown_name(self.owner_id)
+
+    def on_bus_acquired(self, connection: Gio.DBusConnection, name: str) -> None:
+        self.connection = connection
+        for interface in self.node_info.interfaces:
+            try:
+                self.registrations.append(connection.register_object(
+                    OBJECT_PATH, interface, self.on_method_call, self.on_get_property, self.on_set_property
+                ))
+            except GLib.Error as e:
+                logger.warning(f"Cannot export {interface.name}: {e.message}")
+
+    def on_name_lost(self, connection: Optional[Gio.DBusConnection], name: str) -> None:
+        if connection is None:
+            logger.info("No session bus; MPRIS is unavailable")
+        else:
+            logger.warning(f"Could not own {name}; another instance may be running")
+
+    # D-Bus calls
+
+    @tracing.traced(category='mpris', describe=lambda self, *args: args[4])
+    def on_method_call(self, connection, sender, object_path, interface_name, method_name,
+                       parameters, invocation) -> None:
+        player = self.player
+        if method_name == 'Raise':
+            self.host.mpris_raise()
+        elif method_name == 'Quit':
+            self.host.mpris_quit()
+        elif method_name == 'Next':
+            self.host.mpris_next()
+        elif method_name == 'Previous':
+            self.host.mpris_previous()
+        elif method_name == 'Pause':
+            if player.is_playing:
+                player.pause()
+        elif method_name == 'PlayPause':
+            if player.is_playing:
+                player.pause()
+            else:
+                self.host.mpris_play()
+        elif method_name == 'Stop':
+            player.stop()
+        elif method_name == 'Play':
+            if not player.is_playing:
+                self.host.mpris_play()
+        elif method_name == 'Seek':
+            (offset,) = parameters.unpack()
+            target = player.get_position() + offset * 1000
+            if target >= player.duration > 0:
+                self.host.mpris_next()
+            else:
+                player.seek(max(target, 0))
+        elif method_name == 'SetPosition':
+            track_path, position = parameters.unpack()
+            # Stale requests for another track are ignored, as the spec asks
+            if track_path == self.current_track_path() and 0 <= position * 1000 <= player.duration:
+                player.seek(position * 1000)
+        elif method_name == 'OpenUri':
+            (uri,) = parameters.unpack()
+            self.host.mpris_open_uri(uri)
+        invocation.return_value(None)
+
+    def on_get_property(self, connection, sender, object_path, interface_name, property_name):
+        return self.property_value(interface_name, property_name)
+
+    def on_set_property(self, connection, sender, object_path, interface_name, property_name, value) -> bool:
+        if property_name == 'Volume':
+            self.player.set_volume(max(0.0, min(value.get_double(), 1.0)))
+            return True
+        if property_name == 'Shuffle' and self.host.mpris_shuffle() is not None:
+            self.host.mpris_set_shuffle(value.get_boolean())
+            return True
+        if property_name == 'LoopStatus' and self.host.mpris_loop_status() is not None:
+            if value.get_string() not in LOOP_STATUSES:
+                return False
+            self.host.mpris_set_loop_status(value.get_string())
+            return True
+        # Rate is fixed at 1.0; accept and ignore writes of it
+        return property_name == 'Rate'
+
+    def property_value(self, interface_name: str, name: str) -> Optional[GLib.Variant]:
+        player = self.player
+        host = self.host
+        if interface_name == ROOT_INTERFACE:
+            values = {
+                'CanQuit': ('b', host.can_quit),
+                'CanRaise': ('b', host.can_raise),
+                'HasTrackList': ('b', False),
+                'Identity': ('s', 'Oscillate'),
+                'DesktopEntry': ('s', 'com.example.Oscillate'),
+                'SupportedUriSchemes': ('as', ['file']),
+                'SupportedMimeTypes': ('as', ['audio/mpeg', 'audio/flac', 'audio/ogg', 'audio/mp4',
+                                              'audio/x-wav']),
+            }
+        else:
+            values = {
+                'PlaybackStatus': ('s', self.playback_status),
+                'Rate': ('d', 1.0),
+                'MinimumRate': ('d', 1.0),
+                'MaximumRate': ('d', 1.0),
+                'Metadata': ('a{sv}', self.metadata()),
+                'Volume': ('d', 0.0 if player.is_muted else player.volume),
+                'Shuffle': ('b', host.mpris_shuffle()),
+                'LoopStatus': ('s', host.mpris_loop_status()),
+                'Position': ('x', player.get_position() // 1000),
+                'CanGoNext': ('b', host.mpris_can_go_next()),
+                'CanGoPrevious': ('b', host.mpris_can_go_previous()),
+                'CanPlay': ('b', True),
+                'CanPause': ('b', True),
+                'CanSeek': ('b', player.duration > 0),
+                'CanControl': ('b', True),
+            }
+        entry = values.get(name)
+        # Optional properties the host does not offer are left out
+        return None if entry is None or entry[1] is None else GLib.Variant(*entry)
+
+    def metadata(self) -> Dict[str, GLib.Variant]:
+        metadata = self.host.mpris_metadata()
+        if self.player.duration > 0:
+            metadata['mpris:length'] = self.player.duration // 1000
+        metadata.setdefault('mpris:trackid', NO_TRACK)
+        return {key: GLib.Variant(_METADATA_TYPES[key], value)
+                for key, value in metadata.items() if key in _METADATA_TYPES}
+
+    def current_track_path(self) -> str:
+        return self.host.mpris_metadata().get('mpris:trackid', NO_TRACK)
+
+    # Coalesced PropertiesChanged
+
+    def invalidate(self, interface_name: str, *names: str) -> None:
+        """Mark properties as changed; they are sent together shortly."""
+        self._dirty.setdefault(interface_name, set()).update(names)
+        if self._flush_id:
+            return
+        wait_ms = max(0, int(COALESCE_MS - (time.monotonic() - self._last_flush) * 1000))
+        self._flush_id = tracing.timeout_add(wait_ms, self.flush, priority=GLib.PRIORITY_DEFAULT_IDLE)
+
+    def flush(self) -> bool:
+        self._flush_id = 0
+        self._last_flush = time.monotonic()
+        dirty, self._dirty = self._dirty, {}
+        if self.connection is None:
+            return False
+        for interface_name, names in dirty.items():
+            changed = {}
+            for name in sorted(names):
+                value = self.property_value(interface_name, name)
+                if value is not None:
+                    changed[name] = value
+            self.emit('org.freedesktop.DBus.Properties', 'PropertiesChanged',
+                      GLib.Variant('(sa{sv}as)', (interface_name, changed, [])))
+        return False
+
+    def emit(self, interface_name: str, signal_name: str, parameters: GLib.Variant) -> None:
+        try:
+            self.connection.emit_signal(None, OBJECT_PATH, interface_name, signal_name, parameters)
+        except GLib.Error as e:
+            logger.warning(f"Could not emit {signal_name}: {e.message}")
+
+    # Player events
+
+    def on_playback_state_changed(self, state: str) -> None:
+        self.playback_status = _PLAYBACK_STATUS[state]
+        self.invalidate(PLAYER_INTERFACE, 'PlaybackStatus')
+
+    def on_track_changed(self, file_path: str) -> None:
+        self.invalidate(PLAYER_INTERFACE, 'Metadata', 'CanGoNext', 'CanGoPrevious', 'CanSeek')
+
+    def on_duration_changed(self, duration: int) -> None:
+        self.invalidate(PLAYER_INTERFACE, 'Metadata', 'CanSeek')
+
+    def on_volume_changed(self, volume: float, muted: bool) -> None:
+        self.invalidate(PLAYER_INTERFACE, 'Volume')
+
+    def on_seeked(self, position: int) -> None:
+        if self.connection is not None:
+            self.emit(PLAYER_INTERFACE, 'Seeked', GLib.Variant('(x)', (position // 1000,)))
@@ -1,81 +1,273 @@
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import Gst, GLib
+from gi.repository import Gst, GLib, Gio
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+import logging
+import threading
 import time
 
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Playback states reported to observers
+PLAYING = 'playing'
+PAUSED = 'paused'
+STOPPED = 'stopped'
+
+
+class PlayerObserver:
+    """Receives Player events, always on the main loop.
+
+    Every method does nothing by default; override the ones you need.
+    Any object with some of these methods can be an observer, which is how
+    the window takes part without importing GStreamer at startup.
+    """
+
+    def on_playback_state_changed(self, state: str) -> None:
+        """Playback became PLAYING, PAUSED or STOPPED."""
+
+    def on_track_changed(self, file_path: str) -> None:
+        """A different file started, through play() or gaplessly."""
+
+    def on_gapless_track_started(self, track_id: int) -> None:
+        """The track from next_track() took over without stopping."""
+
+    def on_stream_started(self) -> None:
+        """The track given to play() decoded and reached PLAYING."""
+
+    def on_duration_changed(self, duration: int) -> None:
+        """The current track's duration (ns) became known or changed."""
+
+    def on_seeked(self, position: int) -> None:
+        """Playback jumped to position (ns)."""
+
+    def on_volume_changed(self, volume: float, muted: bool) -> None:
+        """Volume or mute changed."""
+
+    def on_end_of_stream(self) -> None:
+        """The current track ended and nothing was queued after it."""
+
+    def on_error(self, message: str) -> None:
+        """The pipeline failed; playback has stopped."""
+
+
 class Player:
-    def __init__(self, window):
-        self.window = window
+    """The playback engine: GStreamer pipelines, gapless and ReplayGain.
+
+    Player knows nothing about widgets. Front ends register PlayerObservers
+    and drive it through play(), pause(), seek() and set_volume(), so the
+    window and the headless mode share the same engine.
+    """
+
+    # Paused pipelines kept ready for the likely next and previous tracks
+    PREROLL_LIMIT = 2
+
+    # A seek whose ASYNC_DONE has not come by then no longer holds others back
+    SEEK_TIMEOUT_S = 1.0
+
+    def __init__(self, audio_sink: Optional[str] = None):
+        self.observers: List[PlayerObserver] = []
         self.current_file = None
         self.is_playing = False
         self.duration = 0
         self.volume = 1.0
         self.is_muted = False
-        self.volume_before_mute = 1.0
+
+        # Pipeline description of the audio sink; None lets playbin choose
+        self.audio_sink = audio_sink
+
+        # Gapless playback: the next track is queued from a streaming thread
+        # in about-to-finish and becomes current when its stream starts.
+        # next_track() -> (track id, path, duration in ns or 0) or None says
+        # what comes next
+        self.settings = Gio.Settings.new("com.example.Oscillate")
+        self.gapless_lock = threading.Lock()
+        self.gapless_next = None
+        self.next_track: Optional[Callable[[], Optional[Tuple[int, str, int]]]] = None
+
+        # ReplayGain: gains measured by the loudness analyser, looked up by
+        # path through gain_lookup(path) -> (track gain, album gain) or None
+        self.gain_lookup = None
+
+        # Seeks are coalesced: while one is in flight (or the pipeline is
+        # still pre-rolling) only the newest target (ns) waits, and it is sent
+        # on ASYNC_DONE. This also carries the resume offset of a new track
+        self.pending_seek = None
+        self.seek_sent = None
+        self.seek_position = 0
+        self.prerolling = False
+        self.settings.connect('changed::replaygain-mode', self.on_replaygain_mode_changed)
+
+        # Accurate seeking lands on the exact frame; MP3 seek indexes,
+        # built in the background, say where a key-unit seek already would
+        self.seek_indexes = None
+        self.settings.connect('changed::accurate-seeking', self.on_accurate_seeking_changed)
+
+        # Pre-rolled pipelines by file path, and seconds from play() until
+        # the pipeline reached PLAYING for recent track changes
+        self.prerolled = {}
+        self.bus_handlers = {}
+        self.skip_started = None
+        self.skip_to_playing = deque(maxlen=100)
 
         # Initialize GStreamer
         Gst.init(None)
 
         # Create playbin element
-        self.playbin = Gst.ElementFactory.make('playbin', 'player')
+        self.playbin = self.create_playbin()
         if not self.playbin:
-            print("Error: Could not create playbin")
-            return
-
-        # Set initial volume
-        self.playbin.set_property('volume', self.volume)
+            logger.error("Could not create playbin")
+
+    def add_observer(self, observer: PlayerObserver) -> None:
+        self.observers.append(observer)
+
+    def remove_observer(self, observer: PlayerObserver) -> None:
+        self.observers.remove(observer)
+
+    def notify(self, event: str, *args) -> None:
+        # Observers need not subclass PlayerObserver; missing methods are skipped
+        for observer in list(self.observers):
+            handler = getattr(observer, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def create_playbin(self):
+        """Create a playbin wired to this player's bus handler."""
+        playbin = Gst.ElementFactory.make('playbin', None)
+        if not playbin:
+            return None
+
+        playbin.set_property('volume', 0 if self.is_muted else self.volume)
+        if self.audio_sink:
+            try:
+                playbin.set_property('audio-sink', Gst.parse_bin_from_description(self.audio_sink, True))
+            except GLib.Error as e:
+                logger.warning(f"Cannot use audio sink '{self.audio_sink}': {e.message}")
 
         # Create bus to get events from GStreamer pipeline
-        bus = self.playbin.get_bus()
+        bus = playbin.get_bus()
         bus.add_signal_watch()
-        bus.connect('message', self.on_message)
-
-        # Connect controls
-        self.window.song_progress_scale.connect('change-value', self.on_seek)
-        self.window.volume_scale.connect('value-changed', self.on_volume_changed)
-        self.window.mute_button.connect('clicked', self.on_mute_clicked)
-
-        # Start position update timer
-        GLib.timeout_add(200, self.update_position)
-
-    def on_volume_changed(self, widget):
-        """Handle volume slider changes"""
-        self.volume = widget.get_value()
-        self.playbin.set_property('volume', self.volume)
-
-        # Update mute button icon based on volume level
-        self.update_volume_icon()
-
-    def on_mute_clicked(self, button):
-        """Handle mute button clicks"""
-        if self.is_muted:
-            # Unmute
-            self.is_muted = False
-            self.playbin.set_property('volume', self.volume_before_mute)
-            self.window.volume_scale.set_value(self.volume_before_mute)
+        self.bus_handlers[playbin] = bus.connect('message', self.on_message, playbin)
+
+        playbin.connect('about-to-finish', self.on_about_to_finish)
+        return playbin
+
+    def dispose_playbin(self, playbin):
+        """Shut a pipeline down and drop its bus watch."""
+        playbin.set_state(Gst.State.NULL)
+        bus = playbin.get_bus()
+        handler = self.bus_handlers.pop(playbin, None)
+        if handler is not None:
+            bus.disconnect(handler)
+        bus.remove_signal_watch()
+
+    def preroll(self, file_paths):
+        """Keep paused pipelines ready for the given tracks, dropping others.
+
+        A later play() of one of these paths only has to swap pipelines and
+        go from PAUSED to PLAYING: the file is open, the decoder is set up and
+        the first buffers are already waiting in the sink.
+        """
+        wanted = [path for path in file_paths if path and path != self.current_file]
+        wanted = wanted[:self.PREROLL_LIMIT]
+
+        for path in list(self.prerolled):
+            if path not in wanted:
+                self.dispose_playbin(self.prerolled.pop(path))
+
+        for path in wanted:
+            if path in self.prerolled:
+                continue
+            playbin = self.create_playbin()
+            if not playbin:
+                return
+            playbin.set_property('uri', Gst.filename_to_uri(path))
+            self.configure_replaygain(playbin, path)
+            playbin.set_state(Gst.State.PAUSED)
+            self.prerolled[path] = playbin
+
+    def recycle_playbin(self, playbin, file_path, reusable):
+        """Keep the pipeline we switched away from as a pre-roll if we can."""
+        _, state, _ = playbin.get_state(0)
+        if (reusable and file_path and len(self.prerolled) < self.PREROLL_LIMIT
+                and state in (Gst.State.PAUSED, Gst.State.PLAYING)):
+            playbin.set_state(Gst.State.PAUSED)
+            playbin.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT, 0)
+            self.prerolled[file_path] = playbin
         else:
-            # Mute
-            self.is_muted = True
-            self.volume_before_mute = self.volume
-            self.playbin.set_property('volume', 0)
-            self.window.volume_scale.set_value(0)
-
-        self.update_volume_icon()
-
-    def update_volume_icon(self):
-        """Update the volume button icon based on current volume state"""
-        if self.is_muted or self.volume == 0:
-            icon_name = "audio-volume-muted-symbolic"
-        elif self.volume < 0.3:
-            icon_name = "audio-volume-low-symbolic"
-        elif self.volume < 0.7:
-            icon_name = "audio-volume-medium-symbolic"
-        else:
-            icon_name = "audio-volume-high-symbolic"
+            self.dispose_playbin(playbin)
+
+    def configure_replaygain(self, playbin, file_path):
+        """Set up gain adjustment for the track a stopped pipeline will play.
 
-        self.window.mute_button.set_icon_name(icon_name)
+        rgvolume prefers gain tags in the file itself and falls back to the
+        gain the loudness analyser measured; rglimiter catches clipping.
+        """
+        mode = self.settings.get_string('replaygain-mode')
+        if mode == 'off':
+            playbin.set_property('audio-filter', None)
+            return
 
-    def format_time(self, duration):
+        replaygain = playbin.get_property('audio-filter')
+        if replaygain is None:
+            try:
+                replaygain = Gst.parse_bin_from_description('rgvolume name=rgvolume ! rglimiter', True)
+            except GLib.Error as e:
+                logger.warning(f"ReplayGain unavailable: {e.message}")
+                return
+            playbin.set_property('audio-filter', replaygain)
+        self.apply_gain(replaygain, file_path, mode)
+
+    def apply_gain(self, replaygain, file_path, mode):
+        rgvolume = replaygain.get_by_name('rgvolume')
+        rgvolume.set_property('album-mode', mode == 'album')
+
+        fallback_gain = 0.0
+        gains = self.gain_lookup(file_path) if self.gain_lookup and file_path else None
+        if gains is not None:
+            track_gain, album_gain = gains
+            fallback_gain = album_gain if mode == 'album' and album_gain is not None else track_gain
+        rgvolume.set_property('fallback-gain', fallback_gain)
+
+    def on_replaygain_mode_changed(self, settings, key):
+        """Drop pre-rolls; the playing track keeps its filter until the next one."""
+        for playbin in self.prerolled.values():
+            self.dispose_playbin(playbin)
+        self.prerolled.clear()
+
+        mode = settings.get_string(key)
+        replaygain = self.playbin.get_property('audio-filter')
+        if replaygain is not None and mode != 'off':
+            self.apply_gain(replaygain, self.current_file, mode)
+
+    def shutdown(self):
+        """Release every pipeline."""
+        if self.seek_indexes is not None:
+            self.seek_indexes.shutdown()
+        for playbin in self.prerolled.values():
+            self.dispose_playbin(playbin)
+        self.prerolled.clear()
+        self.dispose_playbin(self.playbin)
+
+    def set_volume(self, volume):
+        """Set the volume (0 to 1); changing it also ends a mute."""
+        self.volume = volume
+        self.is_muted = False
+        self.playbin.set_property('volume', volume)
+        self.notify('on_volume_changed', self.volume, self.is_muted)
+
+    def set_muted(self, muted):
+        self.is_muted = muted
+        self.playbin.set_property('volume', 0 if muted else self.volume)
+        self.notify('on_volume_changed', self.volume, self.is_muted)
+
+    def toggle_mute(self):
+        self.set_muted(not self.is_muted)
+
+    @staticmethod
+    def format_time(duration):
         if duration == 0:
             return "00:00"
         seconds = int(duration / Gst.SECOND)
@@ -83,39 +275,81 @@ class Player:
         seconds = seconds % 60
         return f"{minutes:02d}:{seconds:02d}"
 
+    @tracing.traced(category='player')
+    def play(self, file_path=None, start_position=0, duration=0):
+        """Play a file from the start or from start_position (ns), or resume.
 
-    def play(self, file_path=None):
+        duration (ns) is the length read from the tags, if known. It is shown
+        straight away; the pipeline only corrects it once it has pre-rolled.
+        """
         if file_path:
+            self.skip_started = time.monotonic()
+            self.pending_seek = self.seek_sent = None
+            self.prerolling = False
+            self.request_seek_index(file_path)
+            with self.gapless_lock:
+                reusable = self.gapless_next is None
+                self.gapless_next = None
+
+            prerolled = self.prerolled.pop(file_path, None)
+            if prerolled is not None:
+                # Swap in the paused pipeline; the old one may become a pre-roll
+                previous, self.playbin = self.playbin, prerolled
+                self.recycle_playbin(previous, self.current_file, reusable)
+            else:
+                self.playbin.set_state(Gst.State.NULL)
+                self.playbin.set_property('uri', Gst.filename_to_uri(file_path))
+                self.configure_replaygain(self.playbin, file_path)
+                # Seeking has to wait until the pipeline has pre-rolled
+                self.prerolling = True
             self.current_file = file_path
-            self.playbin.set_state(Gst.State.NULL)
-            self.playbin.set_property('uri', f'file://{file_path}')
-
-            # Reset labels and slider
-            self.window.time_position_label.set_label("00:00")
-            self.window.time_duration_label.set_label("00:00")
-            self.window.song_progress_scale.set_value(0)
+            self.duration = duration
 
             # Restore volume settings for new track
             self.playbin.set_property('volume', 0 if self.is_muted else self.volume)
-
-            # Query duration after a short delay
-            GLib.timeout_add(100, self.query_duration)
+            self.notify('on_track_changed', file_path)
+            if duration > 0:
+                # The length from the tags, until the pipeline reports its own
+                self.notify('on_duration_changed', duration)
+            if prerolled is not None:
+                # No ASYNC_DONE will follow for a pipeline that is already paused
+                self.query_duration()
+            if start_position:
+                self.seek(start_position)
 
         self.playbin.set_state(Gst.State.PLAYING)
         self.is_playing = True
-        self.window.play_button.set_icon_name("media-playback-pause-symbolic")
+        self.notify('on_playback_state_changed', PLAYING)
 
     def pause(self):
         self.playbin.set_state(Gst.State.PAUSED)
         self.is_playing = False
-        self.window.play_button.set_icon_name("media-playback-start-symbolic")
+        self.notify('on_playback_state_changed', PAUSED)
 
     def stop(self):
+        with self.gapless_lock:
+            self.gapless_next = None
+        self.pending_seek = self.seek_sent = None
+        self.prerolling = False
         self.playbin.set_state(Gst.State.NULL)
         self.is_playing = False
-        self.window.play_button.set_icon_name("media-playback-start-symbolic")
-        self.window.song_progress_scale.set_value(0)
-        self.window.time_position_label.set_label("00:00")
+        self.notify('on_playback_state_changed', STOPPED)
+
+    def query_position(self):
+        """(success, position in nanoseconds) of the current pipeline."""
+        return self.playbin.query_position(Gst.Format.TIME)
+
+    def get_position(self):
+        """Playback position in nanoseconds, or 0 when unknown.
+
+        While a seek is waiting or in flight, this is where it is going.
+        """
+        if self.pending_seek is not None:
+            return self.pending_seek
+        if self.seek_sent is not None:
+            return self.seek_position
+        success, position = self.query_position()
+        return position if success else 0
 
     def toggle_playback(self):
         if self.is_playing:
@@ -123,71 +357,143 @@ class Player:
         else:
             self.play()
 
+    @tracing.traced(category='seek')
+    def seek(self, position):
+        """Jump to position (ns) in the current track; False if not possible.
+
+        If a seek is still in flight this one waits, replacing any other
+        that was waiting, until that seek completes.
+        """
+        if self.duration == 0 and not self.prerolling:
+            return False
+        if self.duration:
+            position = min(int(position), self.duration)
+        position = max(0, int(position))
+        if self.prerolling or (self.seek_sent is not None
+                               and time.monotonic() - self.seek_sent < self.SEEK_TIMEOUT_S):
+            self.pending_seek = position
+            return True
+        self.pending_seek = None
+        return self.send_seek(position)
+
+    def send_seek(self, position):
+        """Issue a flushing seek now; ASYNC_DONE reports when it is done."""
+        if not self.playbin.seek_simple(Gst.Format.TIME, self.seek_flags(position), position):
+            self.seek_sent = None
+            return False
+        self.seek_sent = time.monotonic()
+        self.seek_position = position
+        self.notify('on_seeked', position)
+        return True
+
+    def seek_flags(self, position):
+        """Key-unit seeks, or accurate ones unless the seek index shows they would land anyway."""
+        flags = Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT
+        if not self.settings.get_boolean('accurate-seeking'):
+            return flags
+        index = self.seek_indexes.get(self.current_file) if self.seek_indexes is not None else None
+        if index is not None and index.key_unit_lands(position / Gst.SECOND):
+            return flags
+        return Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE
+
+    def request_seek_index(self, file_path):
+        """Start building the seek index of a track that is about to play."""
+        if not file_path or not self.settings.get_boolean('accurate-seeking'):
+            return
+        if self.seek_indexes is None:
+            from .seekindex import SeekIndexLoader
+            self.seek_indexes = SeekIndexLoader()
+        self.seek_indexes.request(file_path)
+
+    def on_accurate_seeking_changed(self, settings, key):
+        self.request_seek_index(self.current_file)
+
     def query_duration(self):
+        """Correct the duration with the one the pipeline reports, if any."""
         success, duration = self.playbin.query_duration(Gst.Format.TIME)
-        if success:
+        if success and duration > 0 and duration != self.duration:
             self.duration = duration
-            self.window.song_progress_scale.set_range(0, float(duration) / Gst.SECOND)
-            duration_str = self.format_time(duration)
-            self.window.time_duration_label.set_label(duration_str)
-            return False
-        return True
+            self.notify('on_duration_changed', duration)
 
-    def on_message(self, bus, message):
+    def on_about_to_finish(self, playbin):
+        """Queue the next track into the running pipeline.
+
+        Runs on a GStreamer streaming thread. Setting the uri here lets
+        playbin switch streams sample-continuously, without a state change.
+        """
+        if not self.settings.get_boolean("gapless-playback") or self.next_track is None:
+            return
+
+        next_track = self.next_track()
+        if next_track is None:
+            return
+
+        track_id, file_path, duration = next_track
+        with self.gapless_lock:
+            self.gapless_next = (track_id, file_path, duration)
+        playbin.set_property('uri', Gst.filename_to_uri(file_path))
+
+    @tracing.traced('Player.on_message', 'gstreamer',
+                    describe=lambda self, bus, message, playbin: message.type.first_value_nick)
+    def on_message(self, bus, message, playbin):
         t = message.type
 
+        if playbin is not self.playbin:
+            # A pre-rolled pipeline; all that matters is whether it broke
+            if t == Gst.MessageType.ERROR:
+                for path, candidate in list(self.prerolled.items()):
+                    if candidate is playbin:
+                        self.dispose_playbin(self.prerolled.pop(path))
+            return
+
         if t == Gst.MessageType.ERROR:
             self.playbin.set_state(Gst.State.NULL)
+            self.pending_seek = self.seek_sent = None
+            self.prerolling = False
             err, debug = message.parse_error()
-            print(f"Error: {err}, {debug}")
+            logger.error(f"Playback error: {err.message} ({debug})")
             self.is_playing = False
+            self.notify('on_playback_state_changed', STOPPED)
+            self.notify('on_error', err.message)
 
         elif t == Gst.MessageType.EOS:
             # End of stream - play next track
             self.stop()
-            self.window.play_next_track()
+            self.notify('on_end_of_stream')
+
+        elif t == Gst.MessageType.STREAM_START:
+            with self.gapless_lock:
+                next_track, self.gapless_next = self.gapless_next, None
+            if next_track is not None:
+                # A queued track took over from the previous one
+                track_id, self.current_file, self.duration = next_track
+                self.request_seek_index(self.current_file)
+                replaygain = self.playbin.get_property('audio-filter')
+                if replaygain is not None:
+                    self.apply_gain(replaygain, self.current_file,
+                                    self.settings.get_string('replaygain-mode'))
+                self.notify('on_track_changed', self.current_file)
+                self.notify('on_duration_changed', self.duration)
+                self.notify('on_gapless_track_started', track_id)
+                self.query_duration()
 
         elif t == Gst.MessageType.ASYNC_DONE:
+            # Pre-roll or the last seek finished; send the one that waited
+            self.seek_sent = None
+            self.prerolling = False
             self.query_duration()
+            if self.pending_seek is not None:
+                position, self.pending_seek = self.pending_seek, None
+                self.seek(position)
+
+        elif t == Gst.MessageType.STATE_CHANGED and message.src == self.playbin:
+            _, new_state, _ = message.parse_state_changed()
+            if new_state == Gst.State.PLAYING and self.skip_started is not None:
+                latency = time.monotonic() - self.skip_started
+                self.skip_started = None
+                self.skip_to_playing.append(latency)
+                logger.debug(f"Skip to PLAYING: {latency * 1000:.1f} ms")
+                self.notify('on_stream_started')
 
         elif t == Gst.MessageType.DURATION_CHANGED:
-            # Get the duration
-            success, self.duration = self.playbin.query_duration(Gst.Format.TIME)
-            if success:
-                # Convert to seconds
-                self.duration = self.duration / Gst.SECOND
-                self.window.song_progress_scale.set_range(0, self.duration)
-
-    def update_position(self):
-        if not self.is_playing:
-            return True
-
-        success, position = self.playbin.query_position(Gst.Format.TIME)
-        if success:
-            position_str = self.format_time(position)
-            self.window.time_position_label.set_label(position_str)
-
-            if self.duration > 0:
-                value = float(position) / Gst.SECOND
-                self.window.song_progress_scale.set_value(value)
-
-        return True
-
-    def on_seek(self, widget, scroll_type, value):
-        if not self.is_playing or self.duration == 0:
-            return False
-
-        value = max(0, min(value, float(self.duration) / Gst.SECOND))
-        position = value * Gst.SECOND
-
-        position_str = self.format_time(position)
-        self.window.time_position_label.set_label(position_str)
-
-        # Perform seek
-        self.playbin.seek_simple(
-            Gst.Format.TIME,
-            Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT,
-            position
-        )
-
-        return True
+            self.query_duration()
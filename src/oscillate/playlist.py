@@ -0,0 +1,281 @@
+"""
+Oscillate Media Player - Playlist Model
+This module contains the lightweight track objects held by the playlist model,
+the recycled row widgets the playlist view renders them with and the headers
+of album sections.
+"""
+
+from typing import Iterable, List, Tuple
+
+from gi.repository import Gtk, Gio, GLib, GObject, Pango
+
+from . import tracing
+from .metadata import SongMetadata
+from .trackstore import TrackStore
+
+UNKNOWN_ALBUM = 'Unknown Album'
+
+# Album sections need GTK 4.12; older versions show the list without headers
+_SECTION_MODEL = (Gtk.SectionModel,) if hasattr(Gtk, 'SectionModel') else ()
+HAVE_SECTIONS = bool(_SECTION_MODEL)
+
+
+def format_duration(seconds: float) -> str:
+    """M:SS, or H:MM:SS from an hour up; empty when unknown."""
+    if seconds <= 0:
+        return ''
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class Track(GObject.Object):
+    """Handle to one track in a TrackStore.
+
+    These are created on demand for the rows GTK asks about and carry nothing
+    but the store and the track id; all data is read from the store.
+    """
+
+    __gtype_name__ = 'OscillateTrack'
+
+    def __init__(self, store: TrackStore, track_id: int):
+        super().__init__()
+        self.store = store
+        self.track_id = track_id
+
+    @property
+    def title(self) -> str:
+        return self.store.title(self.track_id)
+
+    @property
+    def artist(self) -> str:
+        return self.store.artist(self.track_id)
+
+    @property
+    def album(self) -> str:
+        return self.store.album(self.track_id)
+
+    @property
+    def duration(self) -> float:
+        return self.store.duration(self.track_id)
+
+    @property
+    def file_path(self) -> str:
+        return self.store.file_path(self.track_id)
+
+    @property
+    def is_duplicate(self) -> bool:
+        return self.track_id in self.store.duplicates
+
+
+class TrackListModel(GObject.Object, Gio.ListModel, *_SECTION_MODEL):
+    """Gio.ListModel view of a TrackStore in playlist order.
+
+    All playlist mutations go through here so the view is notified once per
+    change. With group_by_album set, each run of tracks from the same album
+    is a section, which the view gives a header.
+    """
+
+    __gtype_name__ = 'OscillateTrackListModel'
+
+    def __init__(self, store: TrackStore):
+        super().__init__()
+        self.store = store
+        self.group_by_album = False
+
+    def do_get_item_type(self) -> GObject.GType:
+        return Track.__gtype__
+
+    def do_get_n_items(self) -> int:
+        return len(self.store)
+
+    def do_get_item(self, position: int):
+        if position >= len(self.store):
+            return None
+        return Track(self.store, self.store.id_at(position))
+
+    def do_get_section(self, position: int) -> Tuple[int, int]:
+        store = self.store
+        count = len(store)
+        if position >= count:
+            return count, GLib.MAXUINT
+        if not self.group_by_album:
+            return 0, count
+        # Album names are interned, so runs are found by comparing neighbours
+        album = store.album(store.id_at(position))
+        start = position
+        while start > 0 and store.album(store.id_at(start - 1)) == album:
+            start -= 1
+        end = position + 1
+        while end < count and store.album(store.id_at(end)) == album:
+            end += 1
+        return start, end
+
+    @tracing.traced(category='playlist')
+    def append(self, songs: Iterable[SongMetadata]) -> List[int]:
+        """Append songs and return their new track ids."""
+        position = len(self.store)
+        track_ids = self.store.extend(songs)
+        if track_ids:
+            self.items_changed(position, 0, len(track_ids))
+        return track_ids
+
+    @tracing.traced(category='playlist')
+    def extend_columns(self, *columns) -> range:
+        """Append tracks given column by column (see TrackStore.extend_columns)."""
+        position = len(self.store)
+        track_ids = self.store.extend_columns(*columns)
+        if track_ids:
+            self.items_changed(position, 0, len(track_ids))
+        return track_ids
+
+    def rows_changed(self, track_ids: Iterable[int]) -> None:
+        """Have the view rebind the rows of tracks whose data changed."""
+        for track_id in track_ids:
+            position = self.store.position_of(track_id)
+            if position >= 0:
+                self.items_changed(position, 1, 1)
+
+    @tracing.traced(category='playlist')
+    def reorder(self, track_ids: List[int]) -> None:
+        """Show the playlist in a new order with one items-changed notification."""
+        count = len(self.store)
+        self.store.reorder(track_ids)
+        if count:
+            self.items_changed(0, count, count)
+
+    @tracing.traced(category='playlist')
+    def remove_positions(self, positions: List[int]) -> List[int]:
+        """Remove many songs with a single items-changed notification.
+
+        The notification spans from the first to the last removed position;
+        the songs in between that stay are reported as re-added.
+        """
+        if not positions:
+            return []
+        first, last = min(positions), max(positions)
+        track_ids = self.store.remove_positions(positions)
+        span = last - first + 1
+        self.items_changed(first, span, span - len(track_ids))
+        return track_ids
+
+
+class SongRow(Gtk.Box):
+    """Row widget for the playlist view. Built once and rebound as it scrolls."""
+
+    def __init__(self):
+        super().__init__(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.set_margin_start(6)
+        self.set_margin_end(6)
+        self.set_margin_top(6)
+        self.set_margin_bottom(6)
+
+        text = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=3, hexpand=True)
+        self.append(text)
+
+        # Song title with ellipsis
+        self.title_label = Gtk.Label()
+        self.title_label.set_halign(Gtk.Align.START)
+        self.title_label.set_ellipsize(Pango.EllipsizeMode.END)
+        self.title_label.add_css_class("heading")
+        text.append(self.title_label)
+
+        # Artist name with ellipsis
+        self.artist_label = Gtk.Label()
+        self.artist_label.set_halign(Gtk.Align.START)
+        self.artist_label.set_ellipsize(Pango.EllipsizeMode.END)
+        self.artist_label.add_css_class("caption")
+        self.artist_label.add_css_class("dim-label")
+        text.append(self.artist_label)
+
+        # Shown for songs whose audio is already elsewhere in the playlist
+        self.duplicate_icon = Gtk.Image.new_from_icon_name("edit-copy-symbolic")
+        self.duplicate_icon.set_tooltip_text("Duplicate of another song in the playlist")
+        self.duplicate_icon.add_css_class("dim-label")
+        self.append(self.duplicate_icon)
+
+        # Duration from the tags, read when the song was added
+        self.duration_label = Gtk.Label()
+        self.duration_label.set_valign(Gtk.Align.CENTER)
+        self.duration_label.add_css_class("caption")
+        self.duration_label.add_css_class("dim-label")
+        self.duration_label.add_css_class("numeric")
+        self.append(self.duration_label)
+
+    def bind(self, track: Track) -> None:
+        self.title_label.set_label(track.title)
+        self.artist_label.set_label(track.artist)
+        self.duration_label.set_label(format_duration(track.duration))
+        self.duplicate_icon.set_visible(track.is_duplicate)
+
+
+class AlbumHeader(Gtk.Box):
+    """Header above the tracks of one album."""
+
+    def __init__(self):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+        self.set_margin_start(6)
+        self.set_margin_end(6)
+        self.set_margin_top(12)
+        self.set_margin_bottom(3)
+
+        self.album_label = Gtk.Label()
+        self.album_label.set_halign(Gtk.Align.START)
+        self.album_label.set_ellipsize(Pango.EllipsizeMode.END)
+        self.album_label.add_css_class("title-4")
+        self.append(self.album_label)
+
+        self.artist_label = Gtk.Label()
+        self.artist_label.set_halign(Gtk.Align.START)
+        self.artist_label.set_ellipsize(Pango.EllipsizeMode.END)
+        self.artist_label.add_css_class("caption")
+        self.artist_label.add_css_class("dim-label")
+        self.append(self.artist_label)
+
+    def bind(self, track: Track) -> None:
+        self.album_label.set_label(track.album or UNKNOWN_ALBUM)
+        self.artist_label.set_label(track.artist)
+
+
+def create_song_row_factory() -> Gtk.SignalListItemFactory:
+    """Factory that recycles SongRow widgets for the playlist view."""
+    factory = Gtk.SignalListItemFactory()
+    factory.connect('setup', _on_setup_song_row)
+    factory.connect('bind', _on_bind_song_row)
+    return factory
+
+
+def _on_setup_song_row(factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem) -> None:
+    row = SongRow()
+
+    # Like the old ListBox, a plain single click plays the song; clicks with
+    # modifiers are left to the view for extending the selection
+    click = Gtk.GestureClick()
+    click.connect('released', _on_song_row_clicked, list_item)
+    row.add_controller(click)
+
+    list_item.set_child(row)
+
+
+def _on_bind_song_row(factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem) -> None:
+    list_item.get_child().bind(list_item.get_item())
+
+
+def create_album_header_factory() -> Gtk.SignalListItemFactory:
+    """Factory for the album headers shown while grouping by album."""
+    factory = Gtk.SignalListItemFactory()
+    factory.connect('setup', lambda factory, header: header.set_child(AlbumHeader()))
+    factory.connect('bind', lambda factory, header: header.get_child().bind(header.get_item()))
+    return factory
+
+
+def _on_song_row_clicked(gesture: Gtk.GestureClick, n_press: int, x: float, y: float,
+                         list_item: Gtk.ListItem) -> None:
+    modifiers = gesture.get_current_event_state() & Gtk.accelerator_get_default_mod_mask()
+    if n_press != 1 or modifiers:
+        return
+    gesture.get_widget().activate_action(
+        'list.activate-item', GLib.Variant.new_uint32(list_item.get_position())
+    )
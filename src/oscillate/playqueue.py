@@ -0,0 +1,290 @@
+"""
+Oscillate Media Player - Play Queue
+This module decides which track plays after the current one, independently
+of the order the playlist is shown in: shuffle, repeat-all and repeat-one, a
+queue of songs to play next, and a bounded history for going back.
+
+Shuffle is a Fisher-Yates permutation generated one draw at a time. The
+tracks not yet played this round sit in an array with a reverse index; a draw
+swaps a random entry to the end and pops it, an added track is appended and a
+removed one is swapped out, so none of them walks the playlist. Only starting
+a new round does, once per round. Removed tracks left in the history or the
+play-next queue are dropped when they come up.
+"""
+
+from array import array
+from collections import deque
+from typing import Iterable, Optional
+import random
+
+from .trackstore import TrackStore
+
+# Repeat modes, as stored in the repeat-mode setting
+REPEAT_NONE = 'none'
+REPEAT_ALL = 'all'
+REPEAT_ONE = 'one'
+REPEAT_MODES = (REPEAT_NONE, REPEAT_ALL, REPEAT_ONE)
+
+# Tracks remembered for going back, and for going forward again after that
+HISTORY_SIZE = 500
+
+# Where the next track comes from
+_FORWARD = 'forward'
+_QUEUED = 'queued'
+_SHUFFLE = 'shuffle'
+_ORDER = 'order'
+
+
+class PlayQueue:
+    """Order of play over the track ids of a TrackStore.
+
+    The next track is worked out ahead of time on the main thread whenever
+    something changes, so peek_next() only reads an attribute and is safe to
+    call from GStreamer's streaming thread for gapless playback.
+    """
+
+    def __init__(self, store: TrackStore, rng: Optional[random.Random] = None):
+        self.store = store
+        self.random = rng or random.Random()
+        self.shuffle = False
+        self.repeat = REPEAT_NONE
+        self.current = -1
+        self.history: deque = deque(maxlen=HISTORY_SIZE)
+        self.queued: deque = deque()
+        # Tracks gone back over, which come next until something else is picked
+        self._forward: deque = deque(maxlen=HISTORY_SIZE)
+        # Playlist order carries on from this track and its last known
+        # position, which still points at its neighbour once it is removed
+        self._anchor = -1
+        self._anchor_position = -1
+        # Shuffle round: tracks not drawn yet, and track id -> index in it
+        self._pool = array('i')
+        self._slots = array('i')
+        self._upcoming = -1
+        self._upcoming_source: Optional[str] = None
+
+    # Reading
+
+    def peek_next(self) -> int:
+        """The track to play when the current one ends by itself, or -1."""
+        if self.repeat == REPEAT_ONE and self.current >= 0:
+            return self.current
+        return self._upcoming
+
+    def upcoming(self) -> int:
+        """The track the next button plays, or -1 at the end."""
+        return self._upcoming
+
+    def previous(self) -> int:
+        """The track the previous button goes back to, or -1."""
+        if self.shuffle:
+            history = self.history
+            while history and not self.store.contains(history[-1]):
+                history.pop()
+            return history[-1] if history else -1
+        position = self._current_position() - 1
+        if position < 0:
+            if self.repeat != REPEAT_ALL or not len(self.store):
+                return -1
+            position = len(self.store) - 1
+        return self.store.id_at(position)
+
+    # Moving
+
+    def start(self, track_id: int) -> None:
+        """Make a track the current one, as when it starts playing."""
+        if track_id == self.current:
+            return
+        source = self._upcoming_source if track_id == self._upcoming else None
+        if source == _FORWARD:
+            self._forward.popleft()
+        elif source == _QUEUED:
+            self.queued.popleft()
+        elif source is None:
+            # A jump: what was gone back over no longer comes next
+            self._forward.clear()
+        if source is not None:
+            self._upcoming, self._upcoming_source = -1, None
+        self._pool_remove(track_id)
+
+        if self.current >= 0 and self.store.contains(self.current):
+            self.history.append(self.current)
+        self.current = track_id
+        if source != _QUEUED:
+            self._set_anchor(track_id)
+        self._refresh()
+
+    def advance(self, auto: bool = False) -> int:
+        """Move on to the next track and return it, or -1 to stop.
+
+        auto is for a track that ended by itself, which repeat-one replays.
+        """
+        track_id = self.peek_next() if auto else self._upcoming
+        if track_id >= 0:
+            self.start(track_id)
+        return track_id
+
+    def go_back(self) -> int:
+        """Move to the previous track and return it, or -1 at the start."""
+        track_id = self.previous()
+        if track_id < 0 or not self.shuffle:
+            if track_id >= 0:
+                self.start(track_id)
+            return track_id
+
+        # Shuffled history is walked like a browser's: the track left
+        # behind comes next again
+        self.history.pop()
+        if self.current >= 0 and self.store.contains(self.current):
+            self._forward.appendleft(self.current)
+        self._pool_remove(track_id)
+        self.current = track_id
+        self._set_anchor(track_id)
+        self._refresh()
+        return track_id
+
+    def play_next(self, track_ids: Iterable[int]) -> None:
+        """Queue tracks to play after the current one, after any queued earlier."""
+        self.queued.extend(track_ids)
+        self._refresh()
+
+    # Modes
+
+    def set_shuffle(self, shuffle: bool) -> None:
+        if shuffle == self.shuffle:
+            return
+        self.shuffle = shuffle
+        self._release_upcoming()
+        if shuffle:
+            self._new_round()
+        else:
+            self._pool, self._slots = array('i'), array('i')
+        self._refresh()
+
+    def set_repeat(self, mode: str) -> None:
+        if mode not in REPEAT_MODES:
+            raise ValueError(f"Unknown repeat mode {mode!r}")
+        self.repeat = mode
+        self._refresh()
+
+    # Playlist changes
+
+    def added(self, track_ids: Iterable[int]) -> None:
+        """Tracks joined the playlist at its end."""
+        if self.shuffle:
+            for track_id in track_ids:
+                self._pool_add(track_id)
+        self._refresh()
+
+    def removed(self, track_ids: Iterable[int], positions: Iterable[int]) -> None:
+        """Tracks left the playlist from these (sorted, former) positions."""
+        for track_id in track_ids:
+            self._pool_remove(track_id)
+        if self._anchor_position >= 0:
+            shift = 0
+            for position in positions:
+                if position >= self._anchor_position:
+                    break
+                shift += 1
+            self._anchor_position -= shift
+        self._refresh()
+
+    def reordered(self) -> None:
+        """The playlist order changed, as after sorting."""
+        if self._anchor >= 0 and self.store.contains(self._anchor):
+            self._anchor_position = self.store.position_of(self._anchor)
+        self._refresh()
+
+    # Internals
+
+    def _set_anchor(self, track_id: int) -> None:
+        self._anchor = track_id
+        self._anchor_position = self.store.position_of(track_id)
+
+    def _current_position(self) -> int:
+        """Position of the anchor, or of the track that took its place."""
+        if self._anchor >= 0 and self.store.contains(self._anchor):
+            return self.store.position_of(self._anchor)
+        return self._anchor_position
+
+    def _refresh(self) -> None:
+        """Work out the next track again after a change."""
+        previous, source = self._upcoming, self._upcoming_source
+        self._upcoming, self._upcoming_source = self._choose()
+        if (source == _SHUFFLE and previous not in (self._upcoming, self.current)
+                and self.store.contains(previous)):
+            # A drawn track that no longer comes next goes back in the round
+            self._pool_add(previous)
+
+    def _release_upcoming(self) -> None:
+        if self._upcoming_source == _SHUFFLE and self._upcoming >= 0:
+            self._pool_add(self._upcoming)
+        self._upcoming, self._upcoming_source = -1, None
+
+    def _choose(self):
+        store = self.store
+        for source, tracks in ((_FORWARD, self._forward), (_QUEUED, self.queued)):
+            while tracks and not store.contains(tracks[0]):
+                tracks.popleft()
+            if tracks:
+                return tracks[0], source
+
+        if self.shuffle:
+            if self._upcoming_source == _SHUFFLE and store.contains(self._upcoming):
+                return self._upcoming, _SHUFFLE
+            track_id = self._draw()
+            if track_id < 0 and self.repeat == REPEAT_ALL:
+                self._new_round()
+                track_id = self._draw()
+                if track_id < 0 and store.contains(self.current):
+                    track_id = self.current
+            return track_id, _SHUFFLE
+
+        count = len(store)
+        if self._anchor < 0:
+            position = 0
+        elif store.contains(self._anchor):
+            position = store.position_of(self._anchor) + 1
+        else:
+            position = self._anchor_position
+        if position >= count and self.repeat == REPEAT_ALL:
+            position = 0
+        if not 0 <= position < count:
+            return -1, None
+        return store.id_at(position), _ORDER
+
+    def _new_round(self) -> None:
+        """Put every track but the current one back in the shuffle pool."""
+        self._pool = array('i', (track_id for track_id in self.store if track_id != self.current))
+        size = max(self._pool) + 1 if self._pool else 0
+        self._slots = array('i', [-1]) * size
+        for index, track_id in enumerate(self._pool):
+            self._slots[track_id] = index
+
+    def _draw(self) -> int:
+        """A random track from the round, taken out of it, or -1 when it is over."""
+        pool = self._pool
+        if not pool:
+            return -1
+        track_id = pool[self.random.randrange(len(pool))]
+        self._pool_remove(track_id)
+        return track_id
+
+    def _pool_add(self, track_id: int) -> None:
+        slots = self._slots
+        if track_id >= len(slots):
+            slots.extend(array('i', [-1]) * (track_id + 1 - len(slots)))
+        if slots[track_id] < 0:
+            slots[track_id] = len(self._pool)
+            self._pool.append(track_id)
+
+    def _pool_remove(self, track_id: int) -> None:
+        slots = self._slots
+        if track_id >= len(slots) or slots[track_id] < 0:
+            return
+        index = slots[track_id]
+        last = self._pool.pop()
+        if last != track_id:
+            self._pool[index] = last
+            slots[last] = index
+        slots[track_id] = -1
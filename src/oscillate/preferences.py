@@ -4,6 +4,9 @@ from gi.repository import Adw, Gtk, Gio
 class OscillatePreferences(Adw.PreferencesWindow):
     """Preferences window for Oscillate."""
 
+    REPLAYGAIN_MODES = ["off", "track", "album"]
+    DUPLICATE_MODES = ["off", "flag", "skip"]
+
     def __init__(self, parent, **kwargs):
         super().__init__(**kwargs)
 
@@ -58,6 +61,39 @@ class OscillatePreferences(Adw.PreferencesWindow):
         gapless_row.add_suffix(gapless_switch)
         behavior_group.add(gapless_row)
 
+        # Accurate seeking
+        accurate_seeking_row = Adw.ActionRow()
+        accurate_seeking_row.set_title("Accurate Seeking")
+        accurate_seeking_row.set_subtitle("Land on the exact spot, even in variable bitrate MP3s")
+        accurate_seeking_switch = Gtk.Switch()
+        accurate_seeking_switch.set_valign(Gtk.Align.CENTER)
+        accurate_seeking_switch.set_active(self.settings.get_boolean("accurate-seeking"))
+        accurate_seeking_switch.connect("notify::active", self.on_accurate_seeking_changed)
+        accurate_seeking_row.add_suffix(accurate_seeking_switch)
+        behavior_group.add(accurate_seeking_row)
+
+        # ReplayGain
+        replaygain_row = Adw.ComboRow()
+        replaygain_row.set_title("ReplayGain")
+        replaygain_row.set_subtitle("Even out loudness between songs")
+        replaygain_row.set_model(Gtk.StringList.new(["Off", "Track", "Album"]))
+        replaygain_row.set_selected(
+            self.REPLAYGAIN_MODES.index(self.settings.get_string("replaygain-mode"))
+        )
+        replaygain_row.connect("notify::selected", self.on_replaygain_changed)
+        behavior_group.add(replaygain_row)
+
+        # Duplicate songs
+        duplicates_row = Adw.ComboRow()
+        duplicates_row.set_title("Duplicate Songs")
+        duplicates_row.set_subtitle("When added audio is already in the playlist")
+        duplicates_row.set_model(Gtk.StringList.new(["Keep", "Mark", "Skip"]))
+        duplicates_row.set_selected(
+            self.DUPLICATE_MODES.index(self.settings.get_string("duplicate-tracks"))
+        )
+        duplicates_row.connect("notify::selected", self.on_duplicates_changed)
+        behavior_group.add(duplicates_row)
+
         # Interface page
         interface_page = Adw.PreferencesPage()
         interface_page.set_title("Interface")
@@ -80,6 +116,17 @@ class OscillatePreferences(Adw.PreferencesWindow):
         album_art_row.add_suffix(album_art_switch)
         appearance_group.add(album_art_row)
 
+        # Show waveform
+        waveform_row = Adw.ActionRow()
+        waveform_row.set_title("Show Waveform")
+        waveform_row.set_subtitle("Draw the waveform of the playing song above the progress bar")
+        waveform_switch = Gtk.Switch()
+        waveform_switch.set_valign(Gtk.Align.CENTER)
+        waveform_switch.set_active(self.settings.get_boolean("show-waveform"))
+        waveform_switch.connect("notify::active", self.on_waveform_changed)
+        waveform_row.add_suffix(waveform_switch)
+        appearance_group.add(waveform_row)
+
         # Show time remaining
         time_remaining_row = Adw.ActionRow()
         time_remaining_row.set_title("Show Time Remaining")
@@ -100,8 +147,20 @@ class OscillatePreferences(Adw.PreferencesWindow):
     def on_gapless_changed(self, switch, _):
         self.settings.set_boolean("gapless-playback", switch.get_active())
 
+    def on_accurate_seeking_changed(self, switch, _):
+        self.settings.set_boolean("accurate-seeking", switch.get_active())
+
+    def on_replaygain_changed(self, row, _):
+        self.settings.set_string("replaygain-mode", self.REPLAYGAIN_MODES[row.get_selected()])
+
+    def on_duplicates_changed(self, row, _):
+        self.settings.set_string("duplicate-tracks", self.DUPLICATE_MODES[row.get_selected()])
+
     def on_album_art_changed(self, switch, _):
         self.settings.set_boolean("show-album-art", switch.get_active())
 
+    def on_waveform_changed(self, switch, _):
+        self.settings.set_boolean("show-waveform", switch.get_active())
+
     def on_time_remaining_changed(self, switch, _):
         self.settings.set_boolean("show-time-remaining", switch.get_active())
@@ -0,0 +1,192 @@
+"""
+Oscillate Media Player - Background Metadata Scanner
+This module reads song tags on a pool of worker threads and hands the results
+back to the GTK main loop in batches, so large imports never block the UI.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+from . import tracing
+from .metadata import SongMetadata, read_metadata
+
+logger = logging.getLogger(__name__)
+
+Reader = Callable[[str], SongMetadata]
+BatchCallback = Callable[[List[SongMetadata]], None]
+ProgressCallback = Callable[[int, int], None]
+FinishedCallback = Callable[[int, List[Tuple[str, str]], bool], None]
+
+
+class MetadataScanner:
+    """Reads tags off the main thread and delivers them in order, in batches.
+
+    All callbacks are invoked on the GTK main loop:
+
+    * ``on_batch(songs)`` with a list of SongMetadata, in the order queued
+    * ``on_progress(done, total)`` after every batch
+    * ``on_finished(added, errors, cancelled)`` once the queue has drained,
+      where ``errors`` is a list of ``(file_path, message)`` pairs
+
+    ``reader`` turns a path into SongMetadata on a worker thread; pass a
+    MetadataCache's ``read`` to skip files that have been seen before.
+    """
+
+    BATCH_SIZE = 64
+    BATCH_INTERVAL = 0.1  # seconds between batches while results trickle in
+
+    def __init__(self, on_batch: BatchCallback,
+                 on_progress: Optional[ProgressCallback] = None,
+                 on_finished: Optional[FinishedCallback] = None,
+                 max_workers: Optional[int] = None,
+                 reader: Reader = read_metadata):
+        self.on_batch = on_batch
+        self.reader = reader
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.max_workers = max_workers or max(2, min(8, os.cpu_count() or 2))
+
+        self._lock = threading.Lock()
+        self._pending: deque = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._generation = 0
+        self._total = 0
+        self._done = 0
+        self._added = 0
+        self._errors: List[Tuple[str, str]] = []
+
+    @property
+    def is_running(self) -> bool:
+        with self._lock:
+            return self._thread is not None
+
+    def queue(self, file_paths: Iterable[str]) -> None:
+        """Queue files for reading. Safe to call while a scan is running."""
+        file_paths = list(file_paths)
+        if not file_paths:
+            return
+
+        with self._lock:
+            self._pending.extend(file_paths)
+            self._total += len(file_paths)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='oscillate-scan',
+                )
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._generation,),
+                    name='oscillate-scan-coordinator', daemon=True,
+                )
+                self._thread.start()
+
+    def cancel(self) -> None:
+        """Drop everything still queued. Batches already read are discarded."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._pending.clear()
+            self._generation += 1
+            self._thread = None
+            added, errors = self._added, self._errors
+            self._reset_counters()
+
+        if self.on_finished:
+            self.on_finished(added, errors, True)
+
+    def shutdown(self) -> None:
+        """Cancel any scan and release the worker threads."""
+        self.cancel()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _reset_counters(self) -> None:
+        self._total = 0
+        self._done = 0
+        self._added = 0
+        self._errors = []
+
+    def _run(self, generation: int) -> None:
+        """Coordinator thread: keeps the pool busy and collects results in order."""
+        in_flight: deque = deque()
+        batch: List[SongMetadata] = []
+        errors: List[Tuple[str, str]] = []
+        last_flush = time.monotonic()
+        max_in_flight = self.max_workers * 4
+
+        while True:
+            with self._lock:
+                if generation != self._generation:
+                    for _, future in in_flight:
+                        future.cancel()
+                    return
+                while self._pending and len(in_flight) < max_in_flight:
+                    path = self._pending.popleft()
+                    in_flight.append((path, self._executor.submit(self.reader, path)))
+                if not in_flight:
+                    self._flush(generation, batch, errors, finished=True)
+                    self._thread = None
+                    return
+
+            path, future = in_flight.popleft()
+            try:
+                batch.append(future.result())
+            except Exception as e:
+                logger.error(f"Error reading {path}: {e}")
+                errors.append((path, str(e)))
+
+            now = time.monotonic()
+            if len(batch) >= self.BATCH_SIZE or now - last_flush >= self.BATCH_INTERVAL:
+                with self._lock:
+                    if generation != self._generation:
+                        continue
+                    self._flush(generation, batch, errors, finished=False)
+                batch, errors = [], []
+                last_flush = now
+
+    def _flush(self, generation: int, batch: List[SongMetadata],
+               errors: List[Tuple[str, str]], finished: bool) -> None:
+        """Hand a batch to the main loop. Must be called with the lock held."""
+        self._done += len(batch) + len(errors)
+        self._added += len(batch)
+        self._errors.extend(errors)
+        done, total = self._done, self._total
+        summary = None
+        if finished:
+            summary = (self._added, self._errors)
+            self._reset_counters()
+
+        tracing.idle_add(self._deliver, generation, batch, done, total, summary)
+
+    def _deliver(self, generation: int, batch: List[SongMetadata],
+                 done: int, total: int, summary) -> bool:
+        """Main-loop side of a flush."""
+        if generation != self._generation:
+            return False
+
+        if batch:
+            self.on_batch(batch)
+        if self.on_progress and total:
+            self.on_progress(done, total)
+        if summary is not None and self.on_finished:
+            added, errors = summary
+            self.on_finished(added, errors, False)
+        return False
+
+
+def describe_errors(errors: List[Tuple[str, str]], limit: int = 5) -> str:
+    """Summarise scan errors for an error dialog."""
+    lines = [f"{Path(path).name}: {message}" for path, message in errors[:limit]]
+    if len(errors) > limit:
+        lines.append(f"…and {len(errors) - limit} more")
+    return "\n".join(lines)
@@ -0,0 +1,148 @@
+"""
+Oscillate Media Player - Playlist Search Index
+This module keeps a trigram index over normalised song titles and artists so
+playlist searches never have to walk the list or re-lowercase strings.
+"""
+
+from array import array
+from itertools import compress, repeat
+from operator import contains
+from typing import Dict, Optional, Set
+import unicodedata
+
+# Title and artist are joined with a character a query can never contain, so
+# a match cannot straddle the two fields.
+_FIELD_SEPARATOR = '\n'
+_GRAM = 3
+
+
+def normalize(text: str) -> str:
+    """Casefold and strip accents, so "Beyoncé" is found by "beyonce"."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def make_key(title: str, artist: str) -> str:
+    """The normalised text a track is searched by."""
+    return normalize(title) + _FIELD_SEPARATOR + normalize(artist)
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + _GRAM] for i in range(len(text) - _GRAM + 1)}
+
+
+class SearchIndex:
+    """Substring search over track titles and artists.
+
+    Keys are normalised once when a track is added. Queries of three or more
+    characters only verify the tracks listed under their rarest trigram, and a
+    query that extends the previous one only re-checks the previous results.
+
+    After a bulk extend() the index turns lazy: instead of indexing every
+    trigram up front, each posting list is built by one scan over the keys
+    the first time a query needs it.
+    """
+
+    def __init__(self):
+        self._keys: Dict[int, str] = {}
+        self._postings: Dict[str, array] = {}
+        self._lazy = False
+        self._dead = 0
+        self._last_query = ''
+        self._last_results: Optional[Set[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, track_id: int, title: str, artist: str) -> None:
+        key = make_key(title, artist)
+        self._keys[track_id] = key
+        for gram in _grams(key):
+            postings = self._postings.get(gram)
+            if postings is None:
+                if self._lazy:
+                    continue
+                postings = self._postings[gram] = array('i')
+            postings.append(track_id)
+
+        # Keep the live result set in step with the playlist
+        if self._last_results is not None and self._last_query in key:
+            self._last_results.add(track_id)
+
+    def remove(self, track_id: int) -> None:
+        if self._keys.pop(track_id, None) is None:
+            return
+        if self._last_results is not None:
+            self._last_results.discard(track_id)
+
+        # Postings are cleaned up lazily, once enough of them are stale
+        self._dead += 1
+        if self._dead > len(self._keys):
+            self._rebuild_postings()
+
+    def extend(self, keys: Dict[int, str]) -> None:
+        """Add many tracks at once, by key (see make_key())."""
+        self._keys.update(keys)
+        self._postings = {}
+        self._lazy = True
+        self._dead = 0
+        self._last_query, self._last_results = '', None
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def _posting(self, gram: str) -> Optional[array]:
+        postings = self._postings.get(gram)
+        if postings is None and self._lazy:
+            keys = self._keys
+            postings = self._postings[gram] = array(
+                'i', compress(keys.keys(), map(contains, keys.values(), repeat(gram)))
+            )
+        return postings
+
+    def _rebuild_postings(self) -> None:
+        self._postings = {}
+        self._dead = 0
+        if self._lazy:
+            return
+        for track_id, key in self._keys.items():
+            for gram in _grams(key):
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = array('i')
+                postings.append(track_id)
+
+    def matches(self, track_id: int, query: str) -> bool:
+        key = self._keys.get(track_id)
+        return key is not None and normalize(query) in key
+
+    def search(self, query: str) -> Optional[Set[int]]:
+        """Return the ids of tracks matching the query, or None for "all".
+
+        The returned set stays live: tracks added or removed afterwards are
+        reflected in it until the next search.
+        """
+        query = normalize(query.strip())
+        if not query:
+            self._last_query, self._last_results = '', None
+            return None
+
+        keys = self._keys
+        if self._last_results is not None and self._last_query in query:
+            # Narrowing the previous query: only its results can still match
+            results = {i for i in self._last_results if query in keys[i]}
+        elif len(query) < _GRAM:
+            # Too short for the trigram index; scan the keys at C speed
+            results = set(compress(keys.keys(), map(contains, keys.values(), repeat(query))))
+        else:
+            postings = [self._posting(gram) for gram in _grams(query)]
+            if not all(postings):
+                results = set()
+            else:
+                rarest = min(postings, key=len)
+                results = {i for i in rarest if query in keys.get(i, '')}
+
+        self._last_query, self._last_results = query, results
+        return results
@@ -0,0 +1,235 @@
+"""
+Oscillate Media Player - MP3 Seek Index
+This module maps playback time to byte offsets in MP3 files by scanning every
+frame header through mmap, and caches the result on disk per file.
+
+GStreamer's MP3 parser keeps its seek index to itself and finds a time it has
+not played through yet from the Xing TOC or the average bitrate, which in a
+VBR file can be seconds away from the target. The index tells how far off
+that estimate is at any time, so the player can use a cheap key-unit seek
+where it lands on the right frame and an accurate seek only where it would
+not.
+"""
+
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from gi.repository import GLib
+
+from .tagreader import (ID3V1_SIZE, TagError, find_first_frame, is_info_frame, parse_frame_header,
+                        parse_id3v2, xing_toc)
+
+logger = logging.getLogger(__name__)
+
+# One index entry per this many frames, about a fifth of a second
+INDEX_STEP = 8
+
+# How many frames a key-unit seek may land from its target and still count
+# as exact; the index resolves times to the start of a frame
+KEY_UNIT_TOLERANCE = 1.5
+
+# Indexes kept in memory, for the current track and the ones around it
+MEMORY_LIMIT = 8
+
+_MAGIC = b'OSKI'
+_VERSION = 1
+# magic, version, file size, file mtime_ns, sample rate, samples per frame,
+# frame count, audio start, audio end, TOC length, entry count
+_HEADER = struct.Struct('<4sIqqIIIQQII')
+
+
+def default_cache_dir() -> str:
+    return os.path.join(GLib.get_user_cache_dir(), 'oscillate', 'seek')
+
+
+class SeekIndex:
+    """Byte offsets of every INDEX_STEP-th audio frame of an MP3."""
+
+    def __init__(self, offsets: array, frame_count: int, sample_rate: int, samples_per_frame: int,
+                 audio_start: int, audio_end: int, toc: bytes = b''):
+        self.offsets = offsets
+        self.frame_count = frame_count
+        self.sample_rate = sample_rate
+        self.samples_per_frame = samples_per_frame
+        self.frame_seconds = samples_per_frame / sample_rate
+        self.audio_start = audio_start
+        self.audio_end = audio_end
+        self.toc = toc
+
+    @property
+    def duration(self) -> float:
+        return self.frame_count * self.frame_seconds
+
+    def time_at(self, offset: int) -> float:
+        """Start time of the frame holding a byte offset."""
+        entry = bisect_right(self.offsets, offset) - 1
+        if entry < 0:
+            return 0.0
+        # Frames between two entries are taken to be equally long
+        start = self.offsets[entry]
+        end = self.offsets[entry + 1] if entry + 1 < len(self.offsets) else self.audio_end
+        frames = min(INDEX_STEP, self.frame_count - entry * INDEX_STEP)
+        within = int(frames * (offset - start) / (end - start)) if end > start else 0
+        return (entry * INDEX_STEP + min(within, frames)) * self.frame_seconds
+
+    def estimated_offset(self, seconds: float) -> int:
+        """Where the parser looks for a time: by the Xing TOC, else the average bitrate."""
+        size = self.audio_end - self.audio_start
+        fraction = min(max(seconds / self.duration, 0.0), 1.0) if self.frame_count else 0.0
+        if len(self.toc) == 100:
+            percent = fraction * 100
+            entry = min(int(percent), 99)
+            lower = self.toc[entry]
+            upper = self.toc[entry + 1] if entry < 99 else 256
+            return self.audio_start + int((lower + (upper - lower) * (percent - entry)) / 256 * size)
+        return self.audio_start + int(fraction * size)
+
+    def estimate_error(self, seconds: float) -> float:
+        """How far (s) from a time the parser's own estimate lands."""
+        return abs(self.time_at(self.estimated_offset(seconds)) - seconds)
+
+    def key_unit_lands(self, seconds: float) -> bool:
+        """Whether a key-unit seek to a time ends up in its frame or the next."""
+        return self.estimate_error(seconds) < KEY_UNIT_TOLERANCE * self.frame_seconds
+
+
+def build_seek_index(file_path: str) -> SeekIndex:
+    """Scan the frames of an MP3.
+
+    Raises TagError if it is not an MP3 and OSError if it cannot be read.
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise TagError("empty file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                _, audio_start = parse_id3v2(data)
+                position, first = find_first_frame(data, audio_start)
+                toc = xing_toc(data, position, first) or b''
+                if is_info_frame(data, position, first):
+                    position += first.length
+                audio_start = position
+                audio_end = size
+                if size >= ID3V1_SIZE and data[size - ID3V1_SIZE:size - ID3V1_SIZE + 3] == b'TAG':
+                    audio_end -= ID3V1_SIZE
+
+                offsets = array('Q')
+                count = 0
+                while position + 4 <= audio_end:
+                    frame = parse_frame_header(data, position)
+                    if frame is None:
+                        break  # trailing junk or another tag
+                    if count % INDEX_STEP == 0:
+                        offsets.append(position)
+                    count += 1
+                    position += frame.length
+            except (IndexError, struct.error) as e:
+                raise TagError(f"truncated frame: {e}") from None
+
+    if not count:
+        raise TagError("no audio frames")
+    return SeekIndex(offsets, count, first.sample_rate, first.samples, audio_start,
+                     min(position, audio_end), toc)
+
+
+class SeekIndexCache:
+    """Index files on disk, named by path and invalidated by (size, mtime)."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or default_cache_dir()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, file_path: str) -> str:
+        name = hashlib.sha1(file_path.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.directory, f"{name}.seek")
+
+    def load(self, file_path: str, st: os.stat_result) -> Optional[SeekIndex]:
+        try:
+            with open(self._path(file_path), 'rb') as f:
+                header = f.read(_HEADER.size)
+                if len(header) != _HEADER.size:
+                    return None
+                (magic, version, size, mtime_ns, sample_rate, samples, frame_count,
+                 audio_start, audio_end, toc_size, count) = _HEADER.unpack(header)
+                if (magic != _MAGIC or version != _VERSION
+                        or size != st.st_size or mtime_ns != st.st_mtime_ns):
+                    return None
+                toc = f.read(toc_size)
+                offsets = array('Q')
+                offsets.fromfile(f, count)
+        except (OSError, EOFError):
+            return None
+        return SeekIndex(offsets, frame_count, sample_rate, samples, audio_start, audio_end, toc)
+
+    def store(self, file_path: str, st: os.stat_result, index: SeekIndex) -> None:
+        path = self._path(file_path)
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, st.st_size, st.st_mtime_ns, index.sample_rate,
+                                     index.samples_per_frame, index.frame_count, index.audio_start,
+                                     index.audio_end, len(index.toc), len(index.offsets)))
+                f.write(index.toc)
+                index.offsets.tofile(f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not save seek index {path}: {e}")
+
+
+class SeekIndexLoader:
+    """Builds or loads seek indexes on one background thread.
+
+    get() never blocks: until an index is ready it returns None, and the
+    player falls back to an accurate seek.
+    """
+
+    def __init__(self, cache: Optional[SeekIndexCache] = None):
+        self.cache = cache or SeekIndexCache()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='oscillate-seekindex')
+        self._lock = threading.Lock()
+        # Path -> index, or None while building or when the file has none
+        self._indexes: 'OrderedDict[str, Optional[SeekIndex]]' = OrderedDict()
+
+    def request(self, file_path: str) -> None:
+        """Have the index of a file ready for its first seek."""
+        if not file_path.lower().endswith('.mp3'):
+            return
+        with self._lock:
+            if file_path in self._indexes:
+                self._indexes.move_to_end(file_path)
+                return
+            self._indexes[file_path] = None
+            while len(self._indexes) > MEMORY_LIMIT:
+                self._indexes.popitem(last=False)
+        self._executor.submit(self._load, file_path)
+
+    def get(self, file_path: str) -> Optional[SeekIndex]:
+        with self._lock:
+            return self._indexes.get(file_path)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, file_path: str) -> None:
+        try:
+            st = os.stat(file_path)
+            index = self.cache.load(file_path, st)
+            if index is None:
+                index = build_seek_index(file_path)
+                self.cache.store(file_path, st, index)
+        except (OSError, TagError) as e:
+            logger.debug(f"No seek index for {file_path}: {e}")
+            return
+        with self._lock:
+            if file_path in self._indexes:
+                self._indexes[file_path] = index
@@ -0,0 +1,364 @@
+"""
+Oscillate Media Player - Session Snapshots
+This module saves the playlist to a compact binary snapshot and the playback
+state (current song and position) to a tiny separate file, so a session of
+any size comes back at launch without reading a single tag. The watched
+directories are saved with their mtimes too, so watched folders come back
+without being walked.
+"""
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout, all little-endian:
+#
+#   header     magic, version, track count, section count
+#   directory  (tag, offset, length) per section
+#   sections   each 8-byte aligned
+#
+# String tables hold a count, the u32 end offset of every string and then the
+# strings back to back as UTF-8 (paths may carry undecodable bytes, kept with
+# surrogateescape); tags can contain NUL, so nothing is used as a separator.
+# Version 1 joined them with NUL instead and is still read. Index columns are u32
+# arrays into the interned DIRS/ARTS/ALBS tables; durations are f64 and track
+# numbers i32. Readers skip sections they do not know, so new columns do not
+# need a new version; TRKN, added later, reads as zeros when it is missing.
+SNAPSHOT_MAGIC = b'OSCS'
+SNAPSHOT_VERSION = 2
+_HEADER = struct.Struct('<4sHxxII')
+_SECTION = struct.Struct('<4sQQ')
+_COUNT = struct.Struct('<I')
+
+STATE_MAGIC = b'OSCP'
+STATE_VERSION = 1
+_STATE = struct.Struct('<4sHxxqq')
+
+# Header, then an i64 mtime_ns per directory and a string table of paths
+DIRECTORIES_MAGIC = b'OSCW'
+DIRECTORIES_VERSION = 2
+_DIRECTORIES = struct.Struct('<4sHxxI')
+
+_SWAP = sys.byteorder != 'little'
+
+
+class SessionError(ValueError):
+    """A snapshot that cannot be read."""
+
+
+@dataclass
+class Session:
+    """A restored playlist, column by column, in playlist order."""
+
+    dirs: List[str]
+    names: List[str]
+    titles: List[str]
+    artists: List[str]
+    albums: List[str]
+    durations: array
+    track_numbers: array
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def columns(self) -> Tuple:
+        return (self.dirs, self.names, self.titles, self.artists, self.albums,
+                self.durations, self.track_numbers)
+
+
+class PlaybackState(NamedTuple):
+    """Where playback was: playlist position, its file, and the offset in it."""
+
+    position: int
+    file_path: str
+    offset_ns: int
+
+
+def default_session_dir() -> str:
+    return os.path.join(GLib.get_user_data_dir(), 'oscillate')
+
+
+def _encode_strings(strings: List[str]) -> bytes:
+    encoded = [string.encode('utf-8', 'surrogateescape') for string in strings]
+    ends = array('I', accumulate(map(len, encoded)))
+    return _COUNT.pack(len(strings)) + _encode_array(ends) + b''.join(encoded)
+
+
+def _decode_strings(data: memoryview) -> List[str]:
+    (count,) = _COUNT.unpack_from(data)
+    blob_start = _COUNT.size + 4 * count
+    if len(data) < blob_start:
+        raise SessionError("string table is damaged")
+    ends = _decode_array('I', data[_COUNT.size:blob_start])
+    blob = bytes(data[blob_start:])
+    if count and ends[-1] != len(blob):
+        raise SessionError("string table is damaged")
+    starts = [0, *ends[:-1]]
+    return [blob[start:end].decode('utf-8', 'surrogateescape') for start, end in zip(starts, ends)]
+
+
+def _decode_joined_strings(data: memoryview) -> List[str]:
+    """A version 1 string table, NUL-joined."""
+    (count,) = _COUNT.unpack_from(data)
+    if count == 0:
+        return []
+    strings = bytes(data[_COUNT.size:]).decode('utf-8', 'surrogateescape').split('\0')
+    if len(strings) != count:
+        raise SessionError("string table is damaged")
+    return strings
+
+
+def _encode_array(values: array) -> bytes:
+    if _SWAP:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _decode_array(typecode: str, data: memoryview) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if _SWAP:
+        values.byteswap()
+    return values
+
+
+def _intern_column(values: List[str]) -> Tuple[List[str], array]:
+    """Split a column into its distinct values and an index per row."""
+    table: Dict[str, int] = {}
+    index = array('I', (table.setdefault(value, len(table)) for value in values))
+    return list(table), index
+
+
+def encode_snapshot(columns: Tuple) -> bytes:
+    """Serialise TrackStore.columns() output."""
+    dirs, names, titles, artists, albums, durations, track_numbers = columns
+    dir_table, dir_index = _intern_column(dirs)
+    artist_table, artist_index = _intern_column(artists)
+    album_table, album_index = _intern_column(albums)
+
+    sections = [
+        (b'DIRS', _encode_strings(dir_table)),
+        (b'ARTS', _encode_strings(artist_table)),
+        (b'ALBS', _encode_strings(album_table)),
+        (b'NAME', _encode_strings(names)),
+        (b'TITL', _encode_strings(titles)),
+        (b'DIRI', _encode_array(dir_index)),
+        (b'ARTI', _encode_array(artist_index)),
+        (b'ALBI', _encode_array(album_index)),
+        (b'DURS', _encode_array(durations)),
+        (b'TRKN', _encode_array(track_numbers)),
+    ]
+
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    directory = []
+    body = []
+    for tag, data in sections:
+        padding = -offset % 8
+        body.append(b'\0' * padding)
+        offset += padding
+        directory.append(_SECTION.pack(tag, offset, len(data)))
+        body.append(data)
+        offset += len(data)
+
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(titles), len(sections))
+    return b''.join([header] + directory + body)
+
+
+def decode_snapshot(data) -> Session:
+    """Parse a snapshot from any buffer, such as an mmap of the file."""
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise SessionError("file is truncated")
+    magic, version, count, section_count = _HEADER.unpack_from(view)
+    if magic != SNAPSHOT_MAGIC:
+        raise SessionError("not a session snapshot")
+    if version not in (1, SNAPSHOT_VERSION):
+        raise SessionError(f"unsupported version {version}")
+    decode_strings = _decode_strings if version == SNAPSHOT_VERSION else _decode_joined_strings
+
+    sections = {}
+    for i in range(section_count):
+        tag, offset, length = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+        if offset + length > len(view):
+            raise SessionError("file is truncated")
+        sections[tag] = view[offset:offset + length]
+
+    try:
+        dir_table = decode_strings(sections[b'DIRS'])
+        artist_table = decode_strings(sections[b'ARTS'])
+        album_table = decode_strings(sections[b'ALBS'])
+        dir_index = _decode_array('I', sections[b'DIRI'])
+        artist_index = _decode_array('I', sections[b'ARTI'])
+        album_index = _decode_array('I', sections[b'ALBI'])
+        session = Session(
+            dirs=[dir_table[i] for i in dir_index],
+            names=decode_strings(sections[b'NAME']),
+            titles=decode_strings(sections[b'TITL']),
+            artists=[artist_table[i] for i in artist_index],
+            albums=[album_table[i] for i in album_index],
+            durations=_decode_array('d', sections[b'DURS']),
+            track_numbers=(_decode_array('i', sections[b'TRKN']) if b'TRKN' in sections
+                           else array('i', bytes(4 * count))),
+        )
+    except KeyError as e:
+        raise SessionError(f"missing section {e.args[0]!r}")
+    except IndexError:
+        raise SessionError("index column is damaged")
+
+    if any(len(column) != count for column in session.columns()):
+        raise SessionError("columns disagree on the track count")
+    return session
+
+
+def encode_state(state: PlaybackState) -> bytes:
+    return (_STATE.pack(STATE_MAGIC, STATE_VERSION, state.position, state.offset_ns)
+            + state.file_path.encode('utf-8', 'surrogateescape'))
+
+
+def decode_state(data: bytes) -> Optional[PlaybackState]:
+    if len(data) < _STATE.size:
+        return None
+    magic, version, position, offset_ns = _STATE.unpack_from(data)
+    if magic != STATE_MAGIC or version != STATE_VERSION:
+        return None
+    return PlaybackState(position, data[_STATE.size:].decode('utf-8', 'surrogateescape'), offset_ns)
+
+
+def encode_directories(directories: List[str]) -> bytes:
+    """Directories with their current mtimes; ones that are gone are left out."""
+    kept = []
+    mtimes = array('q')
+    for directory in directories:
+        try:
+            mtimes.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            continue
+        kept.append(directory)
+    return (_DIRECTORIES.pack(DIRECTORIES_MAGIC, DIRECTORIES_VERSION, len(kept))
+            + _encode_array(mtimes) + _encode_strings(kept))
+
+
+def decode_directories(data: bytes) -> Dict[str, int]:
+    """Directory -> mtime_ns, or {} for a file that cannot be read."""
+    view = memoryview(data)
+    if len(view) < _DIRECTORIES.size:
+        return {}
+    magic, version, count = _DIRECTORIES.unpack_from(view)
+    end = _DIRECTORIES.size + 8 * count
+    if magic != DIRECTORIES_MAGIC or version != DIRECTORIES_VERSION or len(view) < end + _COUNT.size:
+        return {}
+    try:
+        directories = _decode_strings(view[end:])
+    except SessionError:
+        return {}
+    mtimes = _decode_array('q', view[_DIRECTORIES.size:end])
+    if len(directories) != count:
+        return {}
+    return dict(zip(directories, mtimes))
+
+
+def write_atomically(path: str, data: bytes) -> None:
+    """Replace a file so readers see either the old or the new contents."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class SessionStore:
+    """Reads and writes the session files.
+
+    The playlist snapshot is only rewritten when the playlist changed; the
+    playback state goes to its own small file so the frequent updates stay
+    cheap. Writes happen in order on one background thread.
+    """
+
+    SNAPSHOT_NAME = 'session.bin'
+    STATE_NAME = 'session-state.bin'
+    DIRECTORIES_NAME = 'watched-directories.bin'
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or default_session_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.snapshot_path = os.path.join(self.directory, self.SNAPSHOT_NAME)
+        self.state_path = os.path.join(self.directory, self.STATE_NAME)
+        self.directories_path = os.path.join(self.directory, self.DIRECTORIES_NAME)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='oscillate-session')
+        self._last_state: Optional[PlaybackState] = None
+
+    def load(self) -> Tuple[Optional[Session], Optional[PlaybackState]]:
+        """Read the saved session; blocks, so call it off the main thread."""
+        session = None
+        error = None
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    # Handled in here: a live traceback would keep views of
+                    # the map alive and stop it from closing
+                    try:
+                        session = decode_snapshot(data)
+                    except (SessionError, struct.error) as e:
+                        error = str(e)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            error = str(e)
+        if error:
+            logger.warning(f"Could not restore the saved playlist: {error}")
+
+        state = None
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = decode_state(f.read())
+        except OSError:
+            pass
+        self._last_state = state
+        return session, state
+
+    def save_playlist(self, columns: Tuple) -> None:
+        """Write a snapshot of TrackStore.columns() in the background."""
+        self._writer.submit(self._write, self.snapshot_path, encode_snapshot, columns)
+
+    def save_state(self, state: PlaybackState) -> None:
+        """Write the playback state in the background, if it changed."""
+        if state == self._last_state:
+            return
+        self._last_state = state
+        self._writer.submit(self._write, self.state_path, encode_state, state)
+
+    def load_directories(self) -> Dict[str, int]:
+        """The watched directories and their mtimes when last saved; blocks."""
+        try:
+            with open(self.directories_path, 'rb') as f:
+                return decode_directories(f.read())
+        except OSError:
+            return {}
+
+    def save_directories(self, directories: List[str]) -> None:
+        """Record the watched directories; they are stat'ed in the background."""
+        self._writer.submit(self._write, self.directories_path, encode_directories, directories)
+
+    def close(self) -> None:
+        """Finish pending writes."""
+        self._writer.shutdown(wait=True)
+
+    @staticmethod
+    def _write(path: str, encode, value) -> None:
+        try:
+            write_atomically(path, encode(value))
+        except OSError as e:
+            logger.error(f"Could not save session to {path}: {e}")
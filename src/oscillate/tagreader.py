@@ -0,0 +1,312 @@
+"""
+Oscillate Media Player - MP3 Tag Reader
+This module reads the title, artist, album, track number and duration of an
+MP3 file from its ID3v2 tag (versions 2.2 to 2.4), its ID3v1 tag and the
+Xing/Info (with the LAME extension) or VBRI header of the first MPEG frame.
+
+The file is memory-mapped, so only the pages holding the tag, the first
+frames and the last 128 bytes are read from disk; the audio in between is
+never touched. mutagen, by contrast, walks several frames to sync and
+parses every ID3 frame. Anything this reader does not understand raises
+TagError, and read_metadata() then falls back to mutagen.
+"""
+
+from typing import Dict, NamedTuple, Optional, Tuple
+import mmap
+import os
+import struct
+
+# How far past the ID3v2 tag to look for the first MPEG frame
+FRAME_SCAN_BYTES = 64 * 1024
+
+ID3V1_SIZE = 128
+
+# Text frames read, by ID3v2.3/2.4 and ID3v2.2 frame id
+_TEXT_FRAMES = {b'TIT2': 'title', b'TPE1': 'artist', b'TALB': 'album', b'TRCK': 'track'}
+_TEXT_FRAMES_V22 = {b'TT2': 'title', b'TP1': 'artist', b'TAL': 'album', b'TRK': 'track'}
+
+_TEXT_ENCODINGS = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')
+
+# Kbit/s by (MPEG-1 or not, layer) and bitrate index; 0 is free format
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Hz by the version bits of the frame header (MPEG-2.5, reserved, MPEG-2, MPEG-1)
+_SAMPLE_RATES = ((11025, 12000, 8000), None, (22050, 24000, 16000), (44100, 48000, 32000))
+
+
+class TagError(ValueError):
+    """The file is not an MP3 this reader can handle."""
+
+
+class Mp3Tags(NamedTuple):
+    title: str
+    artist: str
+    album: str
+    track: str
+    duration: float
+
+
+class FrameHeader(NamedTuple):
+    mpeg1: bool
+    layer: int
+    bitrate: int
+    sample_rate: int
+    samples: int
+    length: int
+    mono: bool
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_text(body: bytes) -> str:
+    """The first value of a text frame."""
+    if not body:
+        return ''
+    encoding = body[0]
+    if encoding >= len(_TEXT_ENCODINGS):
+        raise TagError(f"unknown text encoding {encoding}")
+    text = body[1:]
+    if encoding in (1, 2) and len(text) % 2:
+        text = text[:-1]
+    try:
+        value = text.decode(_TEXT_ENCODINGS[encoding])
+    except UnicodeDecodeError as e:
+        raise TagError(f"undecodable text frame: {e}") from None
+    # ID3v2.4 separates multiple values with NUL
+    return value.split('\x00', 1)[0].strip()
+
+
+def parse_id3v2(data) -> Tuple[Dict[str, str], int]:
+    """Text fields of the ID3v2 tag at the start of data, and its total size."""
+    if data[:3] != b'ID3':
+        return {}, 0
+    header = data[:10]
+    if len(header) < 10:
+        raise TagError("truncated ID3v2 header")
+    major, flags = header[3], header[5]
+    if major not in (2, 3, 4) or any(byte & 0x80 for byte in header[6:10]):
+        raise TagError(f"unsupported ID3v2.{major} header")
+    if major == 2 and flags & 0x40:
+        raise TagError("compressed ID3v2.2 tag")
+
+    size = _syncsafe(header[6:10])
+    if 10 + size > len(data):
+        raise TagError("truncated ID3v2 tag")
+    tag = data[10:10 + size]
+    unsynchronised = bool(flags & 0x80)
+    if unsynchronised and major < 4:
+        # Before 2.4 the whole tag, frame headers included, is unsynchronised
+        tag = tag.replace(b'\xff\x00', b'\xff')
+
+    position = 0
+    if flags & 0x40:
+        if major == 3:
+            position = 4 + struct.unpack('>I', tag[:4])[0]
+        else:
+            position = _syncsafe(tag[:4])
+
+    if major == 2:
+        id_size, header_size, wanted = 3, 6, _TEXT_FRAMES_V22
+    else:
+        id_size, header_size, wanted = 4, 10, _TEXT_FRAMES
+
+    fields: Dict[str, str] = {}
+    while position + header_size <= len(tag) and len(fields) < len(wanted):
+        frame_id = tag[position:position + id_size]
+        if frame_id[0] == 0:
+            break  # padding
+        if not frame_id.isalnum() or frame_id != frame_id.upper():
+            raise TagError(f"bad frame id {frame_id!r}")
+
+        size_bytes = tag[position + id_size:position + 2 * id_size]
+        if major == 2:
+            frame_size = int.from_bytes(size_bytes, 'big')
+            frame_flags = 0
+        else:
+            # iTunes wrote plain sizes into 2.4 tags; those are never syncsafe
+            if major == 4 and not any(byte & 0x80 for byte in size_bytes):
+                frame_size = _syncsafe(size_bytes)
+            else:
+                frame_size = struct.unpack('>I', size_bytes)[0]
+            frame_flags = (tag[position + 8] << 8) | tag[position + 9]
+
+        start = position + header_size
+        position = start + frame_size
+        if position > len(tag):
+            raise TagError(f"frame {frame_id!r} overruns the tag")
+        key = wanted.get(frame_id)
+        if key is None or key in fields:
+            continue
+
+        body = tag[start:position]
+        if major == 3:
+            if frame_flags & 0x00C0:
+                raise TagError("compressed or encrypted frame")
+            if frame_flags & 0x0020:
+                body = body[1:]
+        elif major == 4:
+            if frame_flags & 0x000C:
+                raise TagError("compressed or encrypted frame")
+            if frame_flags & 0x0040:
+                body = body[1:]
+            if frame_flags & 0x0001:
+                body = body[4:]
+            if frame_flags & 0x0002 or unsynchronised:
+                body = body.replace(b'\xff\x00', b'\xff')
+        value = _decode_text(body)
+        if value:
+            fields[key] = value
+
+    footer = 10 if major == 4 and flags & 0x10 else 0
+    return fields, 10 + size + footer
+
+
+def parse_id3v1(data) -> Dict[str, str]:
+    """Text fields of a 128-byte ID3v1 tag, or {} if data is not one."""
+    if len(data) != ID3V1_SIZE or data[:3] != b'TAG':
+        return {}
+    fields = {}
+    for key, start in (('title', 3), ('artist', 33), ('album', 63)):
+        value = data[start:start + 30].split(b'\x00', 1)[0].decode('latin-1').strip()
+        if value:
+            fields[key] = value
+    # ID3v1.1 keeps the track number in the last byte of the comment
+    if data[125] == 0 and data[126]:
+        fields['track'] = str(data[126])
+    return fields
+
+
+def parse_frame_header(data, offset: int) -> Optional[FrameHeader]:
+    """The MPEG audio frame header at offset, or None if there is none."""
+    header = data[offset:offset + 4]
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x3
+    layer = 4 - ((header[1] >> 1) & 0x3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if mpeg1 or layer == 2 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return FrameHeader(mpeg1, layer, bitrate, sample_rate, samples, length, header[3] >> 6 == 3)
+
+
+def find_first_frame(data, start: int) -> Tuple[int, FrameHeader]:
+    """The first frame at or after start that is followed by a matching one."""
+    limit = min(len(data), start + FRAME_SCAN_BYTES)
+    offset = data.find(b'\xff', start, limit)
+    while offset != -1:
+        frame = parse_frame_header(data, offset)
+        if frame is not None:
+            following = offset + frame.length
+            if following + 4 > len(data):
+                return offset, frame
+            after = parse_frame_header(data, following)
+            if after is not None and after[:2] == frame[:2] and after.sample_rate == frame.sample_rate:
+                return offset, frame
+        offset = data.find(b'\xff', offset + 1, limit)
+    raise TagError("no MPEG audio frame found")
+
+
+def xing_position(offset: int, frame: FrameHeader) -> int:
+    """Where a Xing/Info header starts in the frame at offset, after the side info."""
+    if frame.mpeg1:
+        return offset + (21 if frame.mono else 36)
+    return offset + (13 if frame.mono else 21)
+
+
+def is_info_frame(data, offset: int, frame: FrameHeader) -> bool:
+    """Whether the first frame holds a Xing/Info or VBRI header instead of audio."""
+    if frame.layer != 3:
+        return False
+    xing = xing_position(offset, frame)
+    return data[xing:xing + 4] in (b'Xing', b'Info') or data[offset + 36:offset + 40] == b'VBRI'
+
+
+def xing_toc(data, offset: int, frame: FrameHeader) -> Optional[bytes]:
+    """The 100-entry seek table of a Xing/Info header, if it has one."""
+    if frame.layer != 3:
+        return None
+    xing = xing_position(offset, frame)
+    if data[xing:xing + 4] not in (b'Xing', b'Info'):
+        return None
+    flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+    if not flags & 0x4:
+        return None
+    toc = xing + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0)
+    return bytes(data[toc:toc + 100])
+
+
+def vbr_duration(data, offset: int, frame: FrameHeader) -> Optional[float]:
+    """Exact duration from the Xing/Info or VBRI header of the first frame."""
+    if frame.layer != 3:
+        return None
+
+    xing = xing_position(offset, frame)
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if not flags & 0x1:
+            return None
+        frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+        samples = frames * frame.samples
+        lame = xing + 12 + (4 if flags & 0x2 else 0) + (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0)
+        # The LAME extension records the encoder delay and padding in samples
+        if data[lame:lame + 4] in (b'LAME', b'L3.9') and data[lame + 9] >> 4 == 0:
+            delay_padding = data[lame + 21:lame + 24]
+            samples -= (delay_padding[0] << 4) | (delay_padding[1] >> 4)
+            samples -= ((delay_padding[1] & 0xF) << 8) | delay_padding[2]
+        return max(samples, 0) / frame.sample_rate
+
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b'VBRI':
+        frames = struct.unpack('>I', data[vbri + 14:vbri + 18])[0]
+        return frames * frame.samples / frame.sample_rate
+    return None
+
+
+def read_mp3_tags(file_path: str) -> Mp3Tags:
+    """Read an MP3's tags and duration; empty strings for missing fields.
+
+    Raises TagError for files that need mutagen and OSError for unreadable ones.
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise TagError("empty file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                fields, audio_start = parse_id3v2(data)
+                offset, frame = find_first_frame(data, audio_start)
+                duration = vbr_duration(data, offset, frame)
+                tail = data[size - ID3V1_SIZE:] if size >= ID3V1_SIZE else b''
+            except (IndexError, struct.error) as e:
+                raise TagError(f"truncated header: {e}") from None
+
+    v1_fields = parse_id3v1(tail)
+    for key, value in v1_fields.items():
+        fields.setdefault(key, value)
+    if duration is None:
+        # Constant bitrate: the audio runs up to the ID3v1 tag
+        audio_end = size - ID3V1_SIZE if v1_fields else size
+        duration = (audio_end - offset) * 8 / frame.bitrate
+
+    return Mp3Tags(fields.get('title', ''), fields.get('artist', ''), fields.get('album', ''),
+                   fields.get('track', ''), duration)
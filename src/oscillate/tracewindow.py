@@ -0,0 +1,160 @@
+"""
+Oscillate Media Player - Trace Window
+This module contains the debug window that shows the rolling latency
+histograms collected by the tracing module and exports the recorded trace.
+"""
+
+from gi.repository import Adw, Gtk, GLib
+from typing import List
+import logging
+
+from .tracing import HISTOGRAM_BUCKETS, LatencyStats, tracer
+
+logger = logging.getLogger(__name__)
+
+
+def format_us(value: float) -> str:
+    if value >= 1000:
+        return f"{value / 1000:.1f} ms"
+    return f"{value:.0f} µs"
+
+
+class OscillateTraceWindow(Adw.Window):
+    """Latency per traced span, refreshed while the window is open."""
+
+    REFRESH_MS = 1000
+    COLUMNS = ["Span", "Calls", "p50", "p95", "p99", "Max", "Distribution (1 µs – 8 s)"]
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(**kwargs)
+
+        self.set_transient_for(parent)
+        self.set_title("Performance Trace")
+        self.set_default_size(820, 480)
+
+        header = Adw.HeaderBar()
+
+        # The switch drives app.tracing, so it follows the action's state
+        tracing_switch = Gtk.Switch()
+        tracing_switch.set_valign(Gtk.Align.CENTER)
+        tracing_switch.set_action_name("app.tracing")
+        tracing_switch.set_tooltip_text("Record spans")
+        header.pack_start(tracing_switch)
+
+        export_button = Gtk.Button(label="Export…")
+        export_button.set_tooltip_text("Save the trace as Chrome trace JSON")
+        export_button.connect('clicked', self.on_export_clicked)
+        header.pack_end(export_button)
+
+        clear_button = Gtk.Button(icon_name="edit-clear-all-symbolic")
+        clear_button.set_tooltip_text("Clear recorded spans")
+        clear_button.connect('clicked', self.on_clear_clicked)
+        header.pack_end(clear_button)
+
+        self.grid = Gtk.Grid(column_spacing=18, row_spacing=6)
+        self.grid.set_margin_top(12)
+        self.grid.set_margin_bottom(12)
+        self.grid.set_margin_start(12)
+        self.grid.set_margin_end(12)
+
+        self.empty_label = Gtk.Label(label="No spans recorded yet. Switch tracing on and use the player.")
+        self.empty_label.add_css_class("dim-label")
+        self.empty_label.set_vexpand(True)
+
+        scrolled = Gtk.ScrolledWindow(vexpand=True)
+        scrolled.set_child(self.grid)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.append(header)
+        box.append(scrolled)
+        self.set_content(box)
+
+        self.refresh_id = GLib.timeout_add(self.REFRESH_MS, self.refresh)
+        self.connect('close-request', self.on_close_request)
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Rebuild the table from the current histograms (called from a timeout)."""
+        child = self.grid.get_first_child()
+        while child is not None:
+            next_child = child.get_next_sibling()
+            self.grid.remove(child)
+            child = next_child
+
+        stats = tracer.stats()
+        if not stats:
+            self.grid.attach(self.empty_label, 0, 0, 1, 1)
+            return True
+
+        for column, title in enumerate(self.COLUMNS):
+            label = Gtk.Label(label=title, xalign=0)
+            label.add_css_class("heading")
+            self.grid.attach(label, column, 0, 1, 1)
+
+        for row, span_stats in enumerate(stats, start=1):
+            name = Gtk.Label(label=span_stats.name, xalign=0, selectable=True)
+            self.grid.attach(name, 0, row, 1, 1)
+            values = [str(span_stats.count), format_us(span_stats.p50_us), format_us(span_stats.p95_us),
+                      format_us(span_stats.p99_us), format_us(span_stats.max_us)]
+            for column, value in enumerate(values, start=1):
+                label = Gtk.Label(label=value, xalign=1)
+                label.add_css_class("numeric")
+                self.grid.attach(label, column, row, 1, 1)
+            self.grid.attach(self.create_histogram(span_stats), len(values) + 1, row, 1, 1)
+        return True
+
+    def create_histogram(self, stats: LatencyStats) -> Gtk.DrawingArea:
+        area = Gtk.DrawingArea(content_width=HISTOGRAM_BUCKETS * 6, content_height=18)
+        area.set_draw_func(self.draw_histogram, stats.buckets)
+        return area
+
+    @staticmethod
+    def draw_histogram(area: Gtk.DrawingArea, cr, width: int, height: int, buckets: List[int]) -> None:
+        highest = max(buckets)
+        if not highest:
+            return
+        color = area.get_color()
+        cr.set_source_rgba(color.red, color.green, color.blue, color.alpha)
+        bar_width = width / len(buckets)
+        for index, count in enumerate(buckets):
+            if count:
+                bar = max(height * count / highest, 1)
+                cr.rectangle(index * bar_width, height - bar, bar_width - 1, bar)
+        cr.fill()
+
+    def on_clear_clicked(self, button: Gtk.Button) -> None:
+        tracer.clear()
+        self.refresh()
+
+    def on_export_clicked(self, button: Gtk.Button) -> None:
+        dialog = Gtk.FileChooserDialog(
+            title="Export Trace",
+            transient_for=self,
+            action=Gtk.FileChooserAction.SAVE,
+        )
+        dialog.add_buttons(
+            "Cancel",
+            Gtk.ResponseType.CANCEL,
+            "Export",
+            Gtk.ResponseType.ACCEPT,
+        )
+        dialog.set_current_name("oscillate-trace.json")
+        dialog.connect('response', self.on_export_response)
+        dialog.present()
+
+    def on_export_response(self, dialog: Gtk.FileChooserDialog, response: Gtk.ResponseType) -> None:
+        try:
+            if response == Gtk.ResponseType.ACCEPT:
+                path = dialog.get_file().get_path()
+                try:
+                    count = tracer.export(path)
+                    logger.info(f"Exported {count} spans to {path}")
+                except OSError as e:
+                    logger.error(f"Could not export trace to {path}: {e}")
+        finally:
+            dialog.destroy()
+
+    def on_close_request(self, window: Gtk.Window) -> bool:
+        GLib.source_remove(self.refresh_id)
+        self.refresh_id = 0
+        return False
@@ -0,0 +1,236 @@
+"""
+Oscillate Media Player - Tracing
+This module records timing spans from the hot paths (bus messages, main loop
+callbacks, tag reading, playlist changes, seeks), keeps rolling latency
+histograms per span and exports everything as Chrome trace JSON, which
+Perfetto and chrome://tracing open directly.
+
+Tracing is off unless OSCILLATE_TRACE is set or it is switched on at runtime.
+While it is off a span costs one attribute check.
+"""
+
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+from typing import Callable, Dict, List, NamedTuple, Optional
+import json
+import logging
+import os
+import threading
+import time
+
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+# Set to anything but "" or "0" to trace from startup. A value ending in
+# .json is also where the trace is written when the application exits.
+ENV_VAR = 'OSCILLATE_TRACE'
+
+# Spans kept for export; older ones are dropped first
+MAX_EVENTS = 200_000
+# Samples per rolling histogram
+HISTOGRAM_WINDOW = 1024
+# Histogram buckets are powers of two from 1 µs up to about 8 s
+HISTOGRAM_BUCKETS = 24
+
+_NULL_SPAN = nullcontext()
+
+
+class Event(NamedTuple):
+    name: str
+    category: str
+    start_ns: int
+    duration_ns: int
+    thread: int
+    args: Optional[dict]
+
+
+class LatencyStats(NamedTuple):
+    name: str
+    count: int
+    p50_us: float
+    p95_us: float
+    p99_us: float
+    max_us: float
+    buckets: List[int]
+
+
+class RollingHistogram:
+    """Durations of the most recent calls of one span."""
+
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, duration_ns: int) -> None:
+        self.samples.append(duration_ns)
+        self.count += 1
+
+    def stats(self, name: str) -> LatencyStats:
+        samples = sorted(self.samples)
+        buckets = [0] * HISTOGRAM_BUCKETS
+        for duration_ns in samples:
+            bucket = (duration_ns // 1000).bit_length()
+            buckets[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+
+        return LatencyStats(name, self.count, percentile(0.5), percentile(0.95),
+                            percentile(0.99), samples[-1] / 1000 if samples else 0.0, buckets)
+
+
+class Tracer:
+    """Collects spans from any thread."""
+
+    def __init__(self):
+        self.enabled = False
+        self.events: deque = deque(maxlen=MAX_EVENTS)
+        self.histograms: Dict[str, RollingHistogram] = {}
+        self.thread_names: Dict[int, str] = {}
+        self.started_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def set_enabled(self, enabled: bool) -> None:
+        if enabled != self.enabled:
+            logger.info(f"Tracing {'enabled' if enabled else 'disabled'}")
+        self.enabled = enabled
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events.clear()
+            self.histograms = {}
+
+    def record(self, name: str, category: str, start_ns: int, end_ns: int,
+               args: Optional[dict] = None) -> None:
+        thread = threading.get_ident()
+        duration_ns = end_ns - start_ns
+        self.events.append(Event(name, category, start_ns, duration_ns, thread, args))
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, RollingHistogram())
+        histogram.add(duration_ns)
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+
+    def stats(self) -> List[LatencyStats]:
+        """Latency statistics per span, slowest p95 first."""
+        with self._lock:
+            histograms = list(self.histograms.items())
+        return sorted((histogram.stats(name) for name, histogram in histograms),
+                      key=lambda stats: stats.p95_us, reverse=True)
+
+    def to_chrome_trace(self) -> dict:
+        pid = os.getpid()
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}}
+            for thread, name in list(self.thread_names.items())
+        ]
+        for event in list(self.events):
+            entry = {
+                'name': event.name,
+                'cat': event.category,
+                'ph': 'X',
+                'ts': (event.start_ns - self.started_ns) / 1000,
+                'dur': event.duration_ns / 1000,
+                'pid': pid,
+                'tid': event.thread,
+            }
+            if event.args:
+                entry['args'] = event.args
+            events.append(entry)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path: str) -> int:
+        """Write the recorded spans as Chrome trace JSON; returns how many."""
+        trace = self.to_chrome_trace()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f)
+        return len(self.events)
+
+
+tracer = Tracer()
+
+
+class _Span:
+    __slots__ = ('name', 'category', 'args', 'start_ns')
+
+    def __init__(self, name: str, category: str, args: Optional[dict]):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        tracer.record(self.name, self.category, self.start_ns, time.perf_counter_ns(), self.args)
+        return False
+
+
+def span(name: str, category: str = 'app', args: Optional[dict] = None):
+    """Time a block: ``with span('name'): ...``."""
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def traced(name: Optional[str] = None, category: str = 'app',
+           describe: Optional[Callable[..., str]] = None):
+    """Decorator that times every call of a function.
+
+    ``describe``, called with the function's arguments only while tracing,
+    can return a suffix that splits the span by, say, message type.
+    """
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            full_name = f"{span_name} {describe(*args, **kwargs)}" if describe else span_name
+            start_ns = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(full_name, category, start_ns, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+
+def _traced_callback(callback: Callable, kind: str) -> Callable:
+    name = f"{kind} {getattr(callback, '__qualname__', repr(callback))}"
+    return traced(name, 'mainloop')(callback)
+
+
+def idle_add(callback: Callable, *args, priority: int = GLib.PRIORITY_DEFAULT_IDLE) -> int:
+    """GLib.idle_add(), with the callback timed while tracing."""
+    return GLib.idle_add(_traced_callback(callback, 'idle'), *args, priority=priority)
+
+
+def timeout_add(interval_ms: int, callback: Callable, *args,
+                priority: int = GLib.PRIORITY_DEFAULT) -> int:
+    """GLib.timeout_add(), with the callback timed while tracing."""
+    return GLib.timeout_add(interval_ms, _traced_callback(callback, 'timeout'), *args, priority=priority)
+
+
+def timeout_add_seconds(interval: int, callback: Callable, *args,
+                        priority: int = GLib.PRIORITY_DEFAULT) -> int:
+    """GLib.timeout_add_seconds(), with the callback timed while tracing."""
+    return GLib.timeout_add_seconds(interval, _traced_callback(callback, 'timeout'), *args,
+                                    priority=priority)
+
+
+def configure_from_environment() -> Optional[str]:
+    """Apply OSCILLATE_TRACE. Returns the path to export to at exit, if any."""
+    value = os.environ.get(ENV_VAR, '')
+    if value in ('', '0'):
+        return None
+    tracer.set_enabled(True)
+    return value if value.endswith('.json') else None
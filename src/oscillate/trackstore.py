@@ -0,0 +1,279 @@
+"""
+Oscillate Media Player - Track Store
+This module holds the playlist's track data in compact columns, independent of
+any widget, and gives every track a stable integer id.
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+import os
+import sys
+
+from .metadata import SongMetadata
+
+
+class TrackStore:
+    """Columnar storage for every track in the playlist.
+
+    A track id is an index into the columns and never changes or gets reused
+    while the store is alive. Directories, artists and albums are interned, so
+    a track costs a few list slots plus its own title and file name. The
+    playlist order is a separate array of ids, with a reverse array mapping
+    each id to its current position (-1 once removed). The total duration of
+    the playlist is kept up to date as tracks come and go.
+
+    Tracks in the playlist are also indexed by file name and by directory,
+    so the file monitors can find the tracks of a path without a scan.
+    """
+
+    def __init__(self):
+        self._strings: Dict[str, str] = {}
+
+        # One entry per track id
+        self._dirs: List[str] = []
+        self._names: List[str] = []
+        self._titles: List[str] = []
+        self._artists: List[str] = []
+        self._albums: List[str] = []
+        self._durations = array('d')
+        self._track_numbers = array('i')
+        self._positions = array('i')
+
+        # Track ids in playlist order
+        self._order = array('i')
+
+        # File name -> track id, or a list of ids for names shared by several
+        # tracks (the key is the string already held in _names), and
+        # directory -> ids of the tracks in it
+        self._by_name: Dict[str, Union[int, List[int]]] = {}
+        self._by_dir: Dict[str, Set[int]] = {}
+
+        # Sum of the durations of the tracks in the playlist, in seconds
+        self.total_duration = 0.0
+
+        # Ids of tracks found to duplicate another track's audio
+        self.duplicates: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._order)
+
+    def _intern(self, value: str) -> str:
+        return self._strings.setdefault(value, value)
+
+    def _index(self, track_id: int) -> None:
+        name = self._names[track_id]
+        entry = self._by_name.get(name)
+        if entry is None:
+            self._by_name[name] = track_id
+        elif isinstance(entry, list):
+            entry.append(track_id)
+        else:
+            self._by_name[name] = [entry, track_id]
+        self._by_dir.setdefault(self._dirs[track_id], set()).add(track_id)
+
+    def _unindex(self, track_id: int) -> None:
+        name = self._names[track_id]
+        entry = self._by_name.get(name)
+        if isinstance(entry, list):
+            entry.remove(track_id)
+            if len(entry) == 1:
+                self._by_name[name] = entry[0]
+        elif entry == track_id:
+            del self._by_name[name]
+        directory = self._dirs[track_id]
+        ids = self._by_dir.get(directory)
+        if ids is not None:
+            ids.discard(track_id)
+            if not ids:
+                del self._by_dir[directory]
+
+    def add(self, metadata: SongMetadata) -> int:
+        """Append a track to the end of the playlist and return its id."""
+        track_id = len(self._titles)
+        directory, name = os.path.split(metadata.file_path)
+        self._dirs.append(self._intern(directory))
+        self._names.append(name)
+        self._titles.append(metadata.title)
+        self._artists.append(self._intern(metadata.artist))
+        self._albums.append(self._intern(metadata.album))
+        self._durations.append(metadata.duration)
+        self._track_numbers.append(metadata.track_number)
+        self.total_duration += metadata.duration
+        self._positions.append(len(self._order))
+        self._order.append(track_id)
+        self._index(track_id)
+        return track_id
+
+    def extend(self, songs: Iterable[SongMetadata]) -> List[int]:
+        return [self.add(metadata) for metadata in songs]
+
+    def extend_columns(self, dirs: List[str], names: List[str], titles: List[str],
+                       artists: List[str], albums: List[str], durations: array,
+                       track_numbers: array) -> range:
+        """Append many tracks given column by column, as a saved session has them.
+
+        Returns the new track ids.
+        """
+        first = len(self._titles)
+        count = len(titles)
+        intern = self._intern
+        self._dirs.extend(map(intern, dirs))
+        self._names.extend(names)
+        self._titles.extend(titles)
+        self._artists.extend(map(intern, artists))
+        self._albums.extend(map(intern, albums))
+        self._durations.extend(durations)
+        self._track_numbers.extend(track_numbers)
+        self.total_duration += sum(durations)
+        self._positions.extend(range(len(self._order), len(self._order) + count))
+        self._order.extend(range(first, first + count))
+        for track_id in range(first, first + count):
+            self._index(track_id)
+        return range(first, first + count)
+
+    def columns(self) -> Tuple[List[str], List[str], List[str], List[str], List[str], array, array]:
+        """Every column in playlist order, without removed tracks."""
+        order = self._order
+        return (
+            [self._dirs[i] for i in order],
+            [self._names[i] for i in order],
+            [self._titles[i] for i in order],
+            [self._artists[i] for i in order],
+            [self._albums[i] for i in order],
+            array('d', (self._durations[i] for i in order)),
+            array('i', (self._track_numbers[i] for i in order)),
+        )
+
+    def paths(self) -> List[str]:
+        """Every file path in playlist order."""
+        join = os.path.join
+        return [join(self._dirs[i], self._names[i]) for i in self._order]
+
+    def remove_positions(self, positions: List[int]) -> List[int]:
+        """Remove the tracks at several playlist positions in one pass.
+
+        Returns the removed track ids in playlist order.
+        """
+        if not positions:
+            return []
+
+        doomed = bytearray(len(self._order))
+        for position in positions:
+            doomed[position] = 1
+        first = min(positions)
+
+        order = self._order
+        removed = [order[i] for i in range(first, len(order)) if doomed[i]]
+        kept = array('i', (order[i] for i in range(first, len(order)) if not doomed[i]))
+        del order[first:]
+        order.extend(kept)
+
+        for track_id in removed:
+            self._positions[track_id] = -1
+            self._unindex(track_id)
+        self.total_duration = max(0.0, self.total_duration - sum(self._durations[i] for i in removed))
+        for i in range(first, len(order)):
+            self._positions[order[i]] = i
+        return removed
+
+    def reorder(self, track_ids: List[int]) -> None:
+        """Put the playlist in a new order given as all of its track ids."""
+        if len(track_ids) != len(self._order):
+            raise ValueError("reorder() needs every track in the playlist")
+        self._order = array('i', track_ids)
+        positions = self._positions
+        for position, track_id in enumerate(track_ids):
+            positions[track_id] = position
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def find_path(self, file_path: str) -> List[int]:
+        """Ids of the tracks in the playlist that point at a file."""
+        directory, name = os.path.split(file_path)
+        entry = self._by_name.get(name)
+        if entry is None:
+            return []
+        candidates = entry if isinstance(entry, list) else [entry]
+        return sorted(track_id for track_id in candidates if self._dirs[track_id] == directory)
+
+    def find_under(self, directory: str) -> List[int]:
+        """Ids of the tracks in the playlist stored at or below a directory."""
+        prefix = directory.rstrip(os.sep) + os.sep
+        track_ids = []
+        for candidate, ids in self._by_dir.items():
+            if candidate == directory or candidate.startswith(prefix):
+                track_ids.extend(ids)
+        return sorted(track_ids)
+
+    def move(self, track_id: int, new_path: str) -> None:
+        """Point a track at its file's new location."""
+        directory, name = os.path.split(new_path)
+        live = self._positions[track_id] >= 0
+        if live:
+            self._unindex(track_id)
+        self._dirs[track_id] = self._intern(directory)
+        self._names[track_id] = name
+        if live:
+            self._index(track_id)
+
+    def move_directory(self, old_directory: str, new_directory: str) -> int:
+        """Rewrite the paths of every track below a renamed directory."""
+        track_ids = self.find_under(old_directory)
+        for track_id in track_ids:
+            relative = os.path.relpath(self._dirs[track_id], old_directory)
+            self.move(track_id, os.path.join(os.path.normpath(os.path.join(new_directory, relative)),
+                                             self._names[track_id]))
+        return len(track_ids)
+
+    def id_at(self, position: int) -> int:
+        return self._order[position]
+
+    def position_of(self, track_id: int) -> int:
+        """Current playlist position of a track, or -1 if it was removed."""
+        return self._positions[track_id]
+
+    def contains(self, track_id: int) -> bool:
+        return 0 <= track_id < len(self._positions) and self._positions[track_id] >= 0
+
+    def title(self, track_id: int) -> str:
+        return self._titles[track_id]
+
+    def artist(self, track_id: int) -> str:
+        return self._artists[track_id]
+
+    def album(self, track_id: int) -> str:
+        return self._albums[track_id]
+
+    def duration(self, track_id: int) -> float:
+        return self._durations[track_id]
+
+    def track_number(self, track_id: int) -> int:
+        return self._track_numbers[track_id]
+
+    def file_path(self, track_id: int) -> str:
+        return os.path.join(self._dirs[track_id], self._names[track_id])
+
+    def metadata(self, track_id: int) -> SongMetadata:
+        return SongMetadata(self.file_path(track_id), self._titles[track_id],
+                            self._artists[track_id], self._albums[track_id],
+                            self._durations[track_id], self._track_numbers[track_id])
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the store, including every string it owns."""
+        total = sum(sys.getsizeof(column) for column in (
+            self._dirs, self._names, self._titles, self._artists, self._albums,
+            self._durations, self._track_numbers, self._positions, self._order, self._strings,
+            self._by_name, self._by_dir,
+        ))
+        total += sum(sys.getsizeof(ids) for ids in self._by_dir.values())
+        total += sum(sys.getsizeof(value) for value in self._strings)
+        total += sum(sys.getsizeof(value) for value in self._names)
+        total += sum(sys.getsizeof(value) for value in self._titles)
+        return total
+
+    def bytes_per_track(self) -> float:
+        return self.memory_usage() / len(self._titles) if self._titles else 0.0
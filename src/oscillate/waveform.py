@@ -0,0 +1,300 @@
+"""
+Oscillate Media Player - Waveforms
+This module decodes tracks in the background into min/max peak arrays, caches
+them on disk in a compact binary format and draws them at any width.
+"""
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+import hashlib
+import importlib.util
+import logging
+import os
+import struct
+import threading
+
+from gi.repository import GLib
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# NumPy is optional and only imported once a waveform is needed
+HAVE_NUMPY = importlib.util.find_spec('numpy') is not None
+
+# Audio is decoded to mono floats at a low rate; peaks only need the envelope
+DECODE_RATE = 8000
+PEAKS_PER_SECOND = 50
+SAMPLES_PER_PEAK = DECODE_RATE // PEAKS_PER_SECOND
+
+# Cache file layout: header, then len * (min, max) as signed bytes
+_MAGIC = b'OSCW'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBxxxqqII')
+
+_PIPELINE = (
+    'filesrc name=src ! decodebin ! audioconvert ! audioresample ! '
+    f'audio/x-raw,format=F32LE,channels=1,rate={DECODE_RATE} ! '
+    'appsink name=sink sync=false max-buffers=8'
+)
+
+
+def default_cache_dir() -> str:
+    return os.path.join(GLib.get_user_cache_dir(), 'oscillate', 'waveforms')
+
+
+class Waveform:
+    """Peaks of one track: per bucket, the lowest and highest sample.
+
+    Peaks are stored quantised to signed bytes, two bytes per bucket.
+    """
+
+    def __init__(self, mins: array, maxs: array):
+        self.mins = mins
+        self.maxs = maxs
+        self._columns_width = -1
+        self._columns: Tuple[list, list] = ([], [])
+
+    def __len__(self) -> int:
+        return len(self.mins)
+
+    def columns(self, width: int) -> Tuple[list, list]:
+        """Reduce the peaks to ``width`` columns (cached for the last width).
+
+        Each column takes the min and max over the buckets it covers, so
+        short transients stay visible however far the waveform is squeezed.
+        """
+        if width == self._columns_width:
+            return self._columns
+
+        count = len(self.mins)
+        if count == 0 or width <= 0:
+            columns = ([], [])
+        elif HAVE_NUMPY:
+            import numpy as np
+            mins = np.frombuffer(self.mins, dtype=np.int8)
+            maxs = np.frombuffer(self.maxs, dtype=np.int8)
+            if width >= count:
+                index = np.arange(width) * count // width
+                columns = (mins[index].tolist(), maxs[index].tolist())
+            else:
+                edges = np.arange(width) * count // width
+                columns = (np.minimum.reduceat(mins, edges).tolist(),
+                           np.maximum.reduceat(maxs, edges).tolist())
+        else:
+            low, high = [], []
+            for column in range(width):
+                start = column * count // width
+                end = max((column + 1) * count // width, start + 1)
+                low.append(min(self.mins[start:end]))
+                high.append(max(self.maxs[start:end]))
+            columns = (low, high)
+
+        self._columns_width = width
+        self._columns = columns
+        return columns
+
+
+class _PeakReducer:
+    """Turns a stream of float sample buffers into quantised peaks."""
+
+    def __init__(self):
+        self.mins = array('b')
+        self.maxs = array('b')
+        self._rest = b''
+
+    def feed(self, data: bytes) -> None:
+        data = self._rest + data
+        usable = len(data) - len(data) % (SAMPLES_PER_PEAK * 4)
+        self._rest = data[usable:]
+        if usable:
+            self._reduce(data[:usable])
+
+    def finish(self) -> None:
+        if self._rest:
+            usable = len(self._rest) - len(self._rest) % 4
+            self._reduce(self._rest[:usable], partial=True)
+            self._rest = b''
+
+    def _reduce(self, data: bytes, partial: bool = False) -> None:
+        if HAVE_NUMPY:
+            import numpy as np
+            samples = np.frombuffer(data, dtype='<f4')
+            if not partial:
+                samples = samples.reshape(-1, SAMPLES_PER_PEAK)
+                low, high = samples.min(axis=1), samples.max(axis=1)
+            elif len(samples):
+                low, high = samples.min(keepdims=True), samples.max(keepdims=True)
+            else:
+                return
+            self.mins.frombytes(np.clip(low * 127, -127, 127).astype(np.int8).tobytes())
+            self.maxs.frombytes(np.clip(high * 127, -127, 127).astype(np.int8).tobytes())
+            return
+
+        samples = array('f')
+        samples.frombytes(data)
+        for start in range(0, len(samples), SAMPLES_PER_PEAK):
+            chunk = samples[start:start + SAMPLES_PER_PEAK]
+            self.mins.append(max(-127, min(127, int(min(chunk) * 127))))
+            self.maxs.append(max(-127, min(127, int(max(chunk) * 127))))
+
+
+def decode_peaks(file_path: str, cancelled: Callable[[], bool] = lambda: False) -> Optional[Waveform]:
+    """Decode a whole file into peaks. Blocks; run it on a worker thread.
+
+    Returns None when decoding fails or ``cancelled()`` becomes true.
+    """
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    if not Gst.is_initialized():
+        Gst.init(None)
+
+    pipeline = Gst.parse_launch(_PIPELINE)
+    pipeline.get_by_name('src').set_property('location', file_path)
+    sink = pipeline.get_by_name('sink')
+    bus = pipeline.get_bus()
+    reducer = _PeakReducer()
+
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        while not cancelled():
+            sample = sink.emit('try-pull-sample', Gst.SECOND // 2)
+            if sample is None:
+                error = bus.pop_filtered(Gst.MessageType.ERROR)
+                if error is not None:
+                    err, _ = error.parse_error()
+                    logger.warning(f"Cannot decode waveform of {file_path}: {err.message}")
+                    return None
+                if sink.get_property('eos'):
+                    reducer.finish()
+                    return Waveform(reducer.mins, reducer.maxs)
+                continue
+
+            buffer = sample.get_buffer()
+            success, info = buffer.map(Gst.MapFlags.READ)
+            if success:
+                try:
+                    reducer.feed(bytes(info.data))
+                finally:
+                    buffer.unmap(info)
+        return None
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+
+class WaveformCache:
+    """Peak files on disk, named by path and invalidated by (size, mtime)."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or default_cache_dir()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, file_path: str) -> str:
+        name = hashlib.sha1(file_path.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.directory, f"{name}.peaks")
+
+    def load(self, file_path: str, st: os.stat_result) -> Optional[Waveform]:
+        try:
+            with open(self._path(file_path), 'rb') as f:
+                header = f.read(_HEADER.size)
+                if len(header) != _HEADER.size:
+                    return None
+                magic, version, size, mtime_ns, rate, count = _HEADER.unpack(header)
+                if (magic != _MAGIC or version != _VERSION or rate != PEAKS_PER_SECOND
+                        or size != st.st_size or mtime_ns != st.st_mtime_ns):
+                    return None
+                mins, maxs = array('b'), array('b')
+                mins.fromfile(f, count)
+                maxs.fromfile(f, count)
+        except (OSError, EOFError):
+            return None
+        return Waveform(mins, maxs)
+
+    def store(self, file_path: str, st: os.stat_result, waveform: Waveform) -> None:
+        path = self._path(file_path)
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, st.st_size, st.st_mtime_ns,
+                                     PEAKS_PER_SECOND, len(waveform)))
+                waveform.mins.tofile(f)
+                waveform.maxs.tofile(f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not save waveform {path}: {e}")
+
+
+class WaveformLoader:
+    """Loads waveforms on one background thread, newest request first.
+
+    Only the most recently requested track matters, so a newer request
+    cancels a decode that is still running.
+    """
+
+    def __init__(self, on_ready: Callable[[str, Waveform], None], cache: Optional[WaveformCache] = None):
+        self.on_ready = on_ready
+        self.cache = cache or WaveformCache()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='oscillate-waveform')
+        self._wanted: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def request(self, file_path: str) -> None:
+        with self._lock:
+            self._wanted = file_path
+        self._executor.submit(self._load, file_path)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._wanted = None
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _is_stale(self, file_path: str) -> bool:
+        with self._lock:
+            return self._wanted != file_path
+
+    def _load(self, file_path: str) -> None:
+        if self._is_stale(file_path):
+            return
+        if HAVE_NUMPY:
+            # Drawing reduces peaks with NumPy; import it here, not mid-draw
+            import numpy  # noqa: F401
+        try:
+            st = os.stat(file_path)
+            waveform = self.cache.load(file_path, st)
+            if waveform is None:
+                waveform = decode_peaks(file_path, lambda: self._is_stale(file_path))
+                if waveform is None:
+                    return
+                self.cache.store(file_path, st, waveform)
+        except Exception as e:
+            logger.warning(f"Could not load waveform of {file_path}: {e}")
+            return
+        tracing.idle_add(self._deliver, file_path, waveform)
+
+    def _deliver(self, file_path: str, waveform: Waveform) -> bool:
+        if not self._is_stale(file_path):
+            self.on_ready(file_path, waveform)
+        return False
+
+
+def draw_waveform(cr, width: int, height: int, waveform: Waveform, fraction: float,
+                  played_rgba, remaining_rgba) -> None:
+    """Draw one bar per pixel column; the part before ``fraction`` is highlighted."""
+    low, high = waveform.columns(width)
+    middle = height / 2
+    scale = middle / 127
+    played = int(width * fraction)
+
+    for rgba, columns in ((played_rgba, range(0, min(played, len(low)))),
+                          (remaining_rgba, range(played, len(low)))):
+        cr.set_source_rgba(rgba.red, rgba.green, rgba.blue, rgba.alpha)
+        for x in columns:
+            top = middle - high[x] * scale
+            bar = max((high[x] - low[x]) * scale, 1)
+            cr.rectangle(x, top, 1, bar)
+        cr.fill()
@@ -1,78 +1,72 @@
 """
 Oscillate Media Player - Main Window Implementation
-This module contains the main window and song row implementations for the Oscillate media player.
+This module contains the main window implementation for the Oscillate media player.
 """
 
-from gi.repository import Adw, Gtk, Gdk, Gio, GLib, Pango
+from gi.repository import Adw, Gtk, Gdk, Gio, GLib
+from bisect import bisect_left
 from pathlib import Path
-from typing import Optional, Any
+from typing import Any, List
 import logging
-from .player import Player
+import os
+import threading
+from . import tracing
+from .albumart import AlbumArtLoader
+from .duplicates import DuplicateDetector
+from .library import LibraryWatcher, check_directories, walk_in_background
+from .loudness import LoudnessAnalyzer
+from .metadata import HAVE_MUTAGEN
+from .playlist import (HAVE_SECTIONS, Track, TrackListModel, create_album_header_factory,
+                       create_song_row_factory, format_duration)
+from .metadata_cache import MetadataCache
+from .playqueue import REPEAT_MODES, PlayQueue
+from .scanner import MetadataScanner, describe_errors
+from .search import SearchIndex, make_key
+from .session import PlaybackState, SessionStore
+from .sorting import SORT_NONE, CollationKeys, sorted_track_ids
+from .trackstore import TrackStore
+from .waveform import WaveformLoader, draw_waveform
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-try:
-    from mutagen.mp3 import MP3
-    from mutagen.easyid3 import EasyID3
-    HAVE_MUTAGEN = True
-except ImportError:
-    HAVE_MUTAGEN = False
-    logger.warning("Mutagen not found. Limited metadata support available.")
-
-class SongRow(Gtk.ListBoxRow):
-    """A custom ListBoxRow that represents a song in the playlist."""
-
-    def __init__(self, title: str, artist: str, file_path: str):
-        super().__init__()
-        self.file_path = file_path
-        self.active_popover: Optional[Gtk.PopoverMenu] = None
-
-        # Create layout
-        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=3)
-        vbox.set_margin_start(6)
-        vbox.set_margin_end(6)
-        vbox.set_margin_top(6)
-        vbox.set_margin_bottom(6)
-
-        # Song title with ellipsis
-        title_label = Gtk.Label(label=title)
-        title_label.set_halign(Gtk.Align.START)
-        title_label.set_ellipsize(Pango.EllipsizeMode.END)
-        title_label.add_css_class("heading")
-        vbox.append(title_label)
-
-        # Artist name with ellipsis
-        artist_label = Gtk.Label(label=artist)
-        artist_label.set_halign(Gtk.Align.START)
-        artist_label.set_ellipsize(Pango.EllipsizeMode.END)
-        artist_label.add_css_class("caption")
-        artist_label.add_css_class("dim-label")
-        vbox.append(artist_label)
-
-        self.select_check = Gtk.CheckButton()
-        self.select_check.set_css_classes(['circular'])
-        self.select_check.set_visible(False)
-
-        self.set_child(vbox)
-
-    def cleanup(self) -> None:
-        """Clean up any attached widgets before removal."""
-        if self.active_popover:
-            self.active_popover.unparent()
-            self.active_popover = None
+# Player times are GStreamer nanoseconds; Gst itself loads with the player
+SECOND = 1_000_000_000
+MSECOND = 1_000_000
+
+# MPRIS LoopStatus, and the repeat button's icon and tooltip, by repeat mode
+_LOOP_STATUS = {'none': 'None', 'all': 'Playlist', 'one': 'Track'}
+_REPEAT_BUTTON = {
+    'none': ('media-playlist-consecutive-symbolic', "Repeat Off"),
+    'all': ('media-playlist-repeat-symbolic', "Repeat All"),
+    'one': ('media-playlist-repeat-song-symbolic', "Repeat One"),
+}
 
 @Gtk.Template(resource_path='/com/example/Oscillate/window.ui')
 class OscillateWindow(Adw.ApplicationWindow):
     __gtype_name__ = 'OscillateWindow'
 
+    SEARCH_DEBOUNCE_MS = 120
+    # Imports arrive in batches; the playlist is re-sorted once they settle
+    SORT_DEBOUNCE_MS = 300
+
+    # The window is also the MPRIS host (see mpris.MprisHost)
+    can_raise = True
+    can_quit = True
+
+    # Bounds for the adaptive position refresh, in milliseconds
+    MIN_POSITION_INTERVAL = 33
+    MAX_POSITION_INTERVAL = 1000
+    SESSION_SAVE_DELAY_S = 2
+    SESSION_STATE_INTERVAL_S = 5
+
     select_all_button = Gtk.Template.Child()
-    songs_list_box = Gtk.Template.Child()
+    songs_list_view = Gtk.Template.Child()
+    playlist_title = Gtk.Template.Child()
     headerbar = Gtk.Template.Child()
     play_button = Gtk.Template.Child()
     previous_button = Gtk.Template.Child()
     next_button = Gtk.Template.Child()
+    repeat_button = Gtk.Template.Child()
     song_progress_scale = Gtk.Template.Child()
     time_position_label = Gtk.Template.Child()
     time_duration_label = Gtk.Template.Child()
@@ -80,6 +74,7 @@ class OscillateWindow(Adw.ApplicationWindow):
     toggle_sidebar_button = Gtk.Template.Child()
     content_box = Gtk.Template.Child()
     album_picture = Gtk.Template.Child()
+    waveform_area = Gtk.Template.Child()
     song_title_label = Gtk.Template.Child()
     artist_name_label = Gtk.Template.Child()
     volume_scale = Gtk.Template.Child()
@@ -92,19 +87,23 @@ class OscillateWindow(Adw.ApplicationWindow):
     search_revealer = Gtk.Template.Child()
     search_entry = Gtk.Template.Child()
     search_button = Gtk.Template.Child()
+    scan_revealer = Gtk.Template.Child()
+    scan_progress_bar = Gtk.Template.Child()
+    cancel_scan_button = Gtk.Template.Child()
 
-    select_all_button.connect('clicked', on_select_all)
     selection_mode = False
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.selection_mode = None
+        self.selection_mode = False
 
         self.select_all_button.connect('clicked', self.on_select_all)
 
-        # Initialize state
-        self.player = Player(self)
+        # Initialize state. The player (and with it GStreamer) is created
+        # after the first frame, or earlier if something needs it
+        self._player = None
+        self.mpris = None
         self.current_song_index = -1
 
         # Initialize settings
@@ -112,12 +111,21 @@ class OscillateWindow(Adw.ApplicationWindow):
 
         # Connect signals
         self.toggle_sidebar_button.connect('toggled', self.on_sidebar_button_toggled)
-        self.songs_list_box.connect('row-activated', self.on_song_activated)
+        self.songs_list_view.connect('activate', self.on_song_activated)
         self.play_button.connect('clicked', self.on_play_clicked)
         self.next_button.connect('clicked', self.on_next_clicked)
         self.previous_button.connect('clicked', self.on_previous_clicked)
         self.mute_button.connect('clicked', self.on_mute_clicked)
-        self.volume_scale.connect('value-changed', self.on_volume_changed)
+        self.volume_handler = self.volume_scale.connect('value-changed', self.on_volume_scale_changed)
+        self.song_progress_scale.connect('change-value', self.on_seek)
+
+        # Position refresh state; see schedule_position_update(). Updates
+        # stop while the window cannot be seen
+        self.position_timeout_id = 0
+        self.position_tick_id = 0
+        self.displayed_second = -1
+        self.connect('map', lambda *_: self.start_position_updates())
+        self.connect('unmap', lambda *_: self.stop_position_updates())
 
         self.delete_button.connect('clicked', self.on_delete_button_clicked)
         self.cancel_delete_button.connect('clicked', self.on_cancel_delete)
@@ -125,9 +133,89 @@ class OscillateWindow(Adw.ApplicationWindow):
 
         self.search_button.connect('toggled', self.on_search_toggled)
         self.search_entry.connect('search-changed', self.on_search_changed)
+        self.search_entry.connect('activate', self.on_search_activate)
+
+        # Tags are read on worker threads and arrive here in batches; files
+        # seen in earlier sessions come straight from the metadata cache
+        self.metadata_cache = MetadataCache()
+        self.scanner = MetadataScanner(
+            self.on_scan_batch,
+            on_progress=self.on_scan_progress,
+            on_finished=self.on_scan_finished,
+            reader=self.metadata_cache.read,
+        )
 
-        # Set up initial state
-        self.songs_list_box.set_selection_mode(Gtk.SelectionMode.MULTIPLE)
+        # Loudness is measured in worker processes and applied by the player
+        self.loudness_analyzer = LoudnessAnalyzer(self.metadata_cache,
+                                                  on_finished=self.on_loudness_analysis_finished)
+        self.settings.connect('changed::replaygain-mode', lambda *_: self.start_loudness_analysis())
+
+        # Album art is decoded and scaled on worker threads
+        self.album_art = AlbumArtLoader(self.metadata_cache)
+        self.settings.connect('changed::show-album-art', self.update_album_art)
+        self.update_album_art()
+
+        # Waveforms are decoded once per file and drawn from cached peaks
+        self.waveform = None
+        self.waveform_loader = WaveformLoader(self.on_waveform_loaded)
+        self.waveform_area.set_draw_func(self.on_draw_waveform)
+        self.song_progress_scale.get_adjustment().connect(
+            'value-changed', lambda *_: self.waveform_area.queue_draw()
+        )
+        self.settings.connect('changed::show-waveform', self.update_waveform)
+        self.cancel_scan_button.connect('clicked', self.on_cancel_scan)
+        self.connect('close-request', self.on_close_request)
+
+        # Track data lives in a columnar TrackStore. The view reads it through
+        # a list model and only builds rows for what is on screen, recycling
+        # them while scrolling
+        self.track_store = TrackStore()
+        self.playlist_model = TrackListModel(self.track_store)
+        self.playlist_model.connect('items-changed', self.update_playlist_summary)
+        self.duplicates = DuplicateDetector(self.track_store, self.metadata_cache, self.on_duplicates_found)
+        self.search_index = SearchIndex()
+        self.search_query = ""
+        self.search_matches = None
+        self.search_timeout_id = 0
+        self.song_filter = Gtk.CustomFilter.new(self.filter_track)
+        self.filtered_songs = Gtk.FilterListModel(model=self.playlist_model, incremental=True)
+        self.selection_model = Gtk.MultiSelection(model=self.filtered_songs)
+        self.songs_list_view.set_model(self.selection_model)
+        self.songs_list_view.set_factory(create_song_row_factory())
+
+        # Sorting compares cached collation keys and reorders the model once;
+        # grouping keeps albums together and shows a header above each
+        self.collation_keys = CollationKeys()
+        self.sort_timeout_id = 0
+        self.album_header_factory = create_album_header_factory() if HAVE_SECTIONS else None
+        self.add_action(self.settings.create_action('playlist-sort'))
+        self.add_action(self.settings.create_action('group-by-album'))
+        self.settings.connect('changed::playlist-sort', lambda *_: self.sort_playlist())
+        self.settings.connect('changed::group-by-album', lambda *_: self.sort_playlist())
+        self.update_album_headers()
+
+        # What plays next is decided by the play queue, apart from the
+        # order shown: shuffle, repeat, songs queued to play next, history
+        self.play_queue = PlayQueue(self.track_store)
+        self.play_queue.set_shuffle(self.settings.get_boolean('shuffle'))
+        self.play_queue.set_repeat(self.settings.get_string('repeat-mode'))
+        self.add_action(self.settings.create_action('shuffle'))
+        self.get_application().set_accels_for_action('win.shuffle', ['<primary>s'])
+        self.create_action('cycle-repeat', self.on_cycle_repeat, ['<primary>r'])
+        self.create_action('play-next', lambda *_: self.queue_selected_songs(), ['<primary>Return'])
+        self.settings.connect('changed::shuffle', self.on_play_order_changed)
+        self.settings.connect('changed::repeat-mode', self.on_play_order_changed)
+        self.update_repeat_button()
+
+        # The playlist and playback position are saved as binary snapshots
+        # and restored after the first frame without reading any tags
+        self.session_store = SessionStore()
+        self.session_restoring = False
+        self.session_save_id = 0
+        self.session_state_id = 0
+        self.resume_position = 0
+        # A file opened over MPRIS plays as soon as its tags are read
+        self.open_uri_path = None
 
         # Add open button to header bar
         open_button = Gtk.Button(icon_name="folder-music-symbolic")
@@ -135,9 +223,69 @@ class OscillateWindow(Adw.ApplicationWindow):
         open_button.connect('clicked', self.on_open_button_clicked)
         self.headerbar.pack_start(open_button)
 
+        add_folder_button = Gtk.Button(icon_name="folder-symbolic")
+        add_folder_button.set_tooltip_text("Add Music Folder")
+        add_folder_button.set_action_name("win.add-folder")
+        self.headerbar.pack_start(add_folder_button)
+
+        # Folders are walked off the main thread and, when watched, kept in
+        # sync through file monitors instead of being rescanned
+        self.walk_cancelled = threading.Event()
+        self.library_watcher = LibraryWatcher(
+            self.on_library_files_added,
+            self.on_library_path_removed,
+            self.on_library_path_renamed,
+        )
+        self.create_action('add-folder', lambda *_: self.choose_folder(watch=False))
+        self.create_action('watch-folder', lambda *_: self.choose_folder(watch=True))
+        self.create_action('unwatch-folders', self.on_unwatch_folders)
+
+        # Everything the first frame does not need waits until it is drawn
+        self.first_frame_handler = 0
+        self.connect('realize', self.on_realize)
+
         if not HAVE_MUTAGEN:
             self.show_mutagen_missing_warning()
 
+    @property
+    def player(self):
+        """The player, created on first use."""
+        if self._player is None:
+            from .player import Player
+            self._player = Player()
+            self._player.gain_lookup = self.metadata_cache.loudness
+            self._player.next_track = self.peek_next_track
+            self._player.add_observer(self)
+        return self._player
+
+    def on_realize(self, window: Gtk.Window) -> None:
+        clock = self.get_frame_clock()
+        self.first_frame_handler = clock.connect('after-paint', self.on_first_frame)
+        self.get_surface().connect('notify::state', self.on_surface_state_changed)
+
+    def on_first_frame(self, clock) -> None:
+        clock.disconnect(self.first_frame_handler)
+        self.first_frame_handler = 0
+        tracing.idle_add(self.finish_startup, priority=GLib.PRIORITY_LOW)
+
+    def finish_startup(self) -> bool:
+        """Start the subsystems the first frame did not need (called from idle)."""
+        self.player  # creating the player initialises GStreamer
+        from .mpris import MprisService
+        self.mpris = MprisService(self.player, self)
+        if self.settings.get_boolean('save-playlist'):
+            self.restore_session()
+        else:
+            self.restore_watched_folders()
+        self.session_state_id = tracing.timeout_add_seconds(self.SESSION_STATE_INTERVAL_S,
+                                                            self.save_session_state)
+        self.prune_metadata_cache()
+
+        profile = getattr(self.get_application(), 'startup_profile', None)
+        if profile is not None:
+            profile.mark("deferred startup finished")
+        return False
+
     def on_search_toggled(self, button):
         is_active = button.get_active()
         self.search_revealer.set_reveal_child(is_active)
@@ -148,25 +296,49 @@ class OscillateWindow(Adw.ApplicationWindow):
             self.filter_playlist("")
 
     def on_search_changed(self, entry):
-        query = entry.get_text().strip().lower()
-        self.filter_playlist(query)
+        # Typing quickly only runs the last query
+        if self.search_timeout_id:
+            GLib.source_remove(self.search_timeout_id)
+        self.search_timeout_id = tracing.timeout_add(self.SEARCH_DEBOUNCE_MS, self.on_search_timeout)
+
+    def on_search_activate(self, entry):
+        # Enter applies the query straight away
+        if self.search_timeout_id:
+            GLib.source_remove(self.search_timeout_id)
+            self.on_search_timeout()
+
+    def on_search_timeout(self) -> bool:
+        self.search_timeout_id = 0
+        self.filter_playlist(self.search_entry.get_text().strip())
+        return False
 
+    @tracing.traced(category='playlist')
     def filter_playlist(self, query):
-        row = self.songs_list_box.get_first_child()
-        while row:
-            title_label = row.get_child().get_first_child()
-            artist_label = row.get_child().get_last_child()
-
-            title = title_label.get_label().lower()
-            artist = artist_label.get_label().lower()
-
-            visible = query in title or query in artist
-            row.set_visible(visible)
+        previous_query = self.search_query
+        previous_matches = self.search_matches
+        if query == previous_query:
+            return
 
-            if not visible and row.is_selected():
-                self.songs_list_box.unselect_row(row)
+        self.search_query = query
+        self.search_matches = self.search_index.search(query)
+        self.selection_model.unselect_all()
+
+        if self.search_matches is None:
+            # No filter at all is cheaper than one that accepts everything
+            self.filtered_songs.set_filter(None)
+        elif previous_matches is None:
+            self.filtered_songs.set_filter(self.song_filter)
+            self.song_filter.changed(Gtk.FilterChange.DIFFERENT)
+        elif previous_query in query:
+            # Narrowing: GTK only re-checks the songs currently shown
+            self.song_filter.changed(Gtk.FilterChange.MORE_STRICT)
+        elif query in previous_query:
+            self.song_filter.changed(Gtk.FilterChange.LESS_STRICT)
+        else:
+            self.song_filter.changed(Gtk.FilterChange.DIFFERENT)
 
-            row = row.get_next_sibling()
+    def filter_track(self, track: Track) -> bool:
+        return track.track_id in self.search_matches
 
     def show_toast(self, message: str):
         """Show a toast notification."""
@@ -220,7 +392,7 @@ class OscillateWindow(Adw.ApplicationWindow):
         self.delete_revealer.set_reveal_child(False)
 
     def on_confirm_delete(self, button):
-        selected_rows = self.get_selected_rows()
+        selected_rows = self.get_selected_ids()
 
         if not selected_rows:
             self.delete_revealer.set_reveal_child(False)
@@ -244,64 +416,71 @@ class OscillateWindow(Adw.ApplicationWindow):
         dialog.connect("response", on_response)
         dialog.present()
 
-    def get_selected_rows(self):
-        selected_rows = []
-        row = self.songs_list_box.get_first_child()
-        while row:
-            if row.is_selected():
-                selected_rows.append(row)
-            row = row.get_next_sibling()
-        return selected_rows
+    def get_selected_positions(self) -> List[int]:
+        """Playlist positions of the selected songs, in ascending order."""
+        view_positions = []
+        found, bitset_iter, position = Gtk.BitsetIter.init_first(self.selection_model.get_selection())
+        while found:
+            view_positions.append(position)
+            found, position = bitset_iter.next()
 
+        if self.filtered_songs.get_filter() is None:
+            return view_positions
 
-    def on_delete_request(self):
-        """Handle delete request from menu or keyboard."""
-        self.delete_selected_song()
+        # While filtering, view positions have to be mapped back to the store
+        return sorted(self.get_store_position(i) for i in view_positions)
 
-    def delete_selected_song(self, *args: Any) -> None:
-        selected_rows = []
-        row = self.songs_list_box.get_first_child()
-        while row:
-            if row.is_selected():
-                selected_rows.append(row)
-            row = row.get_next_sibling()
+    def get_selected_ids(self) -> List[int]:
+        """Track ids of the selected songs, which survive playlist changes."""
+        return [self.track_store.id_at(i) for i in self.get_selected_positions()]
 
-        if not selected_rows:
-            return
+    def get_store_position(self, view_position: int) -> int:
+        """Map a position in the (possibly filtered) view to the playlist."""
+        track = self.filtered_songs.get_item(view_position)
+        return self.track_store.position_of(track.track_id) if track else -1
 
-        dialog = Adw.MessageDialog(
-            transient_for=self,
-            heading=f"Delete {len(selected_rows)} selected song{'s' if len(selected_rows) > 1 else ''}?",
-            body="This action cannot be undone."
-        )
-        dialog.add_response("cancel", "Cancel")
-        dialog.add_response("delete", "Delete")
-        dialog.set_response_appearance("delete", Adw.ResponseAppearance.DESTRUCTIVE)
-        dialog.connect("response", lambda d, r: self.perform_delete(selected_rows) if r == "delete" else None)
-        dialog.present()
 
-    def perform_delete(self, rows_to_delete: list):
+    def on_delete_request(self):
+        """Handle delete request from menu or keyboard."""
+        self.delete_selected_song()
+
+    def perform_delete(self, rows_to_delete: List[int]):
+        """Remove songs by track id and report how many went."""
         try:
-            current_index = self.current_song_index
-            deleted_indexes = [row.get_index() for row in rows_to_delete]
+            positions = [self.track_store.position_of(i) for i in rows_to_delete]
+            positions = [position for position in positions if position >= 0]
+            self.remove_positions(positions)
+            self.show_toast(f"Removed {len(positions)} song{'s' if len(positions) != 1 else ''}")
 
-            for row in sorted(rows_to_delete, key=lambda r: r.get_index(), reverse=True):
-                if row.get_index() == current_index:
-                    self.player.stop()
-                    self.current_song_index = -1
-                    self.update_now_playing_labels()
+        except Exception as e:
+            logger.error(f"Deletion failed: {e}")
+            self.show_error_dialog("Deletion Error", str(e))
 
-                self.songs_list_box.remove(row)
+    def remove_positions(self, positions: List[int]) -> None:
+        """Remove songs from the playlist in one model change.
 
-            if self.current_song_index != -1:
-                num_deleted_before = sum(1 for i in deleted_indexes if i < self.current_song_index)
-                self.current_song_index -= num_deleted_before
+        Stops playback if the current song goes, otherwise shifts
+        current_song_index past the removed songs in front of it.
+        """
+        if not positions:
+            return
 
-            self.show_toast(f"Removed {len(rows_to_delete)} song{'s' if len(rows_to_delete) > 1 else ''}")
+        positions = sorted(set(positions))
+        current_index = self.current_song_index
+        if current_index >= 0:
+            removed_before = bisect_left(positions, current_index)
+            if removed_before < len(positions) and positions[removed_before] == current_index:
+                self.player.stop()
+                self.current_song_index = -1
+                self.update_now_playing_labels()
+            else:
+                self.current_song_index = current_index - removed_before
 
-        except Exception as e:
-            logger.error(f"Deletion failed: {e}")
-            self.show_error_dialog("Deletion Error", str(e))
+        removed = self.playlist_model.remove_positions(positions)
+        for track_id in removed:
+            self.search_index.remove(track_id)
+        self.play_queue.removed(removed, positions)
+        self.schedule_session_save()
 
     def update_now_playing_labels(self):
         self.song_title_label.set_label("No song playing")
@@ -326,7 +505,7 @@ class OscillateWindow(Adw.ApplicationWindow):
     def on_open_button_clicked(self, button: Gtk.Button) -> None:
         """Handle click on the open button."""
         dialog = Gtk.FileChooserDialog(
-            title="Choose MP3 Files",
+            title="Choose Music Files",
             parent=self,
             action=Gtk.FileChooserAction.OPEN,
         )
@@ -339,8 +518,8 @@ class OscillateWindow(Adw.ApplicationWindow):
         )
 
         file_filter = Gtk.FileFilter()
-        file_filter.set_name("MP3 files")
-        file_filter.add_mime_type("audio/mpeg")
+        file_filter.set_name("Audio files")
+        file_filter.add_mime_type("audio/*")
         dialog.add_filter(file_filter)
 
         dialog.set_select_multiple(True)
@@ -353,49 +532,341 @@ class OscillateWindow(Adw.ApplicationWindow):
         try:
             if response == Gtk.ResponseType.ACCEPT:
                 files = dialog.get_files()
+                self.import_files([file.get_path() for file in files])
+        finally:
+            dialog.destroy()
 
-                # Store initial state
-                had_songs = self.songs_list_box.get_first_child() is not None
+    def choose_folder(self, watch: bool) -> None:
+        """Ask for a music folder to import, and optionally keep watching."""
+        dialog = Gtk.FileChooserDialog(
+            title="Watch Music Folder" if watch else "Add Music Folder",
+            parent=self,
+            action=Gtk.FileChooserAction.SELECT_FOLDER,
+        )
 
-                # Add all files
-                for file in files:
-                    self.add_song_from_file(file.get_path())
+        dialog.add_buttons(
+            "Cancel",
+            Gtk.ResponseType.CANCEL,
+            "Watch" if watch else "Add",
+            Gtk.ResponseType.ACCEPT,
+        )
+
+        dialog.connect('response', self.on_folder_dialog_response, watch)
+        dialog.present()
 
-                # Show summary toast if multiple files were added
-                if len(files) > 1:
-                    toast = Adw.Toast.new(f"Added {len(files)} songs to playlist")
-                    toast.set_timeout(3)
-                    self.toast_overlay.add_toast(toast)
+    def on_folder_dialog_response(self, dialog: Gtk.FileChooserDialog,
+                                  response: Gtk.ResponseType, watch: bool) -> None:
+        """Handle response from the folder chooser dialog."""
+        try:
+            if response == Gtk.ResponseType.ACCEPT:
+                folder = dialog.get_file().get_path()
+                if watch:
+                    folders = self.settings.get_strv("watched-folders")
+                    if folder not in folders:
+                        self.settings.set_strv("watched-folders", folders + [folder])
+                self.import_folders([folder], watch)
         finally:
             dialog.destroy()
 
-    def add_song_from_file(self, file_path: str) -> None:
-        """Add a song to the playlist from a file path."""
-        try:
-            if HAVE_MUTAGEN:
-                audio = MP3(file_path, ID3=EasyID3)
-                title = audio.get('title', [Path(file_path).stem])[0]
-                artist = audio.get('artist', ['Unknown Artist'])[0]
+    def import_folders(self, folders: List[str], watch: bool) -> None:
+        """Stream the audio files below folders into the scanner."""
+        # The progress bar shows up with the first batch of tags
+        self.walk_cancelled.clear()
+        walk_in_background(
+            folders,
+            self.scanner.queue,
+            on_directories=self.library_watcher.watch if watch else None,
+            cancelled=self.walk_cancelled,
+        )
+
+    def restore_watched_folders(self) -> bool:
+        """Pick watched folders back up at startup.
+
+        Songs restored with the session are kept and the folders are not
+        walked again: the directories watched last time are stat'ed on a
+        thread, and only those changed since are listed, for files added or
+        removed while nothing was watching. Folders never watched before are
+        walked in full.
+        """
+        folders = [f for f in self.settings.get_strv("watched-folders") if Path(f).is_dir()]
+        if not folders:
+            return False
+
+        known = list(self.track_store.paths())
+        if not known:
+            self.import_folders(folders, watch=True)
+            return False
+
+        def check():
+            changes = check_directories(folders, self.session_store.load_directories(), known)
+            tracing.idle_add(self.apply_directory_changes, changes,
+                             set(known) if changes.unwalked else None)
+
+        threading.Thread(target=check, name='oscillate-folder-check', daemon=True).start()
+        return False
+
+    def apply_directory_changes(self, changes, known) -> bool:
+        """Watch the directories check_directories() found and apply what changed."""
+        self.library_watcher.watch(changes.watched)
+        track_ids = set()
+        for path in changes.removed:
+            track_ids.update(self.track_store.find_path(path) or self.track_store.find_under(path))
+        if track_ids:
+            self.remove_positions([self.track_store.position_of(i) for i in track_ids])
+        self.scanner.queue(changes.added)
+        if changes.unwalked:
+            self.walk_known_folders(changes.unwalked, known)
+        return False
+
+    def walk_known_folders(self, folders: List[str], known: set) -> None:
+        """Walk and watch folders whose songs may already be in the playlist.
+
+        The walk only queues files the playlist does not have yet, and
+        afterwards drops songs under the folders whose files are gone.
+        """
+        seen = set()
+        prefixes = tuple(folder.rstrip(os.sep) + os.sep for folder in folders)
+
+        def on_files(paths):
+            # Runs on the walking thread; known is never modified
+            seen.update(paths)
+            self.scanner.queue([path for path in paths if path not in known])
+
+        def on_directories(directories):
+            self.library_watcher.watch(directories)
+            missing = {path for path in known - seen if path.startswith(prefixes)}
+            if missing:
+                self.remove_positions([position for position, path in enumerate(self.track_store.paths())
+                                       if path in missing])
+
+        self.walk_cancelled.clear()
+        walk_in_background(folders, on_files, on_directories=on_directories,
+                           cancelled=self.walk_cancelled)
+
+    def restore_session(self) -> None:
+        """Load the saved playlist on a thread and append it on the main loop."""
+        self.session_restoring = True
+
+        def load():
+            session, state = self.session_store.load()
+            keys = None
+            if session is not None:
+                keys = [make_key(title, artist) for title, artist in zip(session.titles, session.artists)]
+            tracing.idle_add(self.apply_session, session, keys, state)
+
+        threading.Thread(target=load, name='oscillate-session-load', daemon=True).start()
+
+    def apply_session(self, session, keys, state) -> bool:
+        """Append a loaded session and put back the current song (called from idle)."""
+        self.session_restoring = False
+        base = len(self.track_store)
+        if session is not None and len(session):
+            track_ids = self.playlist_model.extend_columns(*session.columns())
+            self.search_index.extend(dict(zip(track_ids, keys)))
+            self.play_queue.added(track_ids)
+            self.check_duplicates(track_ids, imported=False)
+            if self.search_query:
+                # A query typed during the restore has to see the new songs
+                query, self.search_query = self.search_query, ""
+                self.filter_playlist(query)
+            logger.info(f"Restored {len(session)} songs from the last session")
+
+            position = base + state.position if state is not None and state.position >= 0 else -1
+            if (self.current_song_index < 0 and 0 <= position < len(self.track_store)
+                    and self.track_store.file_path(self.track_store.id_at(position)) == state.file_path):
+                self.current_song_index = position
+                self.play_queue.start(self.track_store.id_at(position))
+                if self.settings.get_boolean('remember-position'):
+                    self.resume_position = state.offset_ns
+                self.show_now_playing(self.track_store.id_at(position))
+
+        if base:
+            # Songs added while restoring are not in the snapshot yet
+            self.schedule_session_save()
+            self.schedule_sort()
+        self.restore_watched_folders()
+        self.start_loudness_analysis()
+        return False
+
+    def schedule_session_save(self) -> None:
+        """Save the playlist shortly, so a burst of changes is written once."""
+        if self.session_save_id or not self.settings.get_boolean('save-playlist'):
+            return
+        self.session_save_id = tracing.timeout_add_seconds(self.SESSION_SAVE_DELAY_S, self.save_session)
+
+    def save_session(self) -> bool:
+        """Write the playlist snapshot (called from a timeout)."""
+        if self.session_restoring:
+            # Saving now would drop the songs that are still being restored
+            return True
+        self.session_save_id = 0
+        self.session_store.save_playlist(self.track_store.columns())
+        return False
+
+    def save_session_state(self) -> bool:
+        """Save the current song and position, if they changed (called from a timeout)."""
+        if self.session_restoring or not self.settings.get_boolean('save-playlist'):
+            return True
+        if self.current_song_index < 0:
+            state = PlaybackState(-1, '', 0)
+        else:
+            file_path = self.track_store.file_path(self.track_store.id_at(self.current_song_index))
+            if self._player is not None and self._player.current_file == file_path:
+                offset = self._player.get_position()
             else:
-                title = Path(file_path).stem
-                artist = 'Unknown Artist'
+                offset = self.resume_position
+            state = PlaybackState(self.current_song_index, file_path, offset)
+        self.session_store.save_state(state)
+        return True
+
+    def on_unwatch_folders(self, action: Gio.SimpleAction, param: Any) -> None:
+        """Stop watching every folder. Songs already added stay."""
+        self.library_watcher.unwatch_all()
+        self.settings.set_strv("watched-folders", [])
+        self.show_toast("Stopped watching folders")
+
+    def on_library_files_added(self, file_paths: List[str]) -> None:
+        """Files appeared in a watched folder."""
+        new_paths = [path for path in file_paths if not self.track_store.find_path(path)]
+        self.scanner.queue(new_paths)
+
+    def on_library_path_removed(self, path: str) -> None:
+        """A file or folder disappeared from a watched folder."""
+        track_ids = self.track_store.find_path(path) or self.track_store.find_under(path)
+        if track_ids:
+            self.remove_positions([self.track_store.position_of(i) for i in track_ids])
+
+    def on_library_path_renamed(self, old_path: str, new_path: str) -> None:
+        """A file or folder was renamed inside a watched folder."""
+        track_ids = self.track_store.find_path(old_path)
+        for track_id in track_ids:
+            self.track_store.move(track_id, new_path)
+        if not track_ids:
+            self.track_store.move_directory(old_path, new_path)
+        self.schedule_session_save()
+
+    def create_action(self, name, callback, shortcuts=None):
+        """Add a window action."""
+        action = Gio.SimpleAction.new(name, None)
+        action.connect("activate", callback)
+        self.add_action(action)
+        if shortcuts:
+            self.get_application().set_accels_for_action(f"win.{name}", shortcuts)
+
+    def import_files(self, file_paths: list) -> None:
+        """Queue files for background tag reading."""
+        if not file_paths:
+            return
+        self.scanner.queue(file_paths)
+        self.scan_progress_bar.set_fraction(0)
+        self.scan_revealer.set_reveal_child(True)
+
+    def on_scan_batch(self, songs: list) -> None:
+        """Append a batch of scanned songs to the playlist."""
+        self.append_songs(songs)
+
+    def on_scan_progress(self, done: int, total: int) -> None:
+        """Update the import progress bar."""
+        self.scan_revealer.set_reveal_child(True)
+        self.scan_progress_bar.set_fraction(done / total)
+        self.scan_progress_bar.set_text(f"Reading tags {done} / {total}")
+
+    def on_scan_finished(self, added: int, errors: list, cancelled: bool) -> None:
+        """Hide the progress bar and summarise the import."""
+        self.scan_revealer.set_reveal_child(False)
+        self.metadata_cache.flush()
+        self.open_uri_path = None
+        logger.debug(f"Track store holds {len(self.track_store)} songs, "
+                     f"{self.track_store.bytes_per_track():.0f} bytes each")
+        self.start_loudness_analysis()
+
+        if cancelled:
+            self.show_toast(f"Import cancelled after {added} song{'s' if added != 1 else ''}")
+        elif added > 1:
+            self.show_toast(f"Added {added} songs to playlist")
+
+        if errors:
+            self.show_error_dialog(
+                "Error Adding Songs",
+                f"Could not add {len(errors)} file{'s' if len(errors) > 1 else ''}:\n"
+                f"{describe_errors(errors)}"
+            )
 
-            row = SongRow(title, artist, file_path)
-            self.songs_list_box.append(row)
+    def start_loudness_analysis(self) -> bool:
+        """Measure the loudness of playlist songs that have not been analysed yet."""
+        if self.settings.get_string('replaygain-mode') != 'off' and len(self.track_store):
+            self.loudness_analyzer.start(self.track_store.paths())
+        return False
 
-            # Check if we should auto-play
-            should_autoplay = self.settings.get_boolean("autoplay")
-            is_first_song = self.songs_list_box.get_first_child() == row
-            no_song_playing = self.current_song_index == -1
+    def on_loudness_analysis_finished(self, done: int, cancelled: bool) -> None:
+        logger.info(f"Loudness analysis {'stopped' if cancelled else 'finished'} after {done} files")
+
+    def on_cancel_scan(self, button: Gtk.Button) -> None:
+        """Stop an import that is still running."""
+        self.walk_cancelled.set()
+        self.scanner.cancel()
+
+    def on_close_request(self, window: Gtk.Window) -> bool:
+        """Stop background work before the window goes away."""
+        self.walk_cancelled.set()
+        self.library_watcher.unwatch_all()
+        self.stop_position_updates()
+        if self.mpris is not None:
+            self.mpris.shutdown()
+        if self._player is not None:
+            self._player.shutdown()
+        self.scanner.shutdown()
+        self.album_art.shutdown()
+        self.duplicates.shutdown()
+        self.loudness_analyzer.stop()
+        self.waveform_loader.shutdown()
+        self.close_session()
+        self.metadata_cache.close()
+        return False
 
-            if should_autoplay and is_first_song and no_song_playing:
-                toast = Adw.Toast.new(f"Auto-playing: {title}")
-                toast.set_timeout(3)  # 3 seconds
-                self.toast_overlay.add_toast(toast)
+    def check_duplicates(self, track_ids, imported: bool = True) -> None:
+        """Look for the audio of new tracks elsewhere in the playlist."""
+        if self.settings.get_string('duplicate-tracks') != 'off':
+            self.duplicates.add(track_ids, imported)
 
-                # Start playing the first song
-                GLib.idle_add(self.start_autoplay, row)
+    def on_duplicates_found(self, pairs: list, imported: bool) -> None:
+        """Skip or mark tracks the detector found twice (called from idle).
 
+        Only freshly imported songs are skipped; restored ones, kept when
+        they were added, are marked again.
+        """
+        mode = self.settings.get_string('duplicate-tracks')
+        if mode == 'off':
+            return
+        track_ids = [track_id for track_id, _ in pairs]
+        if imported and mode == 'skip':
+            self.remove_positions([self.track_store.position_of(i) for i in track_ids])
+            self.show_toast(f"Skipped {len(track_ids)} duplicate song{'s' if len(track_ids) != 1 else ''}")
+            return
+        self.track_store.duplicates.update(track_ids)
+        self.playlist_model.rows_changed(track_ids)
+
+    def close_session(self) -> None:
+        """Write the session one last time and wait for the writes to finish."""
+        for source_id in (self.session_save_id, self.session_state_id):
+            if source_id:
+                GLib.source_remove(source_id)
+        self.session_save_id = self.session_state_id = 0
+        if self.settings.get_boolean('save-playlist') and not self.session_restoring:
+            self.session_store.save_playlist(self.track_store.columns())
+            self.save_session_state()
+            self.session_store.save_directories(self.library_watcher.directories())
+        self.session_store.close()
+
+    def prune_metadata_cache(self) -> bool:
+        """Drop stale metadata cache entries."""
+        self.metadata_cache.prune()
+        return False
+
+    def add_song_from_file(self, file_path: str) -> None:
+        """Add a song to the playlist from a file path."""
+        try:
+            self.append_songs([self.metadata_cache.read(file_path)])
         except Exception as e:
             logger.error(f"Error adding song {file_path}: {e}")
             self.show_error_dialog(
@@ -403,20 +874,60 @@ class OscillateWindow(Adw.ApplicationWindow):
                 f"Could not add {Path(file_path).name}: {str(e)}"
             )
 
-    def start_autoplay(self, row: SongRow) -> bool:
+    def append_songs(self, songs: list) -> None:
+        """Append already-read songs to the playlist."""
+        if not songs:
+            return
+
+        first_position = len(self.track_store)
+        was_empty = first_position == 0
+        track_ids = self.playlist_model.append(songs)
+        for track_id, song in zip(track_ids, songs):
+            self.search_index.add(track_id, song.title, song.artist)
+        self.play_queue.added(track_ids)
+        self.schedule_session_save()
+        self.schedule_sort()
+        self.check_duplicates(track_ids)
+
+        if self.open_uri_path is not None:
+            for track_id in track_ids:
+                if self.track_store.file_path(track_id) == self.open_uri_path:
+                    self.open_uri_path = None
+                    tracing.idle_add(self.play_opened_track, track_id)
+                    return
+
+        # Check if we should auto-play
+        should_autoplay = self.settings.get_boolean("autoplay")
+        no_song_playing = self.current_song_index == -1
+
+        if should_autoplay and was_empty and no_song_playing:
+            toast = Adw.Toast.new(f"Auto-playing: {songs[0].title}")
+            toast.set_timeout(3)  # 3 seconds
+            self.toast_overlay.add_toast(toast)
+
+            # Start playing the first song
+            tracing.idle_add(self.start_autoplay, first_position)
+
+    def play_opened_track(self, track_id: int) -> bool:
+        """Play a song opened over MPRIS (called from idle)."""
+        if self.track_store.contains(track_id):
+            self.play_track_at(self.track_store.position_of(track_id))
+        return False
+
+    def start_autoplay(self, position: int) -> bool:
         """Start playing a song (called from idle)."""
-        self.current_song_index = 0
-        self.on_song_activated(self.songs_list_box, row)
+        self.current_song_index = position
+        self.play_track_at(position)
         return False
 
     def on_play_clicked(self, button: Gtk.Button) -> None:
         """Handle play button clicks."""
         if self.current_song_index < 0:
-            # No song selected, play first song if available
-            first_row = self.songs_list_box.get_first_child()
-            if first_row:
-                self.current_song_index = 0
-                self.on_song_activated(self.songs_list_box, first_row)
+            # No song selected: the first one, or a random one when shuffling
+            self.play_next_track()
+        elif self.player.current_file is None:
+            # A song restored from the last session, not started yet
+            self.play_track_at(self.current_song_index, self.resume_position)
         else:
             self.player.toggle_playback()
 
@@ -428,40 +939,410 @@ class OscillateWindow(Adw.ApplicationWindow):
         """Handle previous button clicks."""
         self.play_previous_track()
 
-    def play_next_track(self) -> None:
-        """Play the next track in the playlist."""
+    def on_cycle_repeat(self, action: Gio.SimpleAction, param: Any) -> None:
+        """Step the repeat mode through off, all and one."""
+        mode = self.settings.get_string('repeat-mode')
+        next_mode = REPEAT_MODES[(REPEAT_MODES.index(mode) + 1) % len(REPEAT_MODES)]
+        self.settings.set_string('repeat-mode', next_mode)
+
+    def update_repeat_button(self) -> None:
+        icon_name, tooltip = _REPEAT_BUTTON[self.settings.get_string('repeat-mode')]
+        self.repeat_button.set_icon_name(icon_name)
+        self.repeat_button.set_tooltip_text(tooltip)
+
+    def on_play_order_changed(self, settings: Gio.Settings, key: str) -> None:
+        """Apply a new shuffle or repeat setting to the play queue."""
+        self.play_queue.set_shuffle(settings.get_boolean('shuffle'))
+        self.play_queue.set_repeat(settings.get_string('repeat-mode'))
+        self.update_repeat_button()
+        if self.mpris is not None:
+            from .mpris import PLAYER_INTERFACE
+            self.mpris.invalidate(PLAYER_INTERFACE, 'Shuffle', 'LoopStatus', 'CanGoNext', 'CanGoPrevious')
+        if self.current_song_index >= 0:
+            tracing.idle_add(self.preroll_neighbours, priority=GLib.PRIORITY_LOW)
+
+    def queue_selected_songs(self) -> None:
+        """Play the selected songs after the current one, before the rest."""
+        track_ids = self.get_selected_ids()
+        if not track_ids:
+            return
+        self.play_queue.play_next(track_ids)
+        self.show_toast(f"Playing {len(track_ids)} song{'s' if len(track_ids) != 1 else ''} next")
         if self.current_song_index >= 0:
-            next_index = self.current_song_index + 1
-            row = self.songs_list_box.get_row_at_index(next_index)
-            if row:
-                self.current_song_index = next_index
-                self.on_song_activated(self.songs_list_box, row)
+            tracing.idle_add(self.preroll_neighbours, priority=GLib.PRIORITY_LOW)
+
+    def play_next_track(self, auto: bool = False) -> None:
+        """Play the track the play queue has next; auto when the last one ended."""
+        track_id = self.play_queue.advance(auto)
+        if track_id >= 0:
+            self.play_track_at(self.track_store.position_of(track_id))
 
     def play_previous_track(self) -> None:
-        """Play the previous track in the playlist."""
-        if self.current_song_index > 0:
-            prev_index = self.current_song_index - 1
-            row = self.songs_list_box.get_row_at_index(prev_index)
-            if row:
-                self.current_song_index = prev_index
-                self.on_song_activated(self.songs_list_box, row)
-
-    def on_song_activated(self, list_box: Gtk.ListBox, row: SongRow) -> None:
+        """Go back to the previous track in the playlist, or in the shuffle history."""
+        track_id = self.play_queue.go_back()
+        if track_id >= 0:
+            self.play_track_at(self.track_store.position_of(track_id))
+
+    def peek_next_track(self):
+        """The (track id, path, duration) to play when the current track ends, or None.
+
+        Called from a GStreamer streaming thread, so this only reads state.
+        """
+        track_id = self.play_queue.peek_next()
+        if track_id < 0 or not self.track_store.contains(track_id):
+            return None
+        duration = int(self.track_store.duration(track_id) * SECOND)
+        return track_id, self.track_store.file_path(track_id), duration
+
+    def on_gapless_track_started(self, track_id: int) -> None:
+        """The player moved on to a queued track without stopping."""
+        position = self.track_store.position_of(track_id)
+        if position < 0:
+            return
+        self.current_song_index = position
+        self.play_queue.start(track_id)
+        self.show_now_playing(track_id)
+        self.save_session_state()
+        tracing.idle_add(self.preroll_neighbours, priority=GLib.PRIORITY_LOW)
+
+    def preroll_neighbours(self) -> bool:
+        """Have the next and previous songs ready for instant skipping (called from idle)."""
+        paths = []
+        if self.current_song_index >= 0:
+            for track_id in (self.play_queue.upcoming(), self.play_queue.previous()):
+                if track_id >= 0 and track_id != self.play_queue.current:
+                    paths.append(self.track_store.file_path(track_id))
+        self.player.preroll(paths)
+        return False
+
+    def on_song_activated(self, list_view: Gtk.ListView, view_position: int) -> None:
         """Handle song selection."""
-        self.current_song_index = row.get_index()
-        title_label = row.get_child().get_first_child()
-        artist_label = row.get_child().get_last_child()
-        self.song_title_label.set_label(title_label.get_label())
-        self.artist_name_label.set_label(artist_label.get_label())
-        self.player.play(row.file_path)
+        position = self.get_store_position(view_position)
+        if position >= 0:
+            self.play_track_at(position)
+
+    def play_track_at(self, position: int, start_position: int = 0) -> None:
+        """Play the song at a playlist position, optionally from an offset (ns)."""
+        if not 0 <= position < len(self.track_store):
+            return
+        track_id = self.track_store.id_at(position)
+        self.current_song_index = position
+        self.play_queue.start(track_id)
+        self.resume_position = 0
+        self.show_now_playing(track_id)
+        self.player.play(self.track_store.file_path(track_id), start_position,
+                         int(self.track_store.duration(track_id) * SECOND))
+        self.save_session_state()
+        tracing.idle_add(self.preroll_neighbours, priority=GLib.PRIORITY_LOW)
+
+    def playlist_is_sorted(self) -> bool:
+        return (self.settings.get_string('playlist-sort') != SORT_NONE
+                or self.settings.get_boolean('group-by-album'))
+
+    def schedule_sort(self) -> None:
+        """Re-sort shortly after songs were added, if a sort order is set."""
+        if self.sort_timeout_id or not self.playlist_is_sorted():
+            return
+        self.sort_timeout_id = tracing.timeout_add(self.SORT_DEBOUNCE_MS, self.on_sort_timeout)
+
+    def on_sort_timeout(self) -> bool:
+        self.sort_timeout_id = 0
+        self.sort_playlist()
+        return False
+
+    def update_album_headers(self) -> None:
+        group = self.settings.get_boolean('group-by-album')
+        self.playlist_model.group_by_album = group
+        self.songs_list_view.set_header_factory(self.album_header_factory if group else None)
+
+    @tracing.traced(category='playlist')
+    def sort_playlist(self) -> None:
+        """Put the playlist in the chosen order, keeping the current song."""
+        if self.sort_timeout_id:
+            GLib.source_remove(self.sort_timeout_id)
+            self.sort_timeout_id = 0
+        self.update_album_headers()
+        if not len(self.track_store):
+            return
+
+        current_id = -1
+        if self.current_song_index >= 0:
+            current_id = self.track_store.id_at(self.current_song_index)
+        track_ids = sorted_track_ids(self.track_store, self.settings.get_string('playlist-sort'),
+                                     self.settings.get_boolean('group-by-album'), self.collation_keys)
+        self.playlist_model.reorder(track_ids)
+        self.play_queue.reordered()
+
+        if current_id >= 0:
+            self.current_song_index = self.track_store.position_of(current_id)
+            self.save_session_state()
+            tracing.idle_add(self.preroll_neighbours, priority=GLib.PRIORITY_LOW)
+        self.schedule_session_save()
+
+    def update_playlist_summary(self, *args) -> None:
+        """Show the song count and total time under the playlist title."""
+        count = len(self.track_store)
+        if count == 0:
+            self.playlist_title.set_subtitle("")
+            return
+        summary = f"{count} song" if count == 1 else f"{count} songs"
+        total = format_duration(self.track_store.total_duration)
+        self.playlist_title.set_subtitle(f"{summary} · {total}" if total else summary)
+
+    def show_now_playing(self, track_id: int) -> None:
+        """Show the title, artist and album art of the current song."""
+        self.song_title_label.set_label(self.track_store.title(track_id))
+        self.artist_name_label.set_label(self.track_store.artist(track_id))
+        self.update_album_art()
+        self.update_waveform()
+
+    def update_album_art(self, *args) -> None:
+        """Ask for the current song's album art; it is set once loaded."""
+        show = self.settings.get_boolean('show-album-art')
+        self.album_picture.set_visible(show)
+        if not show or self.current_song_index < 0:
+            self.album_picture.set_paintable(None)
+            return
+        track_id = self.track_store.id_at(self.current_song_index)
+        size = self.album_picture.get_width_request() * self.get_scale_factor()
+        self.album_art.request(self.track_store.file_path(track_id), size, self.on_album_art_loaded)
+
+    def on_album_art_loaded(self, file_path: str, texture) -> None:
+        """Show loaded album art, unless the song changed in the meantime."""
+        if self.current_song_index < 0:
+            return
+        track_id = self.track_store.id_at(self.current_song_index)
+        if self.track_store.file_path(track_id) == file_path:
+            self.album_picture.set_paintable(texture)
+
+    def update_waveform(self, *args) -> None:
+        """Ask for the current song's waveform; it is shown once loaded."""
+        self.waveform = None
+        self.waveform_area.set_visible(False)
+        if not self.settings.get_boolean('show-waveform') or self.current_song_index < 0:
+            self.waveform_loader.cancel()
+            return
+        track_id = self.track_store.id_at(self.current_song_index)
+        self.waveform_loader.request(self.track_store.file_path(track_id))
+
+    def on_waveform_loaded(self, file_path: str, waveform) -> None:
+        self.waveform = waveform
+        self.waveform_area.set_visible(len(waveform) > 0)
+        self.waveform_area.queue_draw()
+
+    def on_draw_waveform(self, area: Gtk.DrawingArea, cr, width: int, height: int) -> None:
+        if self.waveform is None:
+            return
+        adjustment = self.song_progress_scale.get_adjustment()
+        span = adjustment.get_upper() - adjustment.get_lower()
+        fraction = (adjustment.get_value() - adjustment.get_lower()) / span if span > 0 else 0
+        played = area.get_color()
+        remaining = area.get_color()
+        remaining.alpha *= 0.3
+        draw_waveform(cr, width, height, self.waveform, fraction, played, remaining)
 
     def on_mute_clicked(self, button: Gtk.Button) -> None:
         """Handle mute button clicks."""
-        self.player.on_mute_clicked(button)
+        self.player.toggle_mute()
 
-    def on_volume_changed(self, scale: Gtk.Scale) -> None:
+    def on_volume_scale_changed(self, scale: Gtk.Scale) -> None:
         """Handle volume slider changes."""
-        self.player.on_volume_changed(scale)
+        self.player.set_volume(scale.get_value())
+
+    def on_seek(self, scale: Gtk.Scale, scroll_type: Gtk.ScrollType, value: float) -> bool:
+        """Seek when the progress slider is moved."""
+        if self._player is None or not self._player.is_playing:
+            return False
+        position = int(value * SECOND)
+        if not self._player.seek(position):
+            return False
+        # Returning True stops GTK from moving the slider itself
+        scale.set_value(value)
+        self.time_position_label.set_label(self._player.format_time(max(position, 0)))
+        return True
+
+    # Player events (see PlayerObserver)
+
+    def on_playback_state_changed(self, state: str) -> None:
+        playing = state == 'playing'
+        self.play_button.set_icon_name(
+            "media-playback-pause-symbolic" if playing else "media-playback-start-symbolic"
+        )
+        if playing:
+            self.displayed_second = -1
+            self.start_position_updates()
+            return
+        self.stop_position_updates()
+        if state == 'stopped':
+            self.displayed_second = -1
+            self.song_progress_scale.set_value(0)
+            self.time_position_label.set_label("00:00")
+
+    def on_track_changed(self, file_path: str) -> None:
+        self.time_position_label.set_label("00:00")
+        self.time_duration_label.set_label("00:00")
+        self.song_progress_scale.set_value(0)
+
+    def on_duration_changed(self, duration: int) -> None:
+        self.song_progress_scale.set_range(0, duration / SECOND)
+        self.time_duration_label.set_label(self.player.format_time(duration))
+
+    def on_volume_changed(self, volume: float, muted: bool) -> None:
+        if muted or volume == 0:
+            icon_name = "audio-volume-muted-symbolic"
+        elif volume < 0.3:
+            icon_name = "audio-volume-low-symbolic"
+        elif volume < 0.7:
+            icon_name = "audio-volume-medium-symbolic"
+        else:
+            icon_name = "audio-volume-high-symbolic"
+        self.mute_button.set_icon_name(icon_name)
+
+        # The slider drops to zero while muted; moving it unmutes
+        with self.volume_scale.handler_block(self.volume_handler):
+            self.volume_scale.set_value(0 if muted else volume)
+
+    def on_end_of_stream(self) -> None:
+        self.play_next_track(auto=True)
+
+    def on_error(self, message: str) -> None:
+        self.show_toast(f"Playback error: {message}")
+
+    # MPRIS requests
+
+    def mpris_metadata(self) -> dict:
+        if self.current_song_index < 0:
+            return {}
+        from .mpris import track_object_path
+        track_id = self.track_store.id_at(self.current_song_index)
+        metadata = {
+            'mpris:trackid': track_object_path(track_id),
+            'xesam:title': self.track_store.title(track_id),
+            'xesam:artist': [self.track_store.artist(track_id)],
+            'xesam:album': self.track_store.album(track_id),
+            'xesam:url': GLib.filename_to_uri(self.track_store.file_path(track_id)),
+        }
+        duration = self.track_store.duration(track_id)
+        if duration > 0:
+            metadata['mpris:length'] = int(duration * 1_000_000)
+        return metadata
+
+    def mpris_play(self) -> None:
+        self.on_play_clicked(self.play_button)
+
+    def mpris_next(self) -> None:
+        self.play_next_track()
+
+    def mpris_previous(self) -> None:
+        self.play_previous_track()
+
+    def mpris_can_go_next(self) -> bool:
+        return self.play_queue.upcoming() >= 0
+
+    def mpris_can_go_previous(self) -> bool:
+        return self.play_queue.previous() >= 0
+
+    def mpris_shuffle(self) -> bool:
+        return self.settings.get_boolean('shuffle')
+
+    def mpris_set_shuffle(self, shuffle: bool) -> None:
+        self.settings.set_boolean('shuffle', shuffle)
+
+    def mpris_loop_status(self) -> str:
+        return _LOOP_STATUS[self.settings.get_string('repeat-mode')]
+
+    def mpris_set_loop_status(self, status: str) -> None:
+        mode = next(mode for mode, loop_status in _LOOP_STATUS.items() if loop_status == status)
+        self.settings.set_string('repeat-mode', mode)
+
+    def mpris_open_uri(self, uri: str) -> None:
+        """Play a file, adding it to the playlist first if it is not there."""
+        path = Gio.File.new_for_uri(uri).get_path()
+        if not path:
+            return
+        track_ids = self.track_store.find_path(path)
+        if track_ids:
+            self.play_track_at(self.track_store.position_of(track_ids[0]))
+        else:
+            self.open_uri_path = path
+            self.import_files([path])
+
+    def mpris_raise(self) -> None:
+        self.present()
+
+    def mpris_quit(self) -> None:
+        self.close()
+
+    def on_surface_state_changed(self, surface, pspec) -> None:
+        if surface.get_state() & Gdk.ToplevelState.MINIMIZED:
+            self.stop_position_updates()
+        else:
+            self.start_position_updates()
+
+    def window_is_shown(self) -> bool:
+        if not self.get_mapped():
+            return False
+        surface = self.get_surface()
+        return surface is None or not surface.get_state() & Gdk.ToplevelState.MINIMIZED
+
+    def start_position_updates(self) -> None:
+        """Refresh the position display while playing and visible."""
+        self.stop_position_updates()
+        if self._player is not None and self._player.is_playing and self.window_is_shown():
+            self.schedule_position_update(0)
+
+    def stop_position_updates(self) -> None:
+        if self.position_timeout_id:
+            GLib.source_remove(self.position_timeout_id)
+            self.position_timeout_id = 0
+        if self.position_tick_id:
+            self.song_progress_scale.remove_tick_callback(self.position_tick_id)
+            self.position_tick_id = 0
+
+    def schedule_position_update(self, delay_ms: float) -> None:
+        """Wake up after delay_ms, then update on the scale's next frame.
+
+        Rather than polling at a fixed rate, the delay is how long it takes
+        for something visible to change, and the update itself is tied to
+        the frame clock so it lands together with the frame that shows it.
+        """
+        self.position_timeout_id = tracing.timeout_add(int(delay_ms), self.on_position_timeout)
+
+    def on_position_timeout(self) -> bool:
+        self.position_timeout_id = 0
+        self.position_tick_id = self.song_progress_scale.add_tick_callback(self.on_position_tick)
+        return False
+
+    def on_position_tick(self, widget: Gtk.Widget, frame_clock) -> bool:
+        self.position_tick_id = 0
+        delay_ms = self.update_position()
+        if self._player.is_playing and delay_ms is not None:
+            self.schedule_position_update(delay_ms)
+        return GLib.SOURCE_REMOVE
+
+    def update_position(self) -> float:
+        """Refresh label and slider; return ms until either visibly changes."""
+        # Where a coalesced seek is going, so a drag does not snap back
+        position = self._player.get_position()
+
+        # The label only changes when the displayed second does
+        second = position // SECOND
+        if second != self.displayed_second:
+            self.displayed_second = second
+            self.time_position_label.set_label(self._player.format_time(position))
+
+        until_next_second = (SECOND - position % SECOND) / MSECOND
+        delay_ms = until_next_second
+        duration = self._player.duration
+        if duration > 0:
+            self.song_progress_scale.set_value(position / SECOND)
+
+            # How long the slider takes to move by one pixel
+            width = max(self.song_progress_scale.get_width(), 1)
+            per_pixel_ms = duration / MSECOND / width
+            delay_ms = min(delay_ms, per_pixel_ms)
+
+        return max(self.MIN_POSITION_INTERVAL, min(delay_ms, self.MAX_POSITION_INTERVAL))
 
     def on_sidebar_button_toggled(self, button: Gtk.ToggleButton) -> None:
         """Handle sidebar toggle button clicks."""
@@ -491,17 +1372,27 @@ class OscillateWindow(Adw.ApplicationWindow):
         dialog.present()
 
     def delete_selected_song(self, *args: Any) -> None:
-        """Delete the selected song from the playlist."""
-        selected_row = self.songs_list_box.get_selected_row()
-        if not selected_row or not isinstance(selected_row, SongRow):
+        """Delete the selected songs from the playlist, after confirmation."""
+        selected_ids = self.get_selected_ids()
+        if not selected_ids:
             return
 
-        # Clean up any active popover first
-        if hasattr(selected_row, 'cleanup'):
-            selected_row.cleanup()
+        if len(selected_ids) > 1:
+            dialog = Adw.MessageDialog(
+                transient_for=self,
+                heading=f"Delete {len(selected_ids)} selected songs?",
+                body="This action cannot be undone."
+            )
+            dialog.add_response("cancel", "Cancel")
+            dialog.add_response("delete", "Delete")
+            dialog.set_response_appearance("delete", Adw.ResponseAppearance.DESTRUCTIVE)
+            dialog.connect("response", lambda d, r: self.perform_delete(selected_ids) if r == "delete" else None)
+            dialog.present()
+            return
 
-        title = selected_row.get_child().get_first_child().get_label()
-        artist = selected_row.get_child().get_last_child().get_label()
+        selected_id = selected_ids[0]
+        title = self.track_store.title(selected_id)
+        artist = self.track_store.artist(selected_id)
 
         dialog = Adw.MessageDialog.new(
             self,
@@ -521,21 +1412,11 @@ class OscillateWindow(Adw.ApplicationWindow):
         def on_response(dialog: Adw.MessageDialog, response: str) -> None:
             try:
                 if response == "delete":
-                    row_index = selected_row.get_index()
-
-                    # If this is the currently playing song, stop playback
-                    if self.current_song_index == row_index:
-                        self.player.stop()
-                        self.current_song_index = -1
-                        self.song_title_label.set_label("No song playing")
-                        self.artist_name_label.set_label("Select a song to play")
-
-                    # Remove the row
-                    self.songs_list_box.remove(selected_row)
+                    row_index = self.track_store.position_of(selected_id)
+                    if row_index < 0:
+                        return
 
-                    # Update current_song_index if needed
-                    if self.current_song_index > row_index:
-                        self.current_song_index -= 1
+                    self.remove_positions([row_index])
 
                     # Show deletion toast
                     self.show_toast(f"Removed: {title}")
@@ -546,28 +1427,20 @@ class OscillateWindow(Adw.ApplicationWindow):
         dialog.connect("response", on_response)
         dialog.present()
 
-    def on_popover_closed(self, popover: Gtk.PopoverMenu, row: SongRow) -> None:
-        """Handle cleanup when a popover is closed."""
-        if row.active_popover == popover:
-            row.active_popover = None
-            popover.unparent()
-
     def on_select_all(self, button):
         self.selection_mode = not self.selection_mode
         icon = 'checkbox-checked-symbolic' if self.selection_mode else 'checkbox-empty-symbolic'
         self.select_all_button.set_icon_name(icon)
 
-        row = self.songs_list_box.get_first_child()
-        while row:
-            checkbox = row.get_child().get_first_child()
-            checkbox.set_visible(self.selection_mode)
-            checkbox.set_active(self.selection_mode)
-            row = row.get_next_sibling()
+        if self.selection_mode:
+            self.selection_model.select_all()
+        else:
+            self.selection_model.unselect_all()
 
     def toggle_selection_ui(self, enable):
         animation = Adw.TimedAnimation(
-            widget=self.songs_list_box,
-            value_from=self.songs_list_box.get_margin_start(),
+            widget=self.songs_list_view,
+            value_from=self.songs_list_view.get_margin_start(),
             value_to=12 if enable else 0,
             duration=200,
             easing=Adw.Easing.LINEAR